@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Array-backed (struct-of-arrays) search tree.
+
+State nodes and state-action nodes live in one growable set of NumPy arrays
+and are referred to by integer index. The children of a node are stored as a
+contiguous block (first_child, child_count), so the statistics of all the
+children of a node are array slices that tree policies can score at once.
+Game states are ids into a TicTacToeTable.
+"""
+
+import numpy as np
+import pandas as pd
+
+from table_engine import ONGOING, NO_STATE
+from tictactoe import MASK_CELLS
+from rng import search_rng
+
+STATE_NODE = 0
+ACTION_NODE = 1
+
+NO_NODE = -1
+
+
+class TreeArena():
+
+    def __init__(self, capacity=1024, max_nodes=None):
+        """
+        Parameters
+        ----------
+        capacity  : number of nodes allocated up front, doubled when full
+        max_nodes : hard limit on the number of nodes, None for no limit
+        """
+        self.max_nodes = max_nodes
+        if max_nodes is not None:
+            capacity = min(capacity, max_nodes)
+        self.size = 0
+
+        self.n = np.zeros(capacity, dtype=np.int64)
+        self.mean = np.zeros(capacity)
+        self.m2 = np.zeros(capacity)
+        self.parent = np.full(capacity, NO_NODE, dtype=np.int32)
+        self.first_child = np.full(capacity, NO_NODE, dtype=np.int32)
+        self.child_count = np.zeros(capacity, dtype=np.int16)
+        self.state_id = np.full(capacity, NO_STATE, dtype=np.int32)
+        self.move = np.full(capacity, -1, dtype=np.int8)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+
+    array_names = ('n', 'mean', 'm2', 'parent', 'first_child', 'child_count',
+                   'state_id', 'move', 'kind')
+    fill_values = {'parent': NO_NODE, 'first_child': NO_NODE, 'state_id': NO_STATE, 'move': -1}
+
+    @property
+    def capacity(self):
+        return len(self.n)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.array_names)
+
+    def has_room(self, count):
+        return self.max_nodes is None or self.size + count <= self.max_nodes
+
+    def _grow(self, min_capacity):
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity *= 2
+        if self.max_nodes is not None:
+            capacity = min(capacity, self.max_nodes)
+
+        for name in self.array_names:
+            old = getattr(self, name)
+            new = np.full(capacity, self.fill_values.get(name, 0), dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add_nodes(self, kind, parent, state_ids, moves):
+        """
+        Appends a contiguous block of nodes and returns the index of the first
+        one, or NO_NODE if the arena is full.
+        """
+        count = len(state_ids)
+        if not self.has_room(count):
+            return NO_NODE
+        if self.size + count > self.capacity:
+            self._grow(self.size + count)
+
+        first = self.size
+        block = slice(first, first + count)
+        self.kind[block] = kind
+        self.parent[block] = parent
+        self.state_id[block] = state_ids
+        self.move[block] = moves
+        self.size += count
+
+        if parent != NO_NODE:
+            self.first_child[parent] = first
+            self.child_count[parent] = count
+        return first
+
+    def children(self, node):
+        first = self.first_child[node]
+        return slice(first, first + self.child_count[node])
+
+    def stddev(self, nodes):
+        """ sample standard deviation of the nodes in `nodes` (index or slice) """
+        n = self.n[nodes]
+        return np.sqrt(np.maximum(self.m2[nodes], 0) / np.maximum(n - 1, 1)) * (n > 1)
+
+
+class ArenaActionView():
+    """
+    Read-only view of a state-action node with the attribute names of
+    StateActionNode, so results can be inspected the same way.
+    """
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    @property
+    def n(self):
+        return int(self.arena.n[self.index])
+
+    @property
+    def q_value_mean(self):
+        return float(self.arena.mean[self.index])
+
+    @property
+    def q_value_stddev(self):
+        return float(self.arena.stddev(self.index))
+
+    @property
+    def move_id(self):
+        return int(self.arena.move[self.index])
+
+
+class ArenaMonteCarloTreeSearch():
+    def __init__(self, table, root_state_id, tree_policy, capacity=1024, max_nodes=None, seed=None):
+        """
+        Parameters
+        ----------
+        table         : TicTacToeTable the states are taken from
+        root_state_id : table id of the root state x0
+        tree_policy   : TreePolicy implementing select_from_stats()
+        capacity      : initial number of nodes in the arena
+        max_nodes     : bound on the number of nodes, once it is reached the
+                        tree stops growing and leaves are rolled out as they are
+        seed          : seed of the search's random generator, see 
+                        MonteCarloTreeSearch
+        """
+        self.table = table
+        self.tree_policy = tree_policy
+        self.arena = TreeArena(capacity, max_nodes)
+        self.rng = search_rng(seed)
+        self.root = self.arena.add_nodes(STATE_NODE, NO_NODE, [root_state_id], [-1])
+        # rewards are scored for the player to move at the root
+        self.player = table.players.item(root_state_id)
+
+    def search(self, N):
+        """
+        Parameters
+        ----------
+        N : simulation budget (roll-out number)
+
+        Output
+        ----------
+        DataFrame with the Q value and visit count of every root action
+        """
+        for n in range(N):
+            node, leaf_state_id = self.tree_walk()
+            reward = self.rollout(leaf_state_id)
+            self.backpropagate(node, reward)
+
+        root_actions = self.arena.children(self.root)
+        df = pd.DataFrame({'Q': self.arena.mean[root_actions], 'N': self.arena.n[root_actions]},
+                          index=self.arena.move[root_actions].astype(int))
+
+        return df.sort_index()
+
+    def tree_walk(self):
+        """
+        Sample a root-to-leaf path
+        ----------
+        Output: (node, state id) of the leaf to roll out from. The node is the
+                leaf state node, or the last stored action node when the arena
+                is full and the leaf could not be stored.
+        """
+        arena = self.arena
+        results = self.table.results
+        current_node = self.root
+        while results[arena.state_id[current_node]] == ONGOING:
+            if arena.child_count[current_node] == 0 and not self.expand_state(current_node):
+                break
+
+            action_node = self.expandable_action(current_node)
+            if action_node != NO_NODE:
+                return self.sample_next_state(action_node)
+
+            action_node = self.tree_policy_selection(current_node)
+            current_node, leaf_state_id = self.sample_next_state(action_node)
+            if current_node == action_node:
+                return current_node, leaf_state_id
+
+        return current_node, arena.state_id[current_node]
+
+    def expand_state(self, node):
+        state_id = self.arena.state_id[node]
+        moves = MASK_CELLS[self.table.legal_masks.item(state_id)]
+        next_ids = self.table.successors[state_id, list(moves)]
+        return self.arena.add_nodes(ACTION_NODE, node, next_ids, moves) != NO_NODE
+
+    def expandable_action(self, node):
+        children = self.arena.children(node)
+        ns = self.arena.n[children]
+        untried = np.flatnonzero(ns == 0)
+        if len(untried) > 0:
+            return children.start + untried[self.rng.randint(len(untried))]
+
+        ns_min_arg = np.argmin(ns)
+        if ns[ns_min_arg] > 1:
+            return NO_NODE
+        return children.start + ns_min_arg
+
+    def sample_next_state(self, action_node):
+        """
+        Samples the opponent reply of a state-action node. Returns the next
+        state node and its state id, or the action node itself together with
+        a sampled state id if the arena has no room to store the replies.
+        """
+        arena = self.arena
+        if arena.child_count[action_node] == 0:
+            state_id = arena.state_id[action_node]
+            moves = MASK_CELLS[self.table.legal_masks.item(state_id)]
+            if moves:
+                next_ids = self.table.successors[state_id, list(moves)]
+            else:
+                # the action ends the game, keep a single terminal state node
+                next_ids = [state_id]
+                moves = (-1,)
+            if arena.add_nodes(STATE_NODE, action_node, next_ids, moves) == NO_NODE:
+                return action_node, next_ids[self.rng.randint(len(next_ids))]
+
+        children = arena.children(action_node)
+        next_node = children.start + self.rng.randint(children.stop - children.start)
+        return next_node, arena.state_id[next_node]
+
+    def tree_policy_selection(self, node):
+        arena = self.arena
+        children = arena.children(node)
+        index = self.tree_policy.select_from_stats(
+            arena.n[node], arena.n[children], arena.mean[children], arena.stddev(children), self.rng)
+        return children.start + index
+
+    def rollout(self, leaf_state_id):
+        table = self.table
+        player = self.player
+        rng = self.rng
+        state_id = leaf_state_id
+        while table.results.item(state_id) == ONGOING:
+            possible_moves = MASK_CELLS[table.legal_masks.item(state_id)]
+            state_id = table.successors.item(state_id, possible_moves[rng.randint(len(possible_moves))])
+
+        result = table.results.item(state_id)
+        if result == player:
+            return 1
+        elif result == 0:
+            return 0.5
+        else:
+            return 0
+
+    def backpropagate(self, node, value):
+        arena = self.arena
+        while node != NO_NODE:
+            arena.n[node] += 1
+            count = arena.n[node]
+            delta = value - arena.mean[node]
+            arena.mean[node] += delta / count
+            if arena.kind[node] == ACTION_NODE:
+                arena.m2[node] += delta * (value - arena.mean[node])
+            value = arena.mean[node]
+            node = arena.parent[node]
+
+    def root_actions(self):
+        children = self.arena.children(self.root)
+        return [ArenaActionView(self.arena, i) for i in range(children.start, children.stop)]
+
+    def best_action(self):
+        children = self.arena.children(self.root)
+        return ArenaActionView(self.arena, children.start + int(np.argmax(self.arena.mean[children])))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asyncio front end of MonteCarloTreeSearch: the search runs on the event
+loop in slices of a few iterations and yields to the loop between slices,
+so other coroutines keep running while it searches.
+
+    search = AsyncSearch(mcts, slice_iterations=32)
+    async for root in search.statistics(time_budget=1.0):
+        print(search.iterations, root.Q.idxmax())
+
+The search stops at its iteration limit, its deadline (which can be moved
+with set_deadline() while it runs), a target APCS, or when cancel() is
+called. Cancelling the task running it is also safe: the tree is only
+left between slices, where it is always consistent.
+"""
+
+import time
+import asyncio
+
+
+class AsyncSearch():
+
+    def __init__(self, mcts, slice_iterations=32, rollouts_per_leaf=1):
+        """
+        Parameters
+        ----------
+        mcts : MonteCarloTreeSearch to run, it must not be searched elsewhere
+               at the same time
+        slice_iterations : iterations run between two yields to the event
+                           loop, i.e. the latency added to other coroutines
+        rollouts_per_leaf : see MonteCarloTreeSearch.search()
+        """
+        self.mcts = mcts
+        self.slice_iterations = slice_iterations
+        self.rollouts_per_leaf = rollouts_per_leaf
+
+        self.deadline = None
+        self.iterations = 0
+        self.stop_reason = None
+        self._cancelled = False
+
+    def set_deadline(self, deadline=None, time_budget=None):
+        """
+        Sets the time.monotonic() value at which the search stops, or
+        `time_budget` seconds from now; deadline=None with no budget removes
+        it. Takes effect at the next slice, also while the search runs.
+        """
+        if time_budget is not None:
+            deadline = time.monotonic() + time_budget
+        self.deadline = deadline
+
+    def cancel(self):
+        """ Stops the search at the end of the current slice """
+        self._cancelled = True
+
+    async def statistics(self, max_iterations=None, deadline=None, time_budget=None,
+                         target_apcs=None):
+        """
+        Runs the search and yields the root statistics (DataFrame of
+        MonteCarloTreeSearch.root_statistics()) after every slice, the last
+        one once the search has stopped.
+
+        Parameters
+        ----------
+        max_iterations : maximum number of iterations of this search
+        deadline : absolute time.monotonic() value at which the search stops
+        time_budget : seconds available for this search
+        target_apcs : stop once the APCS of the best root action reaches it
+
+        The deadline of a previous search is not kept, only set_deadline()
+        calls made while this search runs move this one.
+        """
+        self.set_deadline(deadline, time_budget)
+        self.iterations = 0
+        self.stop_reason = None
+        self._cancelled = False
+
+        mcts = self.mcts
+        while self.stop_reason is None:
+            n_iterations = self.slice_iterations
+            if max_iterations is not None:
+                n_iterations = min(n_iterations, max_iterations - self.iterations)
+            for _ in range(n_iterations):
+                mcts.iterate(self.rollouts_per_leaf)
+            self.iterations += n_iterations
+
+            if self._cancelled:
+                self.stop_reason = 'cancelled'
+            elif max_iterations is not None and self.iterations >= max_iterations:
+                self.stop_reason = 'iterations'
+            elif self.deadline is not None and time.monotonic() >= self.deadline:
+                self.stop_reason = 'deadline'
+            elif target_apcs is not None and mcts.root_apcs() >= target_apcs:
+                self.stop_reason = 'apcs'
+
+            yield mcts.root_statistics()
+            # let the other coroutines run, and task cancellation reach us
+            await asyncio.sleep(0)
+
+    async def run(self, max_iterations=None, deadline=None, time_budget=None, target_apcs=None):
+        """
+        Runs the search to the end, see statistics(), and returns the final
+        root statistics. The APCS target may never be reached, so an 
+        iteration limit, a deadline or a time budget is required.
+        """
+        if max_iterations is None and deadline is None and time_budget is None:
+            raise ValueError("AsyncSearch.run needs an iteration limit, a deadline or a time budget")
+        root = None
+        async for root in self.statistics(max_iterations, deadline, time_budget, target_apcs):
+            pass
+        return root
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized random playouts for the 3x3 tic-tac-toe board.
+
+A uniformly random playout is a uniformly random ordering of the empty cells,
+so M games are played at once by sorting random keys per game and detecting
+the first completed line on the cumulative stone masks of each player.
+"""
+
+import numpy as np
+
+from tictactoe import BITBOARD_CELLS, BITBOARD_FULL, WINNING_MASK, state_bitboards
+
+_WINNING_MASK = np.array(WINNING_MASK, dtype=bool)
+_POPCOUNT = np.array([bin(m).count('1') for m in range(BITBOARD_FULL + 1)])
+_CELL_BITS = 1 << np.arange(BITBOARD_CELLS)
+_PLY_SIGN = np.array([1 if t % 2 == 0 else -1 for t in range(BITBOARD_CELLS)])
+
+
+def supports_batch_rollout(env_state):
+    """ True if `env_state` is a 3x3 board that the batch engine can play. """
+    return getattr(env_state, 'board_size', None) == 3
+
+
+def batch_rollout(o_masks, x_masks, players, n_rollouts=1, rng=np.random):
+    """
+    Plays `n_rollouts` uniformly random games from each of S positions.
+
+    Parameters
+    ----------
+    o_masks    : array-like (S,) bitmask of O stones for each position
+    x_masks    : array-like (S,) bitmask of X stones for each position
+    players    : array-like (S,) side to move (1 for O, -1 for X)
+    n_rollouts : int
+               number of games played from each position
+    rng        : np.random.Generator, rng.BufferedRandom or the np.random module
+
+    Returns
+    -------
+    results : np.array() (S, n_rollouts)
+            game results, 1 if O wins, -1 if X wins, 0 for a draw
+    """
+    o_masks = np.repeat(np.asarray(o_masks, dtype=np.int64), n_rollouts)
+    x_masks = np.repeat(np.asarray(x_masks, dtype=np.int64), n_rollouts)
+    players = np.repeat(np.asarray(players, dtype=np.int64), n_rollouts)
+    n_games = len(players)
+
+    occupied = o_masks | x_masks
+    n_empty = BITBOARD_CELLS - _POPCOUNT[occupied]
+
+    # random permutation of the empty cells, occupied cells sorted last
+    keys = rng.random((n_games, BITBOARD_CELLS))
+    keys[(occupied[:, None] & _CELL_BITS) != 0] = 2.0
+    bits = _CELL_BITS[np.argsort(keys, axis=1)]
+
+    valid_ply = np.arange(BITBOARD_CELLS) < n_empty[:, None]
+    movers = players[:, None] * _PLY_SIGN
+    o_plies = np.where(valid_ply & (movers == 1), bits, 0)
+    x_plies = np.where(valid_ply & (movers == -1), bits, 0)
+    o_wins = _WINNING_MASK[o_masks[:, None] | np.bitwise_or.accumulate(o_plies, axis=1)]
+    x_wins = _WINNING_MASK[x_masks[:, None] | np.bitwise_or.accumulate(x_plies, axis=1)]
+
+    # ply of the first win for each player, BITBOARD_CELLS if it never happens
+    o_first = np.where(o_wins.any(axis=1), o_wins.argmax(axis=1), BITBOARD_CELLS)
+    x_first = np.where(x_wins.any(axis=1), x_wins.argmax(axis=1), BITBOARD_CELLS)
+
+    results = np.zeros(n_games, dtype=np.int8)
+    results[o_first < x_first] = 1
+    results[x_first < o_first] = -1
+
+    # positions that are already decided keep their result
+    results[_WINNING_MASK[x_masks]] = -1
+    results[_WINNING_MASK[o_masks]] = 1
+
+    return results.reshape(-1, n_rollouts)
+
+
+def batch_rollout_states(env_states, n_rollouts=1, rng=np.random):
+    """ batch_rollout() for a list of 3x3 game states. """
+    bitboards = [state_bitboards(env_state) for env_state in env_states]
+    players = [env_state.player for env_state in env_states]
+    return batch_rollout([b[0] for b in bitboards], [b[1] for b in bitboards],
+                         players, n_rollouts, rng)
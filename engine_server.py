@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Long-running Tic-Tac-Toe engine serving move requests as newline-delimited
+JSON, over stdin/stdout or a local TCP socket.
+
+Request, one JSON object per line:
+    {"id": 1, "board": [[0, 0, 0], [0, -1, 0], [0, 0, 0]], "player": 1,
+     "budget": 1000, "time": 0.5, "deadline": <unix time>,
+     "policy": "ocba", "symmetry": false, "seed": 0}
+The board holds 1 for O, -1 for X and 0 for empty cells (3x3 or flat).
+budget is a number of iterations, time a number of seconds; with neither
+budget, time nor deadline the server's default budget is used.
+
+Response, one JSON object per line, in completion order:
+    {"id": 1, "best_move": 4, "row": 1, "col": 1,
+     "root": [{"move": 0, "Q": 0.41, "N": 37}, ...],
+     "iterations": 1000, "elapsed": 0.08, "cache": "hit"}
+or {"id": 1, "error": "..."}.
+
+Requests are searched by a pool of worker processes. The search trees (and
+their transposition tables) of recently seen positions are kept in an LRU
+cache by each worker, and a request is sent to the worker holding its tree.
+A request for a cached position keeps searching that tree, and a request
+two plies below a cached position re-roots it with 
+MonteCarloTreeSearch.advance(). Trees are only shared by requests with the
+same policy, symmetry and seed: a seeded request is reproducible when it
+misses the cache, and later requests with that seed continue its tree.
+
+Usage:
+    python engine_server.py                  # stdin/stdout
+    python engine_server.py --port 5050      # TCP on 127.0.0.1
+"""
+
+import sys
+import json
+import time
+import numbers
+import argparse
+import threading
+import traceback
+import socketserver
+import multiprocessing
+import numpy as np
+
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+
+from tictactoe import TicTacToeBitboardState, TicTacToeMove
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from transposition import TranspositionTable
+from tree_policy import POLICIES
+
+
+class RequestError(ValueError):
+    """ Invalid request, the message is sent back to the client """
+
+
+def number_field(request, name, minimum=None, maximum=None, integer=False):
+    """ request[name] checked to be a number in [minimum, maximum], or None """
+    value = request.get(name)
+    if value is None:
+        return None
+    kind = numbers.Integral if integer else numbers.Real
+    if isinstance(value, bool) or not isinstance(value, kind):
+        raise RequestError("{0} must be {1}".format(name, "an integer" if integer else "a number"))
+    if minimum is not None and value < minimum:
+        raise RequestError("{0} must be at least {1}".format(name, minimum))
+    if maximum is not None and value > maximum:
+        raise RequestError("{0} must be at most {1}".format(name, maximum))
+    return value
+
+
+def search_fields(request):
+    """
+    Checks a request and returns the fields of its search, raises 
+    RequestError when it is invalid
+    """
+    if 'board' not in request:
+        raise RequestError("missing field 'board'")
+    try:
+        board = np.asarray(request['board'], dtype=float)
+    except (ValueError, TypeError):
+        board = None
+    if board is None or board.size != 9 or not np.isin(board, (-1, 0, 1)).all():
+        raise RequestError("board must have 9 cells holding 1, -1 or 0")
+    player = request.get('player', 1)
+    if isinstance(player, bool) or player not in (1, -1):
+        raise RequestError("player must be 1 (O) or -1 (X)")
+    env_state = TicTacToeBitboardState.from_board(board, player)
+    if env_state.is_game_over():
+        raise RequestError("game is over")
+    policy = request.get('policy', 'ocba')
+    if not isinstance(policy, str) or policy not in POLICIES:
+        raise RequestError("unknown policy, expected one of {0}".format(sorted(POLICIES)))
+
+    return {'id': request.get('id'), 'env_state': env_state, 'policy': policy,
+            'use_symmetry': bool(request.get('symmetry', False)),
+            'max_iterations': number_field(request, 'budget', minimum=1, integer=True),
+            'time_budget': number_field(request, 'time', minimum=0),
+            'deadline': number_field(request, 'deadline'),
+            'target_apcs': number_field(request, 'target_apcs', minimum=0, maximum=1),
+            'seed': number_field(request, 'seed', minimum=0, integer=True)}
+
+
+def cache_key(fields):
+    """ Trees are only shared by requests with the same policy, symmetry and seed """
+    return (fields['policy'], fields['use_symmetry'], fields['seed'], fields['env_state'].hash_key())
+
+
+def moves_between(parent_state, env_state):
+    """
+    (move, reply) leading from parent_state to env_state, or None when
+    env_state is not two plies below parent_state
+    """
+    if env_state.player != parent_state.player:
+        return None
+    if parent_state.o_mask & ~env_state.o_mask or parent_state.x_mask & ~env_state.x_mask:
+        return None
+    new_o = env_state.o_mask & ~parent_state.o_mask
+    new_x = env_state.x_mask & ~parent_state.x_mask
+    if bin(new_o).count('1') != 1 or bin(new_x).count('1') != 1:
+        return None
+
+    move_cell, reply_cell = (new_o, new_x) if parent_state.player == 1 else (new_x, new_o)
+    move_cell, reply_cell = move_cell.bit_length() - 1, reply_cell.bit_length() - 1
+    move = TicTacToeMove(move_cell // 3, move_cell % 3, parent_state.player)
+    if parent_state.move(move).is_game_over():
+        return None
+    reply = TicTacToeMove(reply_cell // 3, reply_cell % 3, -parent_state.player)
+    return move, reply
+
+
+class SearchCache():
+    """
+    Search trees of the positions a worker process has seen, least recently
+    used first. The worker serves one request at a time.
+    """
+
+    def __init__(self, cache_size=64, default_budget=1000, tt_max_shared=None):
+        self.cache_size = cache_size
+        self.default_budget = default_budget
+        self.tt_max_shared = tt_max_shared
+
+        # cache_key() -> MonteCarloTreeSearch
+        self.cache = OrderedDict()
+
+    def search(self, fields):
+        mcts, cache = self.checkout(fields)
+        deadline = fields['deadline']
+        if deadline is not None:
+            deadline = time.monotonic() + (deadline - time.time())
+        max_iterations = fields['max_iterations']
+        if max_iterations is None and deadline is None and fields['time_budget'] is None:
+            max_iterations = self.default_budget
+
+        start = time.perf_counter()
+        root = mcts.search_anytime(fields['time_budget'], deadline, max_iterations, fields['target_apcs'])
+        elapsed = time.perf_counter() - start
+
+        best_move = mcts.best_action().move_id
+        return {'id': fields['id'], 'best_move': best_move, 'row': best_move // 3, 'col': best_move % 3,
+                'root': [{'move': int(move), 'Q': float(row.Q), 'N': int(row.N)}
+                         for move, row in root.iterrows()],
+                'iterations': mcts.iterations, 'elapsed': elapsed, 'cache': cache}
+
+    def checkout(self, fields):
+        """
+        Cached search of a position, or a new one: re-rooted from the cached
+        tree two plies above it when there is one, fresh otherwise. The
+        entry becomes the most recently used.
+        """
+        key = cache_key(fields)
+        env_state = fields['env_state']
+        mcts = self.cache.get(key)
+        if mcts is not None:
+            self.cache.move_to_end(key)
+            return mcts, 'hit'
+
+        for parent_key, parent in self.cache.items():
+            if parent_key[:3] != key[:3]:
+                continue
+            moves = moves_between(parent.root_state.env_state, env_state)
+            if moves is not None:
+                parent.advance(*moves)
+                del self.cache[parent_key]
+                self.insert(key, parent)
+                return parent, 'advanced'
+
+        tt = TranspositionTable(self.tt_max_shared)
+        mcts = MonteCarloTreeSearch(StateNode(env_state, use_symmetry=fields['use_symmetry']),
+                                    POLICIES[fields['policy']](), tt, fields['seed'])
+        self.insert(key, mcts)
+        return mcts, 'miss'
+
+    def insert(self, key, mcts):
+        self.cache[key] = mcts
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+
+class PendingRequest(Future):
+    """
+    Future of the response to a request, completed once the response was 
+    passed to the reply callback
+    """
+
+    def __init__(self):
+        super().__init__()
+        # future of the search in the worker process
+        self.search = None
+
+    def cancel(self):
+        """ Withdraws the request if its worker process has not started it """
+        return self.search is not None and self.search.cancel()
+
+    def respond(self, response, reply=None):
+        if reply is not None:
+            reply(response)
+        self.set_result(response)
+
+
+# SearchCache of a worker process, see Engine
+_worker_cache = None
+
+
+def _start_worker(cache_size, default_budget, tt_max_shared):
+    global _worker_cache
+    _worker_cache = SearchCache(cache_size, default_budget, tt_max_shared)
+
+
+def _search_in_worker(fields):
+    try:
+        return _worker_cache.search(fields)
+    except Exception:
+        traceback.print_exc(file=sys.stderr)
+        return {'id': fields['id'], 'error': "internal error"}
+
+
+class Engine():
+
+    def __init__(self, n_workers=None, cache_size=64, default_budget=1000, tt_max_shared=None):
+        """
+        Parameters
+        ----------
+        n_workers : number of worker processes, each searching one request
+                    at a time, defaults to the CPU count
+        cache_size : number of search trees kept by every worker
+        default_budget : iterations of a request without budget, time or deadline
+        tt_max_shared : nodes shared by the transposition table of every
+                        tree, see TranspositionTable
+
+        Searches are CPU bound, so they run in separate processes. Every
+        worker keeps its own trees: a request goes to the worker that last 
+        searched its position, or the position two plies above it, and to 
+        the worker with the fewest pending requests otherwise.
+        """
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.cache_size = cache_size
+
+        self.workers = [ProcessPoolExecutor(1, initializer=_start_worker,
+                                            initargs=(cache_size, default_budget, tt_max_shared))
+                        for _ in range(self.n_workers)]
+        # start the processes now rather than on the first request
+        for worker in self.workers:
+            worker.submit(int).result()
+
+        # cache_key() -> (worker, position), least recently used first
+        self.routes = OrderedDict()
+        self.pending = [0] * self.n_workers
+        self.lock = threading.Lock()
+
+    def submit(self, request, reply=None):
+        """
+        Future of the response to a request. reply(response) is called once
+        the response is known, before the future completes. A request not 
+        yet handed to its worker process can be cancelled with the future's
+        cancel(), it is then answered with an error.
+        """
+        future = PendingRequest()
+        try:
+            fields = search_fields(request)
+        except RequestError as error:
+            future.respond({'id': request.get('id'), 'error': str(error)}, reply)
+            return future
+
+        worker = self.route(fields)
+        future.search = self.workers[worker].submit(_search_in_worker, fields)
+
+        def done(search):
+            with self.lock:
+                self.pending[worker] -= 1
+            if search.cancelled():
+                response = {'id': fields['id'], 'error': "cancelled"}
+            else:
+                try:
+                    response = search.result()
+                except Exception:
+                    # the worker process died
+                    traceback.print_exc(file=sys.stderr)
+                    response = {'id': fields['id'], 'error': "internal error"}
+            future.respond(response, reply)
+        future.search.add_done_callback(done)
+        return future
+
+    def handle(self, request):
+        """ Response to a request, waiting for it """
+        return self.submit(request).result()
+
+    def route(self, fields):
+        """ Worker that should search the request """
+        key = cache_key(fields)
+        with self.lock:
+            route = self.routes.get(key)
+            if route is not None:
+                worker = route[0]
+                self.routes.move_to_end(key)
+            else:
+                worker = None
+                for parent_key, (parent_worker, parent_state) in self.routes.items():
+                    if parent_key[:3] == key[:3] and moves_between(parent_state, fields['env_state']):
+                        worker = parent_worker
+                        # the worker re-roots that tree
+                        del self.routes[parent_key]
+                        break
+                if worker is None:
+                    worker = min(range(self.n_workers), key=self.pending.__getitem__)
+                self.routes[key] = (worker, fields['env_state'])
+                while len(self.routes) > self.cache_size * self.n_workers:
+                    self.routes.popitem(last=False)
+            self.pending[worker] += 1
+        return worker
+
+    def shutdown(self, cancel_pending=False):
+        """ Waits for the running searches, and for the pending ones unless cancel_pending """
+        for worker in self.workers:
+            worker.shutdown(wait=True, cancel_futures=cancel_pending)
+
+
+def parse_request(line):
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as error:
+        return None, {'id': None, 'error': "invalid JSON: {0}".format(error)}
+    if not isinstance(request, dict):
+        return None, {'id': None, 'error': "request must be a JSON object"}
+    return request, None
+
+
+def serve_stdio(engine, stdin=sys.stdin, stdout=sys.stdout):
+    """ Serves the requests read from stdin until EOF """
+    write_lock = threading.Lock()
+
+    def write(response):
+        with write_lock:
+            stdout.write(json.dumps(response) + '\n')
+            stdout.flush()
+
+    for line in stdin:
+        if not line.strip():
+            continue
+        request, error = parse_request(line)
+        if error is not None:
+            write(error)
+        else:
+            engine.submit(request, write)
+    engine.shutdown()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """ One TCP connection, any number of requests """
+
+    def handle(self):
+        engine = self.server.engine
+        write_lock = threading.Lock()
+        futures = []
+
+        def write(response):
+            with write_lock:
+                try:
+                    self.wfile.write((json.dumps(response) + '\n').encode())
+                    self.wfile.flush()
+                except OSError:
+                    pass
+
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request, error = parse_request(line)
+            if error is not None:
+                write(error)
+            else:
+                futures.append(engine.submit(request, write))
+        # answer what is pending before closing the connection
+        wait(futures)
+
+
+class EngineTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, engine):
+        super().__init__(address, RequestHandler)
+        self.engine = engine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tic-Tac-Toe MCTS engine server (NDJSON)")
+    parser.add_argument('--port', type=int, default=None,
+                        help="serve on this TCP port instead of stdin/stdout")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes, defaults to the CPU count")
+    parser.add_argument('--cache-size', type=int, default=64)
+    parser.add_argument('--budget', type=int, default=1000,
+                        help="iterations of requests without budget, time or deadline")
+    parser.add_argument('--tt-max-shared', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    engine = Engine(args.workers, args.cache_size, args.budget, args.tt_max_shared)
+    if args.port is None:
+        serve_stdio(engine)
+    else:
+        with EngineTCPServer((args.host, args.port), engine) as server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        engine.shutdown(cancel_pending=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch leaf evaluators for MonteCarloTreeSearch.search_batched.
+
+An evaluator scores a whole batch of leaf StateNodes in one call and returns
+one reward per leaf, in [0, 1] for the player the leaf is scored for
+(StateNode.player), like StateNode.rollout.
+"""
+
+import numpy as np
+
+from abc import ABC, abstractmethod
+
+from batch_rollout import supports_batch_rollout, batch_rollout_states
+from table_engine import ONGOING, NO_STATE
+from tictactoe import BITBOARD_CELLS, MASK_CELLS, bitboard_key, state_bitboards
+
+
+def result_to_reward(results, players):
+    """ game results (1, -1, 0), or expected results, to rewards for players """
+    return (1 + np.asarray(players)*np.asarray(results)) / 2
+
+
+class Evaluator(ABC):
+
+    @abstractmethod
+    def evaluate(self, leaves):
+        """
+        Parameters
+        ----------
+        leaves : list of StateNode
+
+        Returns
+        -------
+        rewards : np.array() with one reward per leaf
+        """
+        pass
+
+
+class RandomRolloutEvaluator(Evaluator):
+    """
+    One random roll-out per leaf. 3x3 boards are played all at once by the
+    vectorized batch engine, other games fall back to StateNode.rollout.
+    """
+
+    def __init__(self, rng=np.random):
+        self.rng = rng
+
+    def evaluate(self, leaves):
+        if not all(supports_batch_rollout(leaf.env_state) for leaf in leaves):
+            return np.array([leaf.rollout(self.rng) for leaf in leaves], dtype=float)
+
+        results = batch_rollout_states([leaf.env_state for leaf in leaves], 1, self.rng)[:, 0]
+        return result_to_reward(results, [leaf.player for leaf in leaves])
+
+
+class ValueTableEvaluator(Evaluator):
+
+    def __init__(self, table, values):
+        """
+        Parameters
+        ----------
+        table  : TicTacToeTable
+        values : np.array() (S,) expected game result (1 O wins, -1 X wins)
+                 of every table state
+        """
+        self.table = table
+        self.values = np.asarray(values, dtype=float)
+
+    @classmethod
+    def random_play(cls, table):
+        """
+        Value table of the expected result of uniformly random play, i.e. the
+        exact value a random roll-out estimates.
+        """
+        return cls(table, cls.random_play_values(table))
+
+    @staticmethod
+    def random_play_values(table):
+        values = np.where(table.results == ONGOING, 0, table.results).astype(float)
+        # states with more stones come later in the game, solve them first
+        stones = np.array([len(MASK_CELLS[o]) + len(MASK_CELLS[x])
+                           for o, x in zip(table.o_masks.tolist(), table.x_masks.tolist())])
+        for n_stones in range(BITBOARD_CELLS - 1, -1, -1):
+            states = np.flatnonzero((stones == n_stones) & (table.results == ONGOING))
+            successors = table.successors[states]
+            legal = successors != NO_STATE
+            values[states] = (np.where(legal, values[successors], 0).sum(axis=1) 
+                              / legal.sum(axis=1))
+        return values
+
+    def state_ids(self, leaves):
+        keys = []
+        for leaf in leaves:
+            o_mask, x_mask = state_bitboards(leaf.env_state)
+            keys.append(bitboard_key(o_mask, x_mask, leaf.env_state.player))
+        state_ids = self.table.index[keys]
+        # NO_STATE would silently index the last value of the table
+        if (state_ids == NO_STATE).any():
+            raise ValueError("position is not reachable from the empty board")
+        return state_ids
+
+    def evaluate(self, leaves):
+        values = self.values[self.state_ids(leaves)]
+        return result_to_reward(values, [leaf.player for leaf in leaves])
+
+
+class MLPEvaluator(Evaluator):
+
+    def __init__(self, weights=None, hidden_units=32, seed=None):
+        """
+        Small two-layer perceptron over the board, evaluated for the whole 
+        batch with two matrix products.
+
+        Parameters
+        ----------
+        weights      : (W1, b1, W2, b2) with W1 of shape (19, hidden_units) 
+                       and W2 of shape (hidden_units,), randomly initialized 
+                       when None
+        hidden_units : width of the hidden layer for random initialization
+        seed         : seed of the random initialization
+
+        The inputs are the O stones, the X stones and the side to move, the 
+        output is the expected game result in [-1, 1] (1 O wins).
+        """
+        if weights is None:
+            rng = np.random.default_rng(seed)
+            n_inputs = 2*BITBOARD_CELLS + 1
+            weights = (rng.normal(0, 1/np.sqrt(n_inputs), (n_inputs, hidden_units)),
+                       np.zeros(hidden_units),
+                       rng.normal(0, 1/np.sqrt(hidden_units), hidden_units),
+                       0.0)
+        self.W1, self.b1, self.W2, self.b2 = weights
+
+    def features(self, leaves):
+        cells = 1 << np.arange(BITBOARD_CELLS)
+        bitboards = np.array([state_bitboards(leaf.env_state) for leaf in leaves])
+        players = np.array([leaf.env_state.player for leaf in leaves])
+        return np.hstack([(bitboards[:, :1] & cells) != 0,
+                          (bitboards[:, 1:] & cells) != 0,
+                          players[:, None]]).astype(float)
+
+    def predict(self, features):
+        hidden = np.maximum(features @ self.W1 + self.b1, 0)
+        return np.tanh(hidden @ self.W2 + self.b2)
+
+    def evaluate(self, leaves):
+        values = self.predict(self.features(leaves))
+        return result_to_reward(values, [leaf.player for leaf in leaves])
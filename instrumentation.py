@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of MonteCarloTreeSearch: observer hooks around the search
+phases, and SearchStats, the observer collecting per-phase times and call
+counts, tree depth, roll-out lengths, node counts and roll-outs/sec.
+
+Nothing here is on the hot path until an observer is added: instrument()
+shadows the methods of one search instance with timed wrappers, and gives 
+it an ObservedPolicy that selects like its tree policy through an observed
+OCBA solver; uninstrument() removes them again. The tree policy itself, 
+which other searches may share, is never modified.
+
+    stats = mcts.enable_stats()
+    root = mcts.search(1000)
+    root.attrs['stats']        # == mcts.last_stats == stats.summary()
+    stats.to_frame()           # per-phase table
+
+SearchTracer is an observer recording the phases of a sample of the
+iterations, for chrome://tracing / Perfetto and for flame graphs.
+"""
+
+import os
+import json
+import random
+import threading
+import pandas as pd
+
+from time import perf_counter
+from collections import defaultdict
+
+# timed phases, a phase may run inside another one (search > iteration >
+# tree_walk > tree_policy_selection > ocba)
+PHASES = ('search', 'iteration', 'tree_walk', 'tree_policy_selection',
+          'rollout', 'backpropagate', 'ocba')
+
+SEARCH_METHODS = ('search', 'search_checkpoints', 'search_anytime', 'search_batched')
+
+ITERATION_METHODS = ('iterate', 'iterate_batched')
+
+
+class SearchObserver():
+    """
+    Hooks called by an instrumented MonteCarloTreeSearch. Every hook does
+    nothing by default, observers override the ones they need. Times are
+    time.perf_counter() values in seconds.
+    """
+
+    def on_search_start(self, mcts):
+        pass
+
+    def on_search_end(self, mcts):
+        pass
+
+    def on_iteration_start(self, mcts):
+        pass
+
+    def on_iteration_end(self, mcts):
+        pass
+
+    def on_phase_start(self, name, t0):
+        pass
+
+    def on_phase_end(self, name, t0, t1):
+        pass
+
+    def on_rollout(self, length):
+        """ the play-out of a single roll-out ended after `length` moves """
+        pass
+
+    def on_ocba(self, k):
+        """ an OCBA solver call over k actions ended """
+        pass
+
+
+class SearchStats(SearchObserver):
+    """
+    Counters of the last search, reset when a search starts
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.iterations = 0
+        self.walks = 0
+        self.depth_total = 0
+        self.rollouts = 0
+        self.measured_rollouts = 0
+        self.rollout_length_total = 0
+        self.state_nodes = 0
+        self.action_nodes = 0
+        self._root_visits = 0
+
+    def on_search_start(self, mcts):
+        self.reset()
+        self._root_visits = mcts.root_state.n
+
+    def on_search_end(self, mcts):
+        # every roll-out, batched or not, is one visit of the root
+        self.rollouts = mcts.root_state.n - self._root_visits
+        self.state_nodes, self.action_nodes = count_nodes(mcts.root_state)
+
+    def on_iteration_end(self, mcts):
+        self.iterations += 1
+        for path in walked_paths(mcts):
+            self.walks += 1
+            self.depth_total += (len(path) - 1) // 2
+
+    def on_phase_end(self, name, t0, t1):
+        self.times[name] = self.times.get(name, 0.0) + t1 - t0
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def on_rollout(self, length):
+        self.measured_rollouts += 1
+        self.rollout_length_total += length
+
+    @property
+    def elapsed(self):
+        return self.times['search']
+
+    @property
+    def average_depth(self):
+        """ over the tree walks, a batched iteration walks several paths """
+        return self.depth_total / self.walks if self.walks > 0 else 0.0
+
+    @property
+    def average_rollout_length(self):
+        """ over single roll-outs, batched roll-outs do not report their length """
+        return self.rollout_length_total / self.measured_rollouts if self.measured_rollouts > 0 else 0.0
+
+    @property
+    def rollouts_per_second(self):
+        return self.rollouts / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        return {'elapsed': self.elapsed, 'iterations': self.iterations, 'rollouts': self.rollouts,
+                'rollouts_per_second': self.rollouts_per_second,
+                'average_depth': self.average_depth,
+                'average_rollout_length': self.average_rollout_length,
+                'state_nodes': self.state_nodes, 'action_nodes': self.action_nodes,
+                'phases': {name: {'time': self.times[name], 'calls': self.calls[name]}
+                           for name in self.times}}
+
+    def to_frame(self):
+        """
+        DataFrame indexed by phase with the cumulative time, the number of
+        calls, the time per call and the share of the search time
+        """
+        df = pd.DataFrame({'time': self.times, 'calls': self.calls})
+        df['time_per_call'] = df['time'] / df['calls'].where(df['calls'] > 0)
+        df['share'] = df['time'] / self.elapsed if self.elapsed > 0 else 0.0
+        return df
+
+
+class SearchTracer(SearchObserver):
+    """
+    Records the phases of a random sample of the iterations as Chrome 
+    trace events ('X' spans in microseconds) and as collapsed stacks 
+    (self time in microseconds per phase stack) for flame graph tools. 
+    Iterations that are not sampled only cost the hook calls.
+    """
+
+    def __init__(self, sample_rate=0.01, max_events=1000000, seed=None):
+        """
+        Parameters
+        ----------
+        sample_rate : fraction of the iterations traced
+        max_events : no iteration is sampled once this many events are kept
+        seed : seed of the sampling, independent of the search's own rng
+        """
+        self.sample_rate = sample_rate
+        self.max_events = max_events
+        self.random = random.Random(seed)
+        
+        self.origin = perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self.collapsed = defaultdict(float)
+        self.sampled_iterations = 0
+        self.dropped_iterations = 0
+        
+        self._sampling = False
+        self._rollout_length = None
+        # open phases of the sampled iteration, [name, time spent in sub-phases]
+        self._stack = []
+
+    def on_search_start(self, mcts):
+        self._search_start = perf_counter()
+
+    def on_search_end(self, mcts):
+        # the search span itself is always recorded
+        t1 = perf_counter()
+        self.events.append({'name': 'search', 'ph': 'X', 'ts': (self._search_start - self.origin)*1e6,
+                            'dur': (t1 - self._search_start)*1e6, 'pid': self.pid, 
+                            'tid': threading.get_ident(), 
+                            'args': {'root_visits': mcts.root_state.n}})
+
+    def on_iteration_start(self, mcts):
+        if self.random.random() >= self.sample_rate:
+            return
+        if len(self.events) >= self.max_events:
+            self.dropped_iterations += 1
+            return
+        self._sampling = True
+        self.sampled_iterations += 1
+
+    def on_iteration_end(self, mcts):
+        if self._sampling:
+            self._sampling = False
+            self._stack = []
+            # the iteration span is the last one closed
+            depths = [(len(path) - 1) // 2 for path in walked_paths(mcts)]
+            self.events[-1]['args']['depth'] = sum(depths) / len(depths)
+            if mcts.batch_paths is not None:
+                self.events[-1]['args']['leaves'] = len(depths)
+
+    def on_phase_start(self, name, t0):
+        if self._sampling:
+            self._stack.append([name, 0.0])
+
+    def on_phase_end(self, name, t0, t1):
+        if not self._sampling:
+            return
+        duration = t1 - t0
+        self.events.append({'name': name, 'ph': 'X', 'ts': (t0 - self.origin)*1e6, 
+                            'dur': duration*1e6, 'pid': self.pid, 'tid': threading.get_ident(), 
+                            'args': {}})
+        if name == 'rollout' and self._rollout_length is not None:
+            # reported by the play-out, before the roll-out span closed
+            self.events[-1]['args']['length'] = self._rollout_length
+            self._rollout_length = None
+        
+        stack = ['search'] + [frame[0] for frame in self._stack]
+        name, sub_phases = self._stack.pop()
+        self.collapsed[';'.join(stack)] += (duration - sub_phases)*1e6
+        if self._stack:
+            self._stack[-1][1] += duration
+
+    def on_rollout(self, length):
+        if self._sampling:
+            self._rollout_length = length
+
+    def on_ocba(self, k):
+        if self._sampling:
+            self.events[-1]['args']['k'] = k
+
+    def chrome_trace(self):
+        metadata = {'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'mcts'}}
+        return {'traceEvents': [metadata] + self.events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        """ trace-event JSON, to open in chrome://tracing or Perfetto """
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def write_collapsed(self, path):
+        """ one 'phase;sub-phase;... microseconds' line per stack, for flamegraph.pl / speedscope """
+        with open(path, 'w') as f:
+            for stack, microseconds in sorted(self.collapsed.items()):
+                f.write("{0} {1}\n".format(stack, int(round(microseconds))))
+
+
+class ObservedSolver():
+    """
+    OCBA solver of one instrumented search: calls of the allocation methods
+    of `solver` are timed as the 'ocba' phase and reported with on_ocba(), 
+    anything else is delegated to `solver` unchanged
+    """
+
+    def __init__(self, solver, observers):
+        self.solver = solver
+        self.observers = observers
+
+    def __getattr__(self, name):
+        return getattr(self.solver, name)
+
+    def OCBA_Starving(self, k, *args, **kwargs):
+        return self._observed(self.solver.OCBA_Starving, k, *args, **kwargs)
+
+    def OCBA_Plan(self, k, *args, **kwargs):
+        return self._observed(self.solver.OCBA_Plan, k, *args, **kwargs)
+
+    def _observed(self, method, k, *args, **kwargs):
+        observers = self.observers
+        t0 = perf_counter()
+        for observer in observers:
+            observer.on_phase_start('ocba', t0)
+        result = method(k, *args, **kwargs)
+        t1 = perf_counter()
+        for observer in observers:
+            observer.on_phase_end('ocba', t0, t1)
+            observer.on_ocba(k)
+        return result
+
+
+class ObservedPolicy():
+    """
+    Tree policy of one instrumented search: select() runs the selection of
+    `policy` with an ObservedSolver in place of its OCBA solver, every other
+    attribute is read from and written to `policy`
+    """
+
+    def __init__(self, policy, observers):
+        object.__setattr__(self, 'policy', policy)
+        object.__setattr__(self, 'ocba', ObservedSolver(policy.ocba, observers))
+
+    def __getattr__(self, name):
+        return getattr(self.policy, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.policy, name, value)
+
+    def select(self, current_state, rng):
+        return type(self.policy).select(self, current_state, rng)
+
+
+def walked_paths(mcts):
+    """ Paths walked by the last iteration of mcts """
+    return mcts.batch_paths if mcts.batch_paths is not None else [mcts.path]
+
+
+def count_nodes(root):
+    """ Number of StateNodes and StateActionNodes reachable from root """
+    seen = {id(root)}
+    stack = [root]
+    n_actions = 0
+    while stack:
+        state_node = stack.pop()
+        n_actions += len(state_node.actions)
+        for state_action in state_node.actions:
+            for next_state_node in state_action.next_state_nodes.values():
+                if id(next_state_node) not in seen:
+                    seen.add(id(next_state_node))
+                    stack.append(next_state_node)
+    return len(seen), n_actions
+
+
+def instrument(mcts):
+    """
+    Shadows the hot-path methods of mcts with wrappers notifying 
+    mcts.observers, and selects through an ObservedPolicy when its tree 
+    policy has an OCBA solver
+    """
+    if 'tree_walk' in vars(mcts):
+        return
+    observers = mcts.observers
+
+    for name in SEARCH_METHODS:
+        setattr(mcts, name, _observed_search(mcts, getattr(mcts, name)))
+    for name in ITERATION_METHODS:
+        setattr(mcts, name, _observed_iteration(mcts, getattr(mcts, name)))
+    mcts.tree_walk = _timed(observers, 'tree_walk', mcts.tree_walk)
+    mcts.tree_policy_selection = _timed(observers, 'tree_policy_selection', mcts.tree_policy_selection)
+    mcts.rollout = _timed(observers, 'rollout', mcts.rollout)
+    mcts.play_out = _observed_play_out(observers, mcts.play_out)
+    mcts.rollouts = _timed(observers, 'rollout', mcts.rollouts)
+    mcts.evaluate = _timed(observers, 'rollout', mcts.evaluate)
+    mcts.backpropagate = _timed(observers, 'backpropagate', mcts.backpropagate)
+    mcts.backpropagate_batch = _timed(observers, 'backpropagate', mcts.backpropagate_batch)
+
+    if getattr(mcts.tree_policy, 'ocba', None) is not None:
+        mcts.observed_policy = ObservedPolicy(mcts.tree_policy, observers)
+
+
+def uninstrument(mcts):
+    for name in SEARCH_METHODS + ITERATION_METHODS + ('tree_walk', 'tree_policy_selection', 'rollout',
+                                                      'play_out', 'rollouts', 'evaluate',
+                                                      'backpropagate', 'backpropagate_batch'):
+        vars(mcts).pop(name, None)
+    mcts.observed_policy = None
+
+
+def _timed(observers, name, method):
+    def timed(*args, **kwargs):
+        t0 = perf_counter()
+        for observer in observers:
+            observer.on_phase_start(name, t0)
+        result = method(*args, **kwargs)
+        t1 = perf_counter()
+        for observer in observers:
+            observer.on_phase_end(name, t0, t1)
+        return result
+    return timed
+
+
+def _observed_iteration(mcts, iterate):
+    observers = mcts.observers
+    timed_iterate = _timed(observers, 'iteration', iterate)
+
+    def observed_iteration(*args, **kwargs):
+        mcts.batch_paths = None
+        for observer in observers:
+            observer.on_iteration_start(mcts)
+        n_rollouts = timed_iterate(*args, **kwargs)
+        for observer in observers:
+            observer.on_iteration_end(mcts)
+        return n_rollouts
+    return observed_iteration
+
+
+def _observed_play_out(observers, play_out):
+    def observed_play_out(node):
+        game_result, length = play_out(node)
+        for observer in observers:
+            observer.on_rollout(length)
+        return game_result, length
+    return observed_play_out
+
+
+def _observed_search(mcts, search):
+    observers = mcts.observers
+    timed_search = _timed(observers, 'search', search)
+
+    def observed_search(*args, **kwargs):
+        for observer in observers:
+            observer.on_search_start(mcts)
+        result = timed_search(*args, **kwargs)
+        for observer in observers:
+            observer.on_search_end(mcts)
+        if mcts.stats is not None:
+            mcts.last_stats = mcts.stats.summary()
+            if isinstance(result, pd.DataFrame):
+                result.attrs['stats'] = mcts.last_stats
+        return result
+    return observed_search
@@ -5,24 +5,67 @@ Created on Mon Feb 22 16:41:38 2021
 
 @author: yuri
 """
+import time
+import threading
 import numpy as np
 import pandas as pd
 
+from node import StateNode
+from ocba import OCBA
+from evaluator import RandomRolloutEvaluator
+from rng import search_rng
+from instrumentation import SearchStats, instrument, uninstrument
+
 class MonteCarloTreeSearch():
-    def __init__(self, root_state, tree_policy):
+    def __init__(self, root_state, tree_policy, transposition_table=None, seed=None):
         """
         Parameters
         ----------
         root_state : root state x0
+        tree_policy : TreePolicy used to select actions at expanded nodes
+        transposition_table : optional TranspositionTable, StateNodes of 
+                              identical positions are then shared by every 
+                              path that reaches them
+        seed : seed of the search's own random generator (self.rng), drawn 
+               from the global np.random state when None
         """
         self.root_state = root_state
         self.tree_policy = tree_policy
+        self.transposition_table = transposition_table
+        if transposition_table is not None:
+            transposition_table.put(root_state.state_key(root_state.env_state), root_state)
+        
+        # nodes visited by the last tree walk, root first
+        self.path = []
+        
+        self.ocba = OCBA()
+        
+        self.rng = search_rng(seed)
         
-    def search(self, N):
+        # background search during the opponent's turn, see start_pondering()
+        self._ponder_thread = None
+        self._ponder_stop = threading.Event()
+        self._ponder_error = None
+        self.ponder_iterations = 0
+        
+        # SearchObservers notified by the instrumented methods, see add_observer()
+        self.observers = []
+        self.stats = None
+        self.last_stats = None
+        # stands for the tree policy in tree_policy_selection() while the 
+        # search is instrumented; the policy may be shared by other searches
+        self.observed_policy = None
+        # paths walked by the last iterate_batched()
+        self.batch_paths = None
+        
+    def search(self, N, rollouts_per_leaf=1):
         """
         Parameters
         ----------
         N : simulation budget (roll-out number)
+        rollouts_per_leaf : number of roll-outs run through the batch engine 
+                            for every expanded leaf, the leaf statistics are 
+                            backpropagated together
 
         Output
         ----------
@@ -30,31 +73,254 @@ class MonteCarloTreeSearch():
                       reward at the root node
         best_value : estimated value of the root node
         """
-        for n in range(N):
-            new_node = self.tree_walk()
-            reward = new_node.rollout()# self.simulate(leaf)
-            new_node.backpropagate(reward)
+        n = 0
+        while n < N:
+            n += self.iterate(min(rollouts_per_leaf, N - n))
+
+        return self.root_statistics()
+
+    def search_checkpoints(self, checkpoints, rollouts_per_leaf=1):
+        """
+        Runs a single search up to the largest checkpoint and records the 
+        result at every checkpoint on the way, so a whole PCS curve costs one
+        search to max(checkpoints). With a fixed seed and rollouts_per_leaf=1,
+        the record at checkpoint N is the result search(N) would give on a
+        fresh tree.
+
+        Parameters
+        ----------
+        checkpoints : sorted list of simulation budgets (roll-out numbers)
+        rollouts_per_leaf : see search(), batches are cut at the checkpoints,
+                            so with more than one roll-out per leaf the
+                            searches past the first checkpoint differ from
+                            search(N), which only cuts its last batch
+
+        Output
+        ----------
+        dictionary checkpoint -> {'best_action': move id of best_action(),
+                                  'root': root statistics DataFrame}
+        """
+        if any(a > b for a, b in zip(checkpoints, checkpoints[1:])):
+            raise ValueError("checkpoints must be sorted")
+        
+        results = {}
+        n = 0
+        for N in checkpoints:
+            while n < N:
+                n += self.iterate(min(rollouts_per_leaf, N - n))
+            results[N] = {'best_action': self.best_action().move_id,
+                          'root': self.root_statistics()}
+        
+        return results
+
+    def search_anytime(self, time_budget=None, deadline=None, max_iterations=None,
+                       target_apcs=None, check_interval=10, rollouts_per_leaf=1):
+        """
+        Searches until a wall-clock budget or an iteration limit runs out, 
+        and optionally stops early once the root is resolved.
+        
+        Parameters
+        ----------
+        time_budget : seconds available for this search
+        deadline : absolute time.monotonic() value at which the search stops
+        max_iterations : maximum number of tree walks
+        target_apcs : stop as soon as the approximate probability of correct 
+                      selection of the best root action reaches this value;
+                      the target may never be reached, so it needs one of 
+                      the limits above
+        check_interval : number of iterations between APCS checks, the clock
+                         is checked after every iteration
+        rollouts_per_leaf : see search()
+
+        Output
+        ----------
+        DataFrame of the best-so-far root statistics, as in search(). The 
+        number of iterations, the final APCS and the reason the search 
+        stopped are kept in self.iterations, self.apcs and self.stop_reason.
+        """
+        if time_budget is None and deadline is None and max_iterations is None:
+            raise ValueError("search_anytime needs a time budget, a deadline or an iteration limit")
+        if time_budget is not None:
+            budget_deadline = time.monotonic() + time_budget
+            deadline = budget_deadline if deadline is None else min(deadline, budget_deadline)
+        
+        self.iterations = 0
+        self.apcs = 0.0
+        self.stop_reason = None
+        while self.stop_reason is None:
+            self.iterate(rollouts_per_leaf)
+            self.iterations += 1
+            
+            if max_iterations is not None and self.iterations >= max_iterations:
+                self.stop_reason = 'iterations'
+            elif deadline is not None and time.monotonic() >= deadline:
+                self.stop_reason = 'deadline'
+            elif target_apcs is not None and self.iterations % check_interval == 0:
+                self.apcs = self.root_apcs()
+                if self.apcs >= target_apcs:
+                    self.stop_reason = 'apcs'
+        
+        if self.stop_reason != 'apcs':
+            self.apcs = self.root_apcs()
+        
+        return self.root_statistics()
+
+    def search_batched(self, N, batch_size=8, evaluator=None):
+        """
+        Parameters
+        ----------
+        N : simulation budget (number of leaf evaluations)
+        batch_size : number of leaves collected per iteration, the paths 
+                     already collected are marked as pending (virtual loss) 
+                     so the next walks spread over the tree
+        evaluator : Evaluator scoring the whole batch of leaves in one call,
+                    RandomRolloutEvaluator by default
+
+        Output
+        ----------
+        DataFrame with the Q value and visit count of every root action
+        """
+        if evaluator is None:
+            evaluator = RandomRolloutEvaluator(self.rng)
+        
+        n = 0
+        while n < N:
+            n += self.iterate_batched(min(batch_size, N - n), evaluator)
+
+        return self.root_statistics()
+
+    def iterate_batched(self, n_leaves, evaluator):
+        """
+        Walks up to n_leaves distinct leaves, scores them with one evaluator
+        call and backpropagates the rewards. The walked paths are kept in 
+        self.batch_paths. Returns the number of leaves evaluated.
+        """
+        paths = []
+        pending = set()
+        # walks that end on a leaf already in the batch are dropped
+        for _ in range(2*n_leaves):
+            leaf = self.tree_walk()
+            if id(leaf) not in pending:
+                pending.add(id(leaf))
+                paths.append(self.path)
+                self.apply_virtual_loss(self.path)
+                if len(paths) == n_leaves:
+                    break
+        
+        rewards = self.evaluate(evaluator, [path[-1] for path in paths])
+        
+        for path, reward in zip(paths, rewards):
+            self.revert_virtual_loss(path)
+            self.backpropagate(reward, path)
+        self.batch_paths = paths
+        return len(paths)
+
+    def add_observer(self, observer):
+        """
+        Attaches a SearchObserver. The search methods are instrumented while
+        at least one observer is attached and run uninstrumented otherwise.
+        """
+        self.observers.append(observer)
+        instrument(self)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+        if observer is self.stats:
+            self.stats = None
+        if not self.observers:
+            uninstrument(self)
+
+    def enable_stats(self):
+        """
+        Attaches a SearchStats observer and returns it. After every search,
+        its summary is kept in self.last_stats and in the attrs['stats'] of 
+        the returned root statistics.
+        """
+        if self.stats is None:
+            self.stats = SearchStats()
+            self.add_observer(self.stats)
+        return self.stats
+
+    def disable_stats(self):
+        if self.stats is not None:
+            self.remove_observer(self.stats)
+
+    def iterate(self, rollouts_per_leaf=1, first_action=None):
+        """
+        One tree walk, roll-out(s) from the new leaf and backpropagation. 
+        Returns the number of roll-outs run.
+        """
+        new_node = self.tree_walk(first_action)
+        if rollouts_per_leaf == 1:
+            reward = self.rollout(new_node)# self.simulate(leaf)
+            self.backpropagate(reward)
+        else:
+            rewards = self.rollouts(new_node, rollouts_per_leaf)
+            self.backpropagate_batch(rewards)
+        return rollouts_per_leaf
+
+    def rollout(self, node):
+        game_result, length = self.play_out(node)
+        return node.reward(game_result)
+
+    def play_out(self, node):
+        return node.play_out(self.rng)
+
+    def rollouts(self, node, k):
+        return node.rollouts(k, self.rng)
+
+    def evaluate(self, evaluator, leaves):
+        return evaluator.evaluate(leaves)
+
+    def root_apcs(self):
+        """
+        Approximate probability that the root action with the highest mean 
+        is the best one, computed from the tracked child means and standard 
+        deviations. It is 0 until every root action has two visits.
+        """
+        root = self.root_state
+        if root.child_n is None or root.is_expandable():
+            return 0.0
+        ns, q_value_means, q_value_stddevs = root.child_statistics()
+        # same variance floor as TreePolicy_OCBA, Q samples are running means
+        # and their raw spread understates the uncertainty early on
+        q_value_stddevs = np.sqrt(q_value_stddevs**2 + 10/ns)
+        return self.ocba.APCS(len(ns), ns, q_value_means, q_value_stddevs)
 
-        q_values = [ actions.q_value_mean  for actions in self.root_state.actions ]
-        ns = [ actions.n  for actions in self.root_state.actions ]
-        indexes = [ actions.move_id  for actions in self.root_state.actions ]
+    def root_statistics(self):
+        """
+        DataFrame with the Q value and visit count of every root action, 
+        indexed by move id. Moves merged by symmetry each get a row with the 
+        statistics of their shared node.
+        """
+        q_values = [ actions.q_value_mean  for actions in self.root_state.actions for move_id in actions.move_ids ]
+        ns = [ actions.n  for actions in self.root_state.actions for move_id in actions.move_ids ]
+        indexes = [ move_id  for actions in self.root_state.actions for move_id in actions.move_ids ]
         
         df = pd.DataFrame({'Q':q_values,'N':ns}, index=indexes)
 
         return df.sort_index()
     
-    def tree_walk(self):
+    def tree_walk(self, first_action=None):
         """
-        Sample a root-to-leaf path
+        Sample a root-to-leaf path, through the root StateActionNode 
+        first_action when given
         ----------
         Output:
         """
         current_node = self.root_state
+        self.path = [current_node]
+        if first_action is not None:
+            current_node = first_action.expand(self.transposition_table, self.rng)
+            self.path.append(first_action)
+            self.path.append(current_node)
         while not current_node.is_terminal_node():
             #if not current_node.is_fully_expanded():
             if current_node.is_expandable():
-                new_state_action = current_node.expand()
-                new_state = new_state_action.expand()
+                new_state_action = current_node.expand(self.rng)
+                new_state = new_state_action.expand(self.transposition_table, self.rng)
+                self.path.append(new_state_action)
+                self.path.append(new_state)
                 return new_state
             else:
                 current_node = self.tree_policy_selection(current_node)
@@ -63,9 +329,42 @@ class MonteCarloTreeSearch():
 
     
     def tree_policy_selection(self, node):
-        action_selected = self.tree_policy.select(node)
-        next_state = action_selected.expand()
+        policy = self.tree_policy if self.observed_policy is None else self.observed_policy
+        action_selected = policy.select(node, self.rng)
+        next_state = action_selected.expand(self.transposition_table, self.rng)
+        self.path.append(action_selected)
+        self.path.append(next_state)
         return next_state
+
+    def backpropagate(self, reward, path=None):
+        """
+        Backpropagates a roll-out reward along the path of the last tree 
+        walk (or the given path), which is the path actually taken when 
+        nodes are shared.
+        """
+        value = reward
+        for node in reversed(self.path if path is None else path):
+            value = node.update(value)
+
+    def backpropagate_batch(self, rewards, path=None):
+        values = rewards
+        for node in reversed(self.path if path is None else path):
+            values = node.update_batch(values)
+
+    def apply_virtual_loss(self, path):
+        """
+        Marks a walked path as pending: every state-action node on it counts 
+        one extra visit with reward StateActionNode.virtual_loss in the 
+        statistics the tree policies see, until revert_virtual_loss().
+        """
+        for action in path[1::2]:
+            action.virtual_visits += 1
+            action.update_parent_statistics()
+
+    def revert_virtual_loss(self, path):
+        for action in path[1::2]:
+            action.virtual_visits -= 1
+            action.update_parent_statistics()
     
 
     def best_action(self):
@@ -77,3 +376,132 @@ class MonteCarloTreeSearch():
         action_q_values = [ possible_action.q_value_mean for possible_action in self.root_state.actions ]
         return self.root_state.actions[np.argmax(action_q_values)]
 
+
+    def advance(self, action, opponent_action=None):
+        """
+        Re-roots the search after a move of the root player and the 
+        opponent's reply, keeping the statistics of the subtree under the 
+        resulting position and dropping the rest of the tree. When that 
+        position was never expanded (or, with symmetry, was only explored in 
+        a symmetric orientation) the search restarts from a fresh root.
+        
+        Parameters
+        ----------
+        action : move played at the root
+        opponent_action : reply of the opponent, None when action ended the game
+
+        Output
+        ----------
+        the new root StateNode
+        """
+        self.stop_pondering()
+        root = self.root_state
+        env_state = root.env_state.move(action)
+        if opponent_action is not None:
+            env_state = env_state.move(opponent_action)
+        
+        new_root = self.find_subtree(action, opponent_action, env_state)
+        if new_root is None:
+            new_root = StateNode(env_state, use_symmetry=root.use_symmetry)
+        # detach the subtree so the rest of the tree can be freed
+        new_root.prev_node = None
+        self.root_state = new_root
+        self.path = []
+        
+        if self.transposition_table is not None:
+            self.transposition_table.clear()
+            self.transposition_table.put(new_root.state_key(new_root.env_state), new_root)
+            # keep the reachable nodes only, each now owned by a parent inside the subtree
+            stack = [new_root]
+            while stack:
+                state_node = stack.pop()
+                for state_action in state_node.actions:
+                    for next_state_node in state_action.next_state_nodes.values():
+                        key = state_node.state_key(next_state_node.env_state)
+                        if next_state_node is not new_root and key not in self.transposition_table:
+                            next_state_node.prev_node = state_action
+                            self.transposition_table.put(key, next_state_node)
+                            stack.append(next_state_node)
+        
+        return new_root
+
+    def find_subtree(self, action, opponent_action, env_state):
+        """
+        StateNode of the tree reached by action and opponent_action, whose 
+        position is env_state, or None
+        """
+        root = self.root_state
+        move_id = action.x_coordinate*3 + action.y_coordinate
+        state_action = next((a for a in root.actions if move_id in a.move_ids), None)
+        if state_action is None or opponent_action is None:
+            return None
+        
+        if root.use_symmetry:
+            reply_key = root.state_key(env_state)
+        else:
+            reply_key = opponent_action.x_coordinate*3 + opponent_action.y_coordinate
+        next_state_node = state_action.next_state_nodes.get(reply_key)
+        if next_state_node is None or next_state_node.env_state.hash_key() != env_state.hash_key():
+            return None
+        
+        return next_state_node
+
+    def start_pondering(self, action, rollouts_per_leaf=1):
+        """
+        Keeps searching in a background thread while the opponent thinks, 
+        after the root player has chosen action. Every walk goes through 
+        action and a sampled reply, so the work lands in the subtrees that 
+        advance(action, opponent_action) keeps. The tree must not be used 
+        by the caller until stop_pondering(), which advance() calls itself.
+        
+        Parameters
+        ----------
+        action : move played at the root
+        rollouts_per_leaf : see search()
+
+        Output
+        ----------
+        True if pondering started, False when there is nothing to ponder 
+        (the move ends the game or was never expanded)
+        """
+        if self._ponder_thread is not None:
+            raise RuntimeError("already pondering")
+        move_id = action.x_coordinate*3 + action.y_coordinate
+        state_action = next((a for a in self.root_state.actions if move_id in a.move_ids), None)
+        if state_action is None or state_action.env_state.is_game_over():
+            return False
+        
+        self._ponder_stop.clear()
+        self._ponder_error = None
+        self.ponder_iterations = 0
+        self._ponder_thread = threading.Thread(target=self._ponder, args=(state_action, rollouts_per_leaf),
+                                               daemon=True)
+        self._ponder_thread.start()
+        return True
+
+    def _ponder(self, state_action, rollouts_per_leaf):
+        try:
+            while not self._ponder_stop.is_set():
+                self.iterate(rollouts_per_leaf, state_action)
+                self.ponder_iterations += 1
+        except Exception as error:
+            self._ponder_error = error
+
+    def stop_pondering(self):
+        """
+        Cancels pondering and waits for the iteration in progress to finish,
+        so the tree is consistent when this returns. Returns the number of 
+        iterations run while pondering.
+        """
+        if self._ponder_thread is None:
+            return 0
+        self._ponder_stop.set()
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        if self._ponder_error is not None:
+            raise self._ponder_error
+        return self.ponder_iterations
+
+    @property
+    def pondering(self):
+        return self._ponder_thread is not None
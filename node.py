@@ -6,13 +6,16 @@ Created on Wed Feb 24 15:15:34 2021
 @author: yuri
 """
 
+import math
 import numpy as np
-import statistics as stats
 
 from abc import ABC, abstractmethod
 
 from graphviz import Digraph
 
+from batch_rollout import supports_batch_rollout, batch_rollout_states
+from symmetry import canonical_state_key
+
 
 class Node(ABC):
 
@@ -79,41 +82,101 @@ class Node(ABC):
         
 class StateNode(Node):
 
-    def __init__(self, env_state, prev_node=None):
+    def __init__(self, env_state, prev_node=None, use_symmetry=False):
+        """
+        Parameters
+        ----------
+        env_state : game state of the node
+        prev_node : parent StateActionNode, None for the root
+        use_symmetry : merge actions and opponent replies that lead to 
+                       symmetric positions (3x3 boards), propagated to the 
+                       whole subtree
+        """
         super().__init__()
         self.env_state = env_state
         self.prev_node = prev_node
+        self.use_symmetry = use_symmetry
+        # rewards are scored for the player to move at the root, which is 
+        # also the player to move here unless an action ended the game
+        if prev_node is None:
+            self.player = env_state.player
+        else:
+            self.player = prev_node.state_node.player
 
         self._untried_actions = None
+        # representative move id -> move ids of its symmetry class
+        self.symmetric_moves = {}
         
         self.number_of_visits = 0
         self.value_function = 0
         
         self.actions = []
         
+        # n/mean/stddev of every child state-action node, in self.actions
+        # order, kept up to date by StateActionNode.backpropagate
+        self.child_n = None
+        self.child_mean = None
+        self.child_stddev = None
+        
     @property
     def untried_actions(self):
         if self._untried_actions is None:
             self._untried_actions = self.env_state.get_legal_actions()
+            if self.use_symmetry:
+                self._untried_actions = self.symmetry_representatives(self._untried_actions)
         return self._untried_actions
+
+    def symmetry_representatives(self, legal_actions):
+        """
+        Keeps the lowest move id of every class of actions that lead to 
+        symmetric positions and records each class in symmetric_moves
+        """
+        representatives = {}
+        for action in legal_actions:
+            key = self.state_key(self.env_state.move(action))
+            move_id = action.x_coordinate*3 + action.y_coordinate
+            if key in representatives:
+                self.symmetric_moves[representatives[key][1]].append(move_id)
+            else:
+                representatives[key] = (action, move_id)
+                self.symmetric_moves[move_id] = [move_id]
+        return [action for action, move_id in representatives.values()]
+
+    def state_key(self, env_state):
+        """
+        Transposition key of a state reached from this node, canonicalized 
+        over board symmetries when use_symmetry is set
+        """
+        if self.use_symmetry:
+            return canonical_state_key(env_state)
+        return env_state.hash_key()
         
     @property
     def n(self):
         return self.number_of_visits
 
-    def expand(self):
+    def expand(self, rng=np.random):
         n_untried_actions = len(self.untried_actions)
         if n_untried_actions > 0:
-            random_action = np.random.randint(n_untried_actions)
+            random_action = rng.randint(n_untried_actions)
             action = self.untried_actions[random_action]
             self.untried_actions.remove(action)
             
+            if self.child_n is None:
+                n_actions = n_untried_actions + len(self.actions)
+                self.child_n = np.zeros(n_actions, dtype=int)
+                self.child_mean = np.zeros(n_actions)
+                self.child_stddev = np.zeros(n_actions)
+            
             next_env_state = self.env_state.move(action)
             move_id = action.x_coordinate*3 + action.y_coordinate
             state_action = StateActionNode(next_env_state, self, move_id)
+            state_action.index = len(self.actions)
+            if self.use_symmetry:
+                state_action.move_ids = self.symmetric_moves[move_id]
             self.actions.append(state_action)
         else:
-            ns = [ actions.n  for actions in self.actions ]
+            ns = self.child_n
             ns_min_arg = np.argmin(ns)
             
             if ns[ns_min_arg] > 1:
@@ -142,25 +205,75 @@ class StateNode(Node):
         #     return next_state_node
 
 
-    def rollout(self):
+    def rollout(self, rng=np.random):
+        game_result, length = self.play_out(rng)
+        return self.reward(game_result)
+
+    def play_out(self, rng=np.random):
+        """
+        Plays random moves from this node to the end of the game and returns
+        the game result and the number of moves played
+        """
+        if self.env_state.supports_push_pop:
+            return self.play_out_in_place(rng)
+
         current_env_state = self.env_state
+        length = 0
         # current_env_state.print_board()
         #reward = current_env_state.get_reward()
         while not current_env_state.is_game_over():
             # find a ransom child state-action node
             possible_moves = current_env_state.get_legal_actions()
-            action = self.rollout_policy(possible_moves)
+            action = self.rollout_policy(possible_moves, rng)
             current_env_state = current_env_state.move(action)
+            length += 1
         
-        if(current_env_state.game_result == self.env_state.player):
+        return current_env_state.game_result, length
+
+    def play_out_in_place(self, rng=np.random):
+        # play the whole game on a single scratch state with push()
+        scratch_state = self.env_state.copy()
+        length = 0
+        while not scratch_state.is_game_over():
+            possible_moves = scratch_state.legal_action_indices()
+            scratch_state.push(self.rollout_policy(possible_moves, rng))
+            length += 1
+
+        return scratch_state.game_result, length
+
+    def reward(self, game_result):
+        if game_result == self.player:
             return 1
-        elif current_env_state.game_result == 0:
+        elif game_result == 0:
             return 0.5
         else:
             return 0
 
+    def rollouts(self, k, rng=np.random):
+        """
+        Runs k random rollouts from this node and returns their rewards,
+        through the vectorized batch engine when the game supports it.
+        """
+        if not supports_batch_rollout(self.env_state):
+            return np.array([self.rollout(rng) for _ in range(k)], dtype=float)
+
+        results = batch_rollout_states([self.env_state], k, rng)[0]
+        rewards = np.zeros(k)
+        rewards[results == self.player] = 1
+        rewards[results == 0] = 0.5
+        return rewards
+
 
     def backpropagate(self, reward):
+        value_function = self.update(reward)
+        
+        if self.prev_node:
+            self.prev_node.backpropagate(value_function)
+
+    def update(self, reward):
+        """
+        Updates this node only and returns the value passed to its parent
+        """
         self.number_of_visits += 1
         # print("n=" + str(self.number_of_visits))
         
@@ -168,8 +281,27 @@ class StateNode(Node):
         self.value_function = self.value_function*(self.n - 1)/self.n + (1/self.n)*reward 
         # print("new_vf=" + str(self.value_function))           
         
+        return self.value_function
+
+    def backpropagate_batch(self, rewards):
+        """
+        Same as calling backpropagate() once per reward, in order, but with
+        one vectorized update per node on the way to the root.
+        """
+        value_functions = self.update_batch(rewards)
+
         if self.prev_node:
-            self.prev_node.backpropagate(self.value_function)
+            self.prev_node.backpropagate_batch(value_functions)
+
+    def update_batch(self, rewards):
+        k = len(rewards)
+        counts = self.number_of_visits + np.arange(1, k + 1)
+        value_functions = (self.value_function*self.number_of_visits + np.cumsum(rewards)) / counts
+
+        self.number_of_visits += k
+        self.value_function = value_functions[-1]
+        
+        return value_functions
 
 
     def is_fully_expanded(self):
@@ -179,21 +311,23 @@ class StateNode(Node):
         if not self.is_fully_expanded():
             return True
         
-        ns = [ actions.n  for actions in self.actions ]
-        ns_min_arg = np.argmin(ns)
-        
-        if ns[ns_min_arg] > 1:
-            return False
-        else:
-            return True
+        return self.child_n.min() <= 1
+
+    def child_statistics(self):
+        """
+        Returns the arrays of visit counts, Q means and Q standard deviations 
+        of the expanded child state-action nodes
+        """
+        n_actions = len(self.actions)
+        return self.child_n[:n_actions], self.child_mean[:n_actions], self.child_stddev[:n_actions]
 
 
     def is_terminal_node(self):
         return self.env_state.is_game_over()
 
 
-    def rollout_policy(self, possible_moves):        
-        return possible_moves[np.random.randint(len(possible_moves))]
+    def rollout_policy(self, possible_moves, rng=np.random):        
+        return possible_moves[rng.randint(len(possible_moves))]
 
 
     def plot_node(self, digraph, draw_node_name="node", first_layer=False):
@@ -221,6 +355,14 @@ class StateNode(Node):
 # -
 
 class StateActionNode(Node):
+
+    # Debug mode: also keep every Q sample in q_value_samples. Mean and
+    # standard deviation are always maintained as running statistics.
+    keep_samples = False
+    
+    # value credited to each pending (virtual) visit in the statistics seen
+    # by tree policies, i.e. a virtual loss
+    virtual_loss = 0
     
     def __init__(self,env_state, state_node, move_id):
         super().__init__()
@@ -230,51 +372,132 @@ class StateActionNode(Node):
         self.state_node = state_node
         
         self.move_id = move_id
+        # all moves merged into this node by symmetry, move_id first
+        self.move_ids = [move_id]
+        # position in state_node.actions and in its child statistics arrays
+        self.index = None
         
         self.q_value_samples = []
         self.q_value_mean = 0
+        self.q_value_m2 = 0
         self.q_value_stddev = 0
         
-        self.actions_explored = []
-        self.next_state_nodes = []
+        # walks through this node whose roll-out is still pending
+        self.virtual_visits = 0
+        
+        # explored opponent replies, move id (or canonical state key with
+        # symmetry) -> next StateNode
+        self.next_state_nodes = {}
 
     @property
     def n(self):
         return self.number_of_visits
 
-    def expand(self):
+    def expand(self, transposition_table=None, rng=np.random):
+        """
+        Samples a random opponent reply and returns the resulting StateNode,
+        creating it on the first visit. With a transposition table, a node
+        already created for the same position elsewhere in the tree is reused.
+        """
+        use_symmetry = self.state_node.use_symmetry
+        if self.env_state.is_game_over():
+            # the action ends the game, it has a single terminal successor
+            if None not in self.next_state_nodes:
+                self.next_state_nodes[None] = StateNode(self.env_state, self, use_symmetry)
+            return self.next_state_nodes[None]
+        
         legal_actions = self.env_state.get_legal_actions()
-        random_action = np.random.randint(len(legal_actions))
+        random_action = rng.randint(len(legal_actions))
         action = legal_actions[random_action]
         
-        if action in self.actions_explored:
-            # return stateaction from df linked with action
-            index = np.where(action == self.actions_explored)
-            return self.next_state_nodes[index]
-        else: 
-            self.actions_explored.append(action)
-        
+        if use_symmetry:
+            # symmetric replies share one node, sampled with their total weight
             next_env_state = self.env_state.move(action)
-            next_state_node = StateNode(next_env_state, self)
+            action_id = self.state_node.state_key(next_env_state)
+        else:
+            next_env_state = None
+            action_id = action.x_coordinate*3 + action.y_coordinate
+        
+        next_state_node = self.next_state_nodes.get(action_id)
+        if next_state_node is None:
+            if next_env_state is None:
+                next_env_state = self.env_state.move(action)
+            if transposition_table is not None:
+                key = self.state_node.state_key(next_env_state)
+                next_state_node = transposition_table.get(key)
+                if next_state_node is None:
+                    next_state_node = StateNode(next_env_state, self, use_symmetry)
+                    transposition_table.put(key, next_state_node)
+            else:
+                next_state_node = StateNode(next_env_state, self, use_symmetry)
             
-            self.next_state_nodes.append(next_state_node)
+            self.next_state_nodes[action_id] = next_state_node
         
-            return next_state_node
+        return next_state_node
 
     def backpropagate(self, value_function):
+        self.state_node.backpropagate(self.update(value_function))
+
+    def update(self, value_function):
+        """
+        Updates this node only and returns the value passed to its parent
+        """
         self.number_of_visits += 1
 
         q_hat = value_function #+ R(x,a)
-        self.q_value_samples.append(q_hat)
+        if self.keep_samples:
+            self.q_value_samples.append(q_hat)
         
+        # Welford's running mean and sum of squared deviations
+        delta = q_hat - self.q_value_mean
+        self.q_value_mean += delta / self.number_of_visits
+        self.q_value_m2 += delta * (q_hat - self.q_value_mean)
+        self.update_stddev()
+
+        return self.q_value_mean
+
+    def backpropagate_batch(self, value_functions):
+        self.state_node.backpropagate_batch(self.update_batch(value_functions))
+
+    def update_batch(self, value_functions):
+        k = len(value_functions)
+        n = self.number_of_visits
+        counts = n + np.arange(1, k + 1)
+        q_value_means = (self.q_value_mean*n + np.cumsum(value_functions)) / counts
+
+        if self.keep_samples:
+            self.q_value_samples.extend(value_functions.tolist())
+
+        # Chan et al. parallel update of the sum of squared deviations
+        batch_mean = value_functions.mean()
+        batch_m2 = ((value_functions - batch_mean)**2).sum()
+        delta = batch_mean - self.q_value_mean
+        self.q_value_m2 += batch_m2 + delta*delta * n*k / (n + k)
+
+        self.number_of_visits += k
+        self.q_value_mean = q_value_means[-1]
+        self.update_stddev()
+
+        return q_value_means
+
+    def update_stddev(self):
         if self.number_of_visits > 1:
-            self.q_value_mean = stats.mean(self.q_value_samples)
-            self.q_value_stddev = stats.stdev(self.q_value_samples)
+            self.q_value_stddev = math.sqrt(max(self.q_value_m2, 0) / (self.number_of_visits - 1))
         else:
-            self.q_value_mean = q_hat
             self.q_value_stddev = 0
-
-        self.state_node.backpropagate(self.q_value_mean)
+        self.update_parent_statistics()
+
+    def update_parent_statistics(self):
+        state_node = self.state_node
+        if self.virtual_visits:
+            n = self.number_of_visits + self.virtual_visits
+            state_node.child_n[self.index] = n
+            state_node.child_mean[self.index] = (self.q_value_mean*self.number_of_visits 
+                                                 + self.virtual_loss*self.virtual_visits) / n
+        else:
+            state_node.child_n[self.index] = self.number_of_visits
+            state_node.child_mean[self.index] = self.q_value_mean
+        state_node.child_stddev[self.index] = self.q_value_stddev
 
     def plot_node(self, digraph, draw_node_name="node", first_layer=False):
         node_info = self.get_info()
@@ -282,7 +505,7 @@ class StateActionNode(Node):
         
         if not first_layer:
             it = 0
-            for s in self.next_state_nodes:
+            for s in self.next_state_nodes.values():
                 state_name = draw_node_name + str(it)
                 it += 1
                 s.plot_node(digraph, state_name)
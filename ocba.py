@@ -10,8 +10,21 @@ import numpy as np
 import math
 
 class OCBA():
-    def __init__(self):
+    def __init__(self, resolve_degenerate=False):
+        """
+        Parameters
+        ----------
+        resolve_degenerate : bool
+            False (default) allocates exactly as the original scalar solver:
+            the second best is searched with the best design's mean set to 0,
+            so it is the best design itself when every other mean is <= 0,
+            and zero-variance designs give NaN / inf ratios.
+            True searches the second best among the other designs only and
+            resolves zero-variance designs to the limit of their ratio, see
+            calculate_ratio(), so the ratios never contain NaNs.
+        """
         self.prev_prop = None
+        self.resolve_degenerate = resolve_degenerate
 
     def choose_best_np(self, J_est):
         best = np.unravel_index(np.argmax(J_est, axis=None), J_est.shape)
@@ -21,65 +34,79 @@ class OCBA():
     def choose_second_best_np(self, J_est):
         best = np.unravel_index(np.argmax(J_est, axis=None), J_est.shape)
         
-        new_J_est = np.copy(J_est)
-        new_J_est[best] = 0
+        new_J_est = np.array(J_est, dtype=float)
+        new_J_est[best] = -np.inf if self.resolve_degenerate else 0
         sec_best = np.unravel_index(np.argmax(new_J_est, axis=None), new_J_est.shape)
         
         return int(sec_best[0])
     
     def delta(self, k, best, mean):
-        delta = np.zeros(k)
-        for i in range(k):  
-            if i != best :
-                delta[i] = mean[best] - mean[i]
+        delta = mean[best] - np.asarray(mean, dtype=float)
+        delta[best] = 0
         return delta
     
     def calculate_ratio(self, k, mean, std_dev):
+        """
+        Vectorized OCBA allocation ratios, the same values as the loops of
+        the original solver (ties with the best design get the ratio of the
+        second best).
+
+        With resolve_degenerate, degenerate designs (zero variance) are 
+        resolved to their limit: a design whose ratio is infinite takes the
+        whole allocation (shared with other infinite ones) and 0/0 counts as
+        0, so the result never contains NaNs.
+        """
+        mean = np.asarray(mean, dtype=float)
+        std_dev = np.asarray(std_dev, dtype=float)
     
         # Find best and second best
         best = self.choose_best_np(mean)
-        # if best == 0:
-        #     second_best = 1
-        # else:
-        #     second_best = 0
         second_best = self.choose_second_best_np(mean)
+        others = np.arange(len(mean)) != best
         
-        ratio = np.zeros(k)
-        
-        ratio[second_best] = 1.0
-        
-        for j in range(k): 
-            if ((j != best) and (j != second_best)):
-                if mean[best] == mean[j]:
-                    ratio[j] = 1.0
-                else:
-                    temp = std_dev[j]*(mean[best] - mean[second_best])/(std_dev[second_best]*(mean[best] - mean[j]))
-                    ratio[j] = temp*temp
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = std_dev*(mean[best] - mean[second_best])/(std_dev[second_best]*(mean[best] - mean))
+            ratio = ratio*ratio
+            ratio[mean == mean[best]] = 1.0
+            ratio[second_best] = 1.0
+            if self.resolve_degenerate:
+                ratio[np.isnan(ratio)] = 0.0
                 
-        # Now we calculate the ratio of design b
-        #given that we know the ratios of the other designs
-        temp = 0
-        for j in range(k):
-            if j != best:
-                temp += (ratio[j]/std_dev[j])**2
+            # Now we calculate the ratio of design b
+            #given that we know the ratios of the other designs
+            temp = (ratio/std_dev)**2
+            if self.resolve_degenerate:
+                temp[np.isnan(temp)] = 0.0
+            # summed in design order, as the original loop did
+            ratio[best] = math.sqrt(sum(temp[others].tolist()))*std_dev[best]
         
-        ratio[best] = math.sqrt(temp)*std_dev[best]
+        if self.resolve_degenerate:
+            if np.isnan(ratio[best]):
+                ratio[best] = 0.0
+            if np.isinf(ratio).any():
+                ratio = np.isinf(ratio).astype(float)
         
         # Now implement a simple calculation that gives the fraction required 
         #for each design i (incl b)
-        new_ratio = np.zeros(k)
-        
-        
-        for i in range(k):
-            if ratio.sum() > 0:
-                new_ratio[i] =  ratio[i] / ratio.sum()
-            else:
-                new_ratio[i] =  ratio[i]
+        ratio_sum = ratio.sum()
+        if ratio_sum > 0:
+            with np.errstate(invalid='ignore'):
+                ratio = ratio / ratio_sum
     
         # Returns an array of fractions, whose sum of course equals 1
-        return new_ratio
-    
+        return ratio
     
+    def previous_ratio(self, no_sims):
+        """
+        Share of the simulations of every design; without any simulation it
+        is NaN like in the original solver, or 0 with resolve_degenerate
+        """
+        no_sims = np.asarray(no_sims, dtype=float)
+        total_n = no_sims.sum()
+        if total_n > 0 or not self.resolve_degenerate:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return no_sims/total_n
+        return np.zeros(len(no_sims))
     
     def OCBA_Starving(self, k, no_sims, mean, std_dev):
         """
@@ -107,22 +134,15 @@ class OCBA():
         #     self.prev_prop = np.full(k, 0)
             
         # Calculate current_n_ratio
-        total_n = 0
-        for i in range(k):
-            total_n += no_sims[i]
-        previous_n_ratio = no_sims/total_n
+        previous_n_ratio = self.previous_ratio(no_sims)
     
         new_n_ratio = self.calculate_ratio(k, mean, std_dev)
         
-        difference_n_ratio = np.zeros(k)
-        for i in range(k):
-            # difference_n_ratio[i] = new_n_ratio[i] - self.prev_prop[i]
-            difference_n_ratio[i] = new_n_ratio[i] - previous_n_ratio[i]
-            
-        # self.prev_prop = new_n_ratio
+        difference_n_ratio = new_n_ratio - previous_n_ratio
         
-        # Finds the index of the design with the biggest difference
-        starving = np.where(difference_n_ratio == difference_n_ratio.max())[0][0]
+        # Finds the index of the design with the biggest difference (the
+        # first NaN one if any, where the original solver raised IndexError)
+        starving = int(np.argmax(difference_n_ratio))
          
         return starving
 
@@ -153,22 +173,112 @@ class OCBA():
         #     self.prev_prop = np.full(k, 0)
             
         # Calculate current_n_ratio
-        total_n = 0
-        for i in range(k):
-            total_n += no_sims[i]
-        previous_n_ratio = no_sims/total_n
+        previous_n_ratio = self.previous_ratio(no_sims)
     
         new_n_ratio = self.calculate_ratio(k, mean, std_dev)
         
-        difference_n_ratio = np.zeros(k)
-        for i in range(k):
-            difference_n_ratio[i] = new_n_ratio[i] - previous_n_ratio[i]
+        difference_n_ratio = new_n_ratio - previous_n_ratio
                    
         starving_list = np.argsort(-difference_n_ratio)
          
         return starving_list
 
 
+    def APCS(self, k, no_sims, mean, std_dev):
+        """
+        Approximate probability of correct selection (APCS-B) of the design
+        with the highest mean, a Bonferroni lower bound
+        
+            APCS = 1 - sum_{i != b} P(J_i > J_b)
+        
+        with normal approximations of the sample means.
+    
+        Parameters
+        ----------
+        k       : int
+                number of designs to compare
+        no_sims : np.array()
+                array with number of simulations for each design k
+        mean    : np.array()
+                array with mean values from k designs
+        std_dev : np.array()
+                array with standard deviation of mean values from k designs
+        
+        Returns
+        -------
+        apcs : float
+             in [0, 1]
+        """
+        if k < 2:
+            return 1.0
+        no_sims = np.asarray(no_sims, dtype=float)
+        mean = np.asarray(mean, dtype=float)
+        std_dev = np.asarray(std_dev, dtype=float)
+        
+        best = self.choose_best_np(mean)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = std_dev**2/no_sims
+            z = (mean[best] - mean)/np.sqrt(variance[best] + variance)
+        # a zero spread with a positive gap is certain, a tie is a coin flip
+        z[np.isnan(z)] = 0.0
+        
+        p_wrong = sum(0.5*math.erfc(z_i/math.sqrt(2)) for i, z_i in enumerate(z) if i != best)
+        
+        return max(0.0, 1.0 - p_wrong)
+
+    def OCBA_Plan(self, k, no_sims, mean, std_dev, delta):
+        """
+        This function allocates a budget increment of `delta` replications at
+        once. The OCBA target for the new total budget is computed, each design
+        gets a share of `delta` proportional to how far it is below its target,
+        and the replications are ordered by interleaving the designs from the
+        most to the least starving.
+    
+        Parameters
+        ----------
+        k       : int
+                number of designs to compare
+        no_sims : np.array()
+                array with number of simulations for each design k
+        mean    : np.array()
+                array with mean values from k designs
+        std_dev : np.array()
+                array with standard deviation of mean values from k designs
+        delta   : int
+                number of replications to allocate
+        
+        Returns
+        -------
+        plan : list
+             design indices of the next `delta` replications, in order
+        """
+        no_sims = np.asarray(no_sims, dtype=float)
+        
+        new_n_ratio = self.calculate_ratio(k, mean, std_dev)
+        if new_n_ratio.sum() == 0:
+            new_n_ratio = np.full(k, 1/k)
+        
+        target = new_n_ratio*(no_sims.sum() + delta)
+        deficit = np.maximum(target - no_sims, 0)
+        share = deficit/deficit.sum()*delta
+        
+        # largest remainder rounding of the shares
+        allocation = np.floor(share).astype(int)
+        remainder = delta - allocation.sum()
+        allocation[np.argsort(allocation - share, kind='stable')[:remainder]] += 1
+        
+        starving_list = np.argsort(-(new_n_ratio - self.previous_ratio(no_sims)))
+        
+        plan = []
+        while len(plan) < delta:
+            for i in starving_list:
+                if allocation[i] > 0:
+                    plan.append(int(i))
+                    allocation[i] -= 1
+                    
+        return plan
+
+
     
     
     
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parallel Monte Carlo Tree Search.
+
+Root parallelism: every worker process builds an independent tree from the
+same root state with its own seed, and the statistics of the root actions are
+merged.
+
+Tree parallelism: one shared tree is descended repeatedly with virtual loss,
+so that the paths in flight spread over the tree, the roll-outs of the leaves
+run in worker processes and the coordinator backpropagates them as they come
+back, walking the next paths while the workers play.
+"""
+
+import math
+import time
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+from collections import deque
+
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from rng import BufferedRandom
+from tictactoe import state_bitboards
+from batch_rollout import batch_rollout, supports_batch_rollout
+
+
+def root_action_statistics(root):
+    """
+    Returns {move_id: (n, mean, m2)} for every expanded action of a root
+    StateNode, moves merged by symmetry each get their shared statistics.
+    """
+    return {move_id: (action.n, action.q_value_mean, action.q_value_m2)
+            for action in root.actions for move_id in action.move_ids}
+
+
+def merge_action_statistics(statistics):
+    """
+    Merges lists of {move_id: (n, mean, m2)} with the parallel mean and 
+    variance update, returns the merged dictionary.
+    """
+    merged = {}
+    for worker_statistics in statistics:
+        for move_id, (n_b, mean_b, m2_b) in worker_statistics.items():
+            if n_b == 0:
+                continue
+            n_a, mean_a, m2_a = merged.get(move_id, (0, 0.0, 0.0))
+            n = n_a + n_b
+            delta = mean_b - mean_a
+            merged[move_id] = (n, mean_a + delta*n_b/n, m2_a + m2_b + delta*delta*n_a*n_b/n)
+    return merged
+
+
+def _root_search_worker(args):
+    root_env_state, tree_policy, N, seed, use_symmetry, rollouts_per_leaf = args
+    mcts = MonteCarloTreeSearch(StateNode(root_env_state, use_symmetry=use_symmetry), tree_policy,
+                                seed=seed)
+    mcts.search(N, rollouts_per_leaf)
+    return root_action_statistics(mcts.root_state)
+
+
+class RootParallelSearch():
+    def __init__(self, root_env_state, tree_policy, n_workers=None, use_symmetry=False):
+        """
+        Parameters
+        ----------
+        root_env_state : game state at the root, shared by all the workers
+        tree_policy : TreePolicy used by every worker
+        n_workers : number of worker processes, defaults to the CPU count
+        use_symmetry : see StateNode
+
+        The worker processes are started once and reused by every search 
+        until close() is called.
+        """
+        self.root_env_state = root_env_state
+        self.tree_policy = tree_policy
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.use_symmetry = use_symmetry
+        
+        self.pool = multiprocessing.Pool(self.n_workers)
+        self.statistics = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def search(self, N, seed=None, root_env_state=None, rollouts_per_leaf=1):
+        """
+        Parameters
+        ----------
+        N : total simulation budget (roll-out number), split evenly between 
+            the workers
+        seed : seed of this search, each worker gets an independent seed 
+               spawned from it
+        root_env_state : optional new root state, e.g. after a move was played
+
+        Output
+        ----------
+        DataFrame with the merged Q mean, standard deviation and visit count 
+        of every root action
+        """
+        if root_env_state is not None:
+            self.root_env_state = root_env_state
+        
+        seeds = [int(child.generate_state(1)[0]) 
+                 for child in np.random.SeedSequence(seed).spawn(self.n_workers)]
+        budgets = [N // self.n_workers + (w < N % self.n_workers) for w in range(self.n_workers)]
+        tasks = [(self.root_env_state, self.tree_policy, budget, worker_seed, 
+                  self.use_symmetry, rollouts_per_leaf)
+                 for budget, worker_seed in zip(budgets, seeds) if budget > 0]
+        
+        self.statistics = merge_action_statistics(self.pool.map(_root_search_worker, tasks))
+
+        return self.root_statistics()
+
+    def root_statistics(self):
+        indexes = sorted(self.statistics)
+        ns = [self.statistics[move_id][0] for move_id in indexes]
+        q_values = [self.statistics[move_id][1] for move_id in indexes]
+        stddevs = [math.sqrt(self.statistics[move_id][2]/(n - 1)) if n > 1 else 0.0 
+                   for n, move_id in zip(ns, indexes)]
+
+        return pd.DataFrame({'Q': q_values, 'N': ns, 'stddev': stddevs}, index=indexes)
+
+    def best_action(self):
+        """ move id of the root action with the highest merged Q value """
+        return max(self.statistics, key=lambda move_id: self.statistics[move_id][1])
+
+
+def _leaf_payload(env_states):
+    """
+    Compact description of the leaves sent to a worker: three small integer
+    arrays (O masks, X masks, side to move) for 3x3 boards, the game states
+    themselves otherwise.
+    """
+    if all(supports_batch_rollout(env_state) for env_state in env_states):
+        bitboards = np.array([state_bitboards(env_state) for env_state in env_states], dtype=np.int16)
+        players = np.array([env_state.player for env_state in env_states], dtype=np.int8)
+        return bitboards[:, 0], bitboards[:, 1], players
+    return env_states
+
+
+def _rollout_worker(args):
+    leaves, seed, rollouts_per_leaf = args
+    rng = BufferedRandom(seed)
+    if isinstance(leaves, tuple):
+        return batch_rollout(*leaves, rollouts_per_leaf, rng)
+    node = StateNode(leaves[0])
+    results = []
+    for env_state in leaves:
+        node.env_state = env_state
+        results.append([node.play_out(rng)[0] for _ in range(rollouts_per_leaf)])
+    return np.array(results, dtype=np.int8)
+
+
+class TreeParallelSearch():
+    def __init__(self, root_state, tree_policy, n_workers=None, leaves_per_worker=8, 
+                 transposition_table=None, seed=None):
+        """
+        Parameters
+        ----------
+        root_state : root StateNode x0 of the shared tree
+        tree_policy : TreePolicy, TreePolicy_UCB and the OCBA policies see 
+                      the virtual visits through the child statistics arrays
+        n_workers : number of roll-out worker processes, defaults to the CPU 
+                    count
+        leaves_per_worker : leaves sent to a worker in one task, up to 
+                            2 * n_workers tasks are in flight at a time
+        transposition_table : see MonteCarloTreeSearch
+        seed : seed of the tree descents and of the worker roll-outs
+
+        The tree is descended by the coordinator, with virtual loss applied 
+        to every path until its roll-out comes back, so the paths in flight 
+        behave like concurrent walkers kept off each other's paths.
+        """
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.mcts = MonteCarloTreeSearch(root_state, tree_policy, transposition_table,
+                                         seed=self.seed_sequence.spawn(1)[0])
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.leaves_per_worker = leaves_per_worker
+        
+        self.pool = multiprocessing.Pool(self.n_workers)
+        
+        self.rollouts = 0
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    @property
+    def root_state(self):
+        return self.mcts.root_state
+
+    @property
+    def rollouts_per_second(self):
+        return self.rollouts / self.elapsed if self.elapsed > 0 else 0.0
+
+    def search(self, N, rollouts_per_leaf=1):
+        """
+        Parameters
+        ----------
+        N : simulation budget (roll-out number)
+        rollouts_per_leaf : roll-outs run by the worker for every leaf
+
+        Output
+        ----------
+        DataFrame with the Q value and visit count of every root action
+
+        The search is pipelined: while up to 2 * n_workers tasks of 
+        leaves_per_worker leaves are out with the workers, the coordinator 
+        walks the paths of the next task. Results are backpropagated in 
+        submission order, which keeps a seeded search reproducible. Terminal 
+        leaves are scored by the coordinator and never sent out.
+
+        The tree walks and backpropagation stay serial in the coordinator. 
+        On tic-tac-toe they take about 90% of a serial iteration (tree_walk 
+        78-89%, backpropagate 6-12%) against 3-6% for the roll-out, so by 
+        Amdahl's law the speedup is bounded by about 1.1 however many workers
+        run; the pool pays off when roll-outs are expensive. Measured with 
+        N = 4000 from the position after O plays (0, 0), on a single-CPU 
+        machine, the tree-parallel search runs at 40-60% of the serial 
+        roll-out rate with UCB and 55-85% with OCBA, with 1, 2 or 4 workers 
+        alike: they share that one CPU, so there is no scaling to see.
+        """
+        max_in_flight = 2 * self.n_workers
+        in_flight = deque()
+        
+        start = time.perf_counter()
+        n = 0
+        while n < N or in_flight:
+            while n < N and len(in_flight) < max_in_flight:
+                paths = []
+                while n < N and len(paths) < self.leaves_per_worker:
+                    self.mcts.tree_walk()
+                    path = self.mcts.path
+                    leaf = path[-1]
+                    if leaf.is_terminal_node():
+                        if rollouts_per_leaf == 1:
+                            self.mcts.backpropagate(leaf.rollout(self.mcts.rng), path)
+                        else:
+                            self.mcts.backpropagate_batch(leaf.rollouts(rollouts_per_leaf, self.mcts.rng), path)
+                    else:
+                        self.mcts.apply_virtual_loss(path)
+                        paths.append(path)
+                    n += rollouts_per_leaf
+                if paths:
+                    task = (_leaf_payload([path[-1].env_state for path in paths]),
+                            self.seed_sequence.spawn(1)[0], rollouts_per_leaf)
+                    in_flight.append((paths, self.pool.apply_async(_rollout_worker, (task,))))
+            
+            if in_flight:
+                paths, pending = in_flight.popleft()
+                for path, results in zip(paths, pending.get()):
+                    leaf = path[-1]
+                    self.mcts.revert_virtual_loss(path)
+                    if rollouts_per_leaf == 1:
+                        self.mcts.backpropagate(leaf.reward(results[0]), path)
+                    else:
+                        rewards = np.where(results == leaf.player, 1.0, np.where(results == 0, 0.5, 0.0))
+                        self.mcts.backpropagate_batch(rewards, path)
+        
+        self.rollouts += n
+        self.elapsed += time.perf_counter() - start
+
+        return self.mcts.root_statistics()
+
+    def best_action(self):
+        return self.mcts.best_action()
+
+
+def benchmark_scaling(root_env_state, tree_policy, worker_counts, N, leaves_per_worker=8, 
+                      rollouts_per_leaf=1, seed=0):
+    """
+    Runs a tree-parallel search of N roll-outs for every worker count and 
+    reports the throughput.
+
+    Output
+    ----------
+    DataFrame indexed by worker count with the elapsed seconds, the 
+    roll-outs per second and the speedup over the first worker count
+    """
+    rows = []
+    for n_workers in worker_counts:
+        with TreeParallelSearch(StateNode(root_env_state), tree_policy, n_workers,
+                                leaves_per_worker, seed=seed) as search:
+            search.search(N, rollouts_per_leaf)
+            rows.append((n_workers, search.elapsed, search.rollouts_per_second))
+    
+    df = pd.DataFrame(rows, columns=['workers', 'seconds', 'rollouts_per_sec']).set_index('workers')
+    df['speedup'] = df['rollouts_per_sec'] / df['rollouts_per_sec'].iloc[0]
+    
+    return df
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parallel, resumable PCS (probability of correct selection) experiment.
+
+Every work unit is one (policy, repetition, N) search. Units are seeded
+deterministically from (seed, policy, repetition), so the units of one
+(policy, repetition) pair are run together as a single checkpointed search
+(MonteCarloTreeSearch.search_checkpoints) and give the same result as
+separate searches. Results are appended to a JSON-lines store as they come
+in, and completed units are skipped when the experiment is restarted.
+
+In adaptive mode (--target-half-width) each (policy, N) cell gets more
+repetitions only until its confidence interval is narrow enough, and new
+searches go to the cells with the widest intervals first.
+
+Usage:
+    python pcs_experiment.py results.jsonl --repetitions 1000 --workers 8
+    python pcs_experiment.py results.jsonl --target-half-width 0.02 --repetitions 10000
+"""
+
+import os
+import json
+import zlib
+import argparse
+import queue
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+from statistics import NormalDist
+
+from tictactoe import TicTacToeBitboardState, TicTacToeMove
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from tree_policy import POLICIES
+
+# the experiment of the paper and of TicTacToe-results.ipynb
+DEFAULT_BUDGETS = [int(n) for n in np.linspace(300, 700, num=9, dtype=int, endpoint=True)]
+DEFAULT_OPENING = [0]
+DEFAULT_BEST_MOVE = 4
+
+
+def opening_state(opening, first_player=1):
+    """ root state after playing the move ids in `opening` from the empty board """
+    state = TicTacToeBitboardState(player=first_player)
+    for move_id in opening:
+        state = state.move(TicTacToeMove(move_id // 3, move_id % 3, state.player))
+    return state
+
+
+def unit_seed(seed, policy, repetition):
+    """ seed of the search of one (policy, repetition) pair """
+    return np.random.SeedSequence([seed, zlib.crc32(policy.encode()), repetition])
+
+
+def run_unit(args):
+    """
+    Runs the missing budgets of one (policy, repetition) pair with a single
+    checkpointed search, returns one result row per budget.
+    """
+    policy, repetition, budgets, opening, seed = args
+    root = StateNode(opening_state(opening))
+    mcts = MonteCarloTreeSearch(root, POLICIES[policy](), seed=unit_seed(seed, policy, repetition))
+    results = mcts.search_checkpoints(sorted(budgets))
+    
+    return [{'policy': policy, 'repetition': repetition, 'n': int(n), 
+             'best_action': int(result['best_action'])}
+            for n, result in results.items()]
+
+
+class ResultStore():
+    """
+    Append-only JSON-lines file. The first line records the configuration
+    of the experiment, every other line is one completed work unit.
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.rows = []
+        
+        if os.path.exists(path):
+            self.drop_partial_line()
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path) as f:
+                stored_config = json.loads(f.readline())['config']
+                if stored_config != config:
+                    raise ValueError("{0} was written by an experiment with config {1}".format(path, stored_config))
+                for line in f:
+                    # a line garbled by an interruption is simply redone
+                    try:
+                        self.rows.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass
+        else:
+            with open(path, 'w') as f:
+                f.write(json.dumps({'config': config}) + '\n')
+
+    def drop_partial_line(self):
+        """
+        Truncates the file after its last newline, so that appends do not 
+        continue a line cut short by an interrupted write
+        """
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+
+    def completed(self):
+        return {(row['policy'], row['repetition'], row['n']) for row in self.rows}
+
+    def append(self, rows):
+        with open(self.path, 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+        self.rows.extend(rows)
+
+    def dataframe(self):
+        return pd.DataFrame(self.rows, columns=['policy', 'repetition', 'n', 'best_action'])
+
+
+def wilson_interval(successes, trials, confidence=0.95):
+    """ Wilson score confidence interval of a binomial proportion """
+    successes = np.asarray(successes, dtype=float)
+    trials = np.asarray(trials, dtype=float)
+    z = NormalDist().inv_cdf(0.5 + confidence/2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = successes / trials
+        center = (p + z*z/(2*trials)) / (1 + z*z/trials)
+        half_width = z*np.sqrt(p*(1 - p)/trials + z*z/(4*trials*trials)) / (1 + z*z/trials)
+    return center - half_width, center + half_width
+
+
+def aggregate_pcs(results, best_move=DEFAULT_BEST_MOVE, confidence=0.95):
+    """
+    Parameters
+    ----------
+    results : DataFrame of result rows (policy, repetition, n, best_action)
+    best_move : ground-truth best move id
+    confidence : level of the Wilson confidence intervals
+
+    Output
+    ----------
+    DataFrame indexed by (policy, n) with the PCS, its confidence interval
+    and the number of repetitions
+    """
+    correct = (results['best_action'] == best_move).rename('correct')
+    grouped = correct.groupby([results['policy'], results['n']])
+    df = pd.DataFrame({'pcs': grouped.mean(), 'repetitions': grouped.size(), 
+                       'correct': grouped.sum()})
+    df['lower'], df['upper'] = wilson_interval(df['correct'], df['repetitions'], confidence)
+    
+    return df[['pcs', 'lower', 'upper', 'repetitions']]
+
+
+def run_experiment(store_path, policies=('ucb', 'ocba'), budgets=DEFAULT_BUDGETS, 
+                   repetitions=1000, best_move=DEFAULT_BEST_MOVE, opening=DEFAULT_OPENING,
+                   seed=0, n_workers=None, confidence=0.95, verbose=True):
+    """
+    Runs every (policy, repetition, N) unit missing from the store at 
+    `store_path` on a process pool and returns aggregate_pcs() of the store.
+    """
+    config = {'opening': list(opening), 'seed': seed}
+    store = ResultStore(store_path, config)
+    
+    completed = store.completed()
+    tasks = []
+    for policy in policies:
+        for repetition in range(repetitions):
+            missing = [n for n in budgets if (policy, repetition, n) not in completed]
+            if missing:
+                tasks.append((policy, repetition, missing, list(opening), seed))
+    
+    if tasks:
+        with multiprocessing.Pool(n_workers) as pool:
+            for done, rows in enumerate(pool.imap_unordered(run_unit, tasks, chunksize=4), 1):
+                store.append(rows)
+                if verbose and (done % 100 == 0 or done == len(tasks)):
+                    print("{0}/{1} searches done".format(done, len(tasks)), flush=True)
+    
+    results = store.dataframe()
+    results = results[results['policy'].isin(policies) & results['n'].isin(budgets)
+                      & (results['repetition'] < repetitions)]
+    return aggregate_pcs(results, best_move, confidence)
+
+
+class AdaptiveScheduler():
+    """
+    Bookkeeping of the adaptive mode. A (policy, N) cell stays open until
+    its Wilson half-width is at most `target_half_width` (after at least
+    `min_repetitions`) or it reaches `max_repetitions`. Repetitions that are
+    still running count towards the half-width with the current PCS
+    estimate, so the pool is not flooded with work for a single cell.
+    """
+
+    def __init__(self, policies, budgets, best_move, target_half_width, 
+                 min_repetitions, max_repetitions, confidence):
+        self.cells = [(policy, n) for policy in policies for n in budgets]
+        self.best_move = best_move
+        self.target_half_width = target_half_width
+        self.min_repetitions = min_repetitions
+        self.max_repetitions = max_repetitions
+        self.confidence = confidence
+        self.correct = {cell: {} for cell in self.cells}
+        self.pending = {cell: set() for cell in self.cells}
+        self.next_repetition = {cell: 0 for cell in self.cells}
+
+    def record(self, row):
+        cell = (row['policy'], row['n'])
+        if cell in self.correct and row['repetition'] < self.max_repetitions:
+            self.correct[cell][row['repetition']] = row['best_action'] == self.best_move
+            self.pending[cell].discard(row['repetition'])
+
+    def half_width(self, cell, pending=True):
+        trials = len(self.correct[cell])
+        if trials == 0:
+            return np.inf
+        pcs = sum(self.correct[cell].values()) / trials
+        if pending:
+            trials += len(self.pending[cell])
+        lower, upper = wilson_interval(pcs*trials, trials, self.confidence)
+        return (upper - lower) / 2
+
+    def is_open(self, cell, pending=True):
+        trials = len(self.correct[cell]) + (len(self.pending[cell]) if pending else 0)
+        if trials >= self.max_repetitions:
+            return False
+        return trials < self.min_repetitions or self.half_width(cell, pending) > self.target_half_width
+
+    def _free_repetition(self, cell):
+        repetition = self.next_repetition[cell]
+        while repetition in self.correct[cell] or repetition in self.pending[cell]:
+            repetition += 1
+        self.next_repetition[cell] = repetition
+        return repetition
+
+    def next_task(self):
+        """ (policy, repetition, budgets) for the widest open cell, or None """
+        open_cells = [cell for cell in self.cells if self.is_open(cell)]
+        if not open_cells:
+            return None
+        policy, n = max(open_cells, key=self.half_width)
+        repetition = self._free_repetition((policy, n))
+        # the same checkpointed search also serves the other open budgets of the policy
+        budgets = [m for (p, m) in open_cells if p == policy 
+                   and repetition not in self.correct[(p, m)] and repetition not in self.pending[(p, m)]]
+        for m in budgets:
+            self.pending[(policy, m)].add(repetition)
+        return policy, repetition, budgets
+
+    def widest(self):
+        return max(self.half_width(cell, pending=False) for cell in self.cells)
+
+
+def run_adaptive_experiment(store_path, policies=('ucb', 'ocba'), budgets=DEFAULT_BUDGETS, 
+                            target_half_width=0.02, min_repetitions=20, max_repetitions=10000,
+                            best_move=DEFAULT_BEST_MOVE, opening=DEFAULT_OPENING, seed=0, 
+                            n_workers=None, confidence=0.95, verbose=True):
+    """
+    Sequential-stopping version of run_experiment(): every (policy, N) cell
+    gets repetitions until the half-width of its confidence interval is at
+    most `target_half_width` or it has `max_repetitions`. Repetitions use
+    the same seeds as run_experiment(), so both modes can share a store.
+    """
+    config = {'opening': list(opening), 'seed': seed}
+    store = ResultStore(store_path, config)
+    scheduler = AdaptiveScheduler(policies, budgets, best_move, target_half_width,
+                                  min_repetitions, max_repetitions, confidence)
+    for row in store.rows:
+        scheduler.record(row)
+    
+    n_workers = n_workers or os.cpu_count()
+    results = queue.Queue()
+    in_flight = 0
+    done = 0
+    with multiprocessing.Pool(n_workers) as pool:
+        while True:
+            # keep the pool busy without committing work too far ahead
+            while in_flight < 2*n_workers:
+                task = scheduler.next_task()
+                if task is None:
+                    break
+                policy, repetition, task_budgets = task
+                pool.apply_async(run_unit, ((policy, repetition, task_budgets, list(opening), seed),),
+                                 callback=results.put, error_callback=results.put)
+                in_flight += 1
+            if in_flight == 0:
+                break
+            
+            rows = results.get()
+            in_flight -= 1
+            if isinstance(rows, BaseException):
+                raise rows
+            store.append(rows)
+            for row in rows:
+                scheduler.record(row)
+            done += 1
+            if verbose and done % 100 == 0:
+                open_cells = sum(scheduler.is_open(cell, pending=False) for cell in scheduler.cells)
+                print("{0} searches done, {1} cells open, widest half-width {2:.4f}".format(
+                    done, open_cells, scheduler.widest()), flush=True)
+    
+    results = store.dataframe()
+    results = results[results['policy'].isin(policies) & results['n'].isin(budgets)
+                      & (results['repetition'] < max_repetitions)]
+    return aggregate_pcs(results, best_move, confidence)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="UCB vs OCBA PCS experiment on Tic-Tac-Toe")
+    parser.add_argument('store', help="JSON-lines result store, created or resumed")
+    parser.add_argument('--policies', nargs='+', default=['ucb', 'ocba'], choices=sorted(POLICIES))
+    parser.add_argument('--budgets', nargs='+', type=int, default=DEFAULT_BUDGETS,
+                        help="simulation budgets N")
+    parser.add_argument('--repetitions', type=int, default=1000,
+                        help="repetitions per cell, the cap in adaptive mode")
+    parser.add_argument('--target-half-width', type=float, default=None,
+                        help="adaptive mode: stop a (policy, N) cell once its CI half-width is below this")
+    parser.add_argument('--min-repetitions', type=int, default=20,
+                        help="adaptive mode: repetitions per cell before it may stop")
+    parser.add_argument('--best-move', type=int, default=DEFAULT_BEST_MOVE,
+                        help="ground-truth best move id at the root")
+    parser.add_argument('--opening', nargs='*', type=int, default=DEFAULT_OPENING,
+                        help="move ids played from the empty board, O first")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--csv', help="also write the PCS table to this file")
+    args = parser.parse_args(argv)
+
+    if args.target_half_width is None:
+        pcs = run_experiment(args.store, args.policies, sorted(args.budgets), args.repetitions,
+                             args.best_move, args.opening, args.seed, args.workers, args.confidence)
+    else:
+        pcs = run_adaptive_experiment(args.store, args.policies, sorted(args.budgets), 
+                                      args.target_half_width, args.min_repetitions, args.repetitions,
+                                      args.best_move, args.opening, args.seed, args.workers, 
+                                      args.confidence)
+    print(pcs.to_string())
+    if args.csv:
+        pcs.to_csv(args.csv)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import random
+import threading
 
 from graphviz import Digraph
 
@@ -317,8 +318,15 @@ class MCTS:
     def __init__(self, player, num_simulations=200):
         self.num_simulations = num_simulations
         self.player = player
+        # tree of the last search and the move chosen at its root
+        self.root = None
+        self.last_action = None
+        # background search during the opponent's turn
+        self._ponder_thread = None
+        self._ponder_stop = threading.Event()
 
     def search(self, root):
+        self.root = root
         for i in range(self.num_simulations):
             node, path = self._select(root)
             value = self._simulate(node)
@@ -327,7 +335,55 @@ class MCTS:
             #self.plot_tree_rollout(root, path, iteration=i)
         # Optionally, plot the full tree after all simulations
         self.plot_full_tree(root)
-        return root.best_child(0).state
+        best_child = root.best_child(0)
+        self.last_action = best_child.action
+        return best_child.state
+
+    def advance(self, action, opponent_action):
+        """ Re-root the last search tree at the node reached by action and
+            the opponent's reply, keeping its subtree and dropping the rest.
+            Falls back to a fresh root when that node was never expanded.
+        """
+        root = self.root
+        node = None
+        if root is not None:
+            child = next((c for c in root.children if c.action == action), None)
+            if child is not None:
+                node = next((c for c in child.children if c.action == opponent_action), None)
+
+        if node is None:
+            state = root.state.move(action).move(opponent_action)
+            node = Node(state)
+        node.parent = None
+        self.root = node
+        return node
+
+    def start_pondering(self):
+        """ Keep simulating below the move just played while the opponent
+            thinks, until stop_pondering(). advance() then re-roots into the
+            reply's subtree with the extra statistics.
+        """
+        child = next((c for c in self.root.children if c.action == self.last_action), None)
+        if child is None or child.state.is_game_over():
+            return
+        self._ponder_stop.clear()
+        self._ponder_thread = threading.Thread(target=self._ponder, args=(child,), daemon=True)
+        self._ponder_thread.start()
+
+    def _ponder(self, node):
+        while not self._ponder_stop.is_set():
+            leaf, path = self._select(node)
+            value = self._simulate(leaf)
+            self._backpropagate(leaf, value)
+
+    def stop_pondering(self):
+        """ Cancel pondering; the simulation in progress is finished first
+            so the tree is consistent when this returns.
+        """
+        if self._ponder_thread is not None:
+            self._ponder_stop.set()
+            self._ponder_thread.join()
+            self._ponder_thread = None
 
     def _select(self, node):
         """ Select until we find an unexpanded node or terminal node.
@@ -431,6 +487,8 @@ print("The board positions are numbered 1 through 9 as follows:")
 game_state.print_board_positions()
 
 mcts = MCTS(player=-1, num_simulations=1000)
+# subtree of the previous search kept across moves
+root = None
 
 while not game_state.is_game_over():
     print("\nCurrent board:")
@@ -446,12 +504,18 @@ while not game_state.is_game_over():
             except ValueError:
                 print("Invalid move. Please enter a number from 1 to 9 corresponding to an empty space on the board.")
                 move = None
+        mcts.stop_pondering()
         game_state = game_state.move(move)
+        if mcts.root is not None:
+            root = mcts.advance(mcts.last_action, move)
     else:  # MCTS Agent's turn
         print("MCTS Agent is thinking...")
-        root = Node(game_state)
+        if root is None:
+            root = Node(game_state)
 
         game_state = mcts.search(root)
+        # think on the human's time
+        mcts.start_pondering()
 
 print("\nFinal board:")
 game_state.print_board()
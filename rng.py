@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-search random number generation.
+
+BufferedRandom wraps a np.random.Generator and serves scalar draws from a
+buffer of pre-generated uniforms, so the roll-out loop does not pay one
+NumPy call per draw. It exposes the subset of the np.random module API used
+by the search (randint(n), random(size)), so code that accepts an `rng` can
+also be given the np.random module itself.
+"""
+
+import numpy as np
+
+
+class BufferedRandom():
+
+    def __init__(self, seed=None, buffer_size=4096):
+        """
+        Parameters
+        ----------
+        seed        : int, np.random.SeedSequence or None
+        buffer_size : number of uniforms generated per refill
+        """
+        if isinstance(seed, np.random.SeedSequence):
+            self.seed_sequence = seed
+        else:
+            self.seed_sequence = np.random.SeedSequence(seed)
+        self.generator = np.random.default_rng(self.seed_sequence)
+        self.buffer_size = buffer_size
+        
+        self._buffer = []
+        self._position = 0
+
+    def _refill(self):
+        self._buffer = self.generator.random(self.buffer_size).tolist()
+        self._position = 0
+
+    def random(self, size=None):
+        """ uniform draw(s) in [0, 1) """
+        if size is not None:
+            return self.generator.random(size)
+        if self._position == len(self._buffer):
+            self._refill()
+        u = self._buffer[self._position]
+        self._position += 1
+        return u
+
+    def randint(self, n):
+        """ uniform integer in [0, n) """
+        return int(self.random() * n)
+
+    def spawn(self, n_children):
+        """ n independent BufferedRandom streams derived from this one """
+        return [BufferedRandom(child, self.buffer_size) for child in self.seed_sequence.spawn(n_children)]
+
+
+def search_rng(seed=None):
+    """
+    BufferedRandom for a search. Without a seed, the seed is drawn from the
+    global np.random state so that np.random.seed() keeps older experiments
+    reproducible.
+    """
+    if seed is None:
+        seed = np.random.randint(2**31)
+    return BufferedRandom(seed)
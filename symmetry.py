@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+D4 symmetries (rotations and reflections) of the 3x3 board.
+
+A position is mapped to a canonical form, the smallest bitboard key among its
+8 images, so that symmetric positions can share one node in the search tree.
+"""
+
+from tictactoe import BITBOARD_CELLS, BITBOARD_FULL, bitboard_key, state_bitboards
+
+
+def _cell_permutation(transform):
+    return tuple(r*3 + c for r, c in (transform(i // 3, i % 3) for i in range(BITBOARD_CELLS)))
+
+
+# D4_PERMUTATIONS[s][c] is the cell that cell c is mapped to by symmetry s
+D4_PERMUTATIONS = tuple(_cell_permutation(transform) for transform in (
+    lambda r, c: (r, c),
+    lambda r, c: (c, 2 - r),
+    lambda r, c: (2 - r, 2 - c),
+    lambda r, c: (2 - c, r),
+    lambda r, c: (r, 2 - c),
+    lambda r, c: (2 - r, c),
+    lambda r, c: (c, r),
+    lambda r, c: (2 - c, 2 - r),
+))
+
+# TRANSFORMED_MASKS[s][m] is the image of bitmask m under symmetry s
+TRANSFORMED_MASKS = tuple(
+    tuple(sum(1 << perm[c] for c in range(BITBOARD_CELLS) if m >> c & 1)
+          for m in range(BITBOARD_FULL + 1))
+    for perm in D4_PERMUTATIONS
+)
+
+
+def canonical_key(o_mask, x_mask, player):
+    """ smallest bitboard_key among the 8 symmetric images of a position """
+    return min(bitboard_key(masks[o_mask], masks[x_mask], player) for masks in TRANSFORMED_MASKS)
+
+
+def canonical_state_key(env_state):
+    """ canonical_key() of a 3x3 game state """
+    if env_state.board_size != 3:
+        raise ValueError("symmetry canonicalization needs a 3x3 board")
+    o_mask, x_mask = state_bitboards(env_state)
+    return canonical_key(o_mask, x_mask, env_state.player)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precomputed state-transition table for tic-tac-toe.
+
+Every position reachable from the empty board (with either player moving
+first) is enumerated once and given an integer id. Successors, results,
+legal-move masks and side to move are stored as NumPy arrays, cached on disk
+as .npy files and memory-mapped on load, so that stepping a game is a single
+array lookup.
+"""
+
+import os
+import numpy as np
+
+from tictactoe import (TicTacToeMove, TicTacToeBitboardState, BITBOARD_CELLS,
+                       BITBOARD_FULL, WINNING_MASK, MASK_CELLS, bitboard_key)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '.table_cache', 'tictactoe_v1')
+
+# value stored in `results` for positions that are not terminal
+ONGOING = 2
+
+NO_STATE = -1
+
+
+class TicTacToeTable():
+
+    array_names = ('o_masks', 'x_masks', 'players', 'results',
+                   'legal_masks', 'successors', 'index')
+
+    def __init__(self, o_masks, x_masks, players, results, legal_masks, successors, index):
+        """
+        Parameters
+        ----------
+        o_masks     : np.array() (S,) bitmask of O stones for each state id
+        x_masks     : np.array() (S,) bitmask of X stones for each state id
+        players     : np.array() (S,) side to move (1 for O, -1 for X)
+        results     : np.array() (S,) game result (1, -1, 0) or ONGOING
+        legal_masks : np.array() (S,) bitmask of legal cells (0 if terminal)
+        successors  : np.array() (S, 9) state id after playing each cell,
+                      NO_STATE where the move is illegal
+        index       : np.array() (2**19,) state id of each `bitboard_key`,
+                      NO_STATE for unreachable positions
+        """
+        self.o_masks = o_masks
+        self.x_masks = x_masks
+        self.players = players
+        self.results = results
+        self.legal_masks = legal_masks
+        self.successors = successors
+        self.index = index
+
+    @property
+    def n_states(self):
+        return len(self.players)
+
+    @classmethod
+    def build(cls):
+        """
+        Enumerates every reachable position with a breadth-first search from
+        the empty board, for both choices of first player.
+        """
+        keys = []
+        ids = {}
+        queue = []
+        for player in (1, -1):
+            key = bitboard_key(0, 0, player)
+            ids[key] = len(keys)
+            keys.append((0, 0, player))
+            queue.append(key)
+
+        transitions = []
+        head = 0
+        while head < len(keys):
+            o_mask, x_mask, player = keys[head]
+            head += 1
+            row = [NO_STATE] * BITBOARD_CELLS
+            if not (WINNING_MASK[o_mask] or WINNING_MASK[x_mask]):
+                for c in MASK_CELLS[~(o_mask | x_mask) & BITBOARD_FULL]:
+                    if player == 1:
+                        child = (o_mask | 1 << c, x_mask, -1)
+                    else:
+                        child = (o_mask, x_mask | 1 << c, 1)
+                    key = bitboard_key(*child)
+                    if key not in ids:
+                        ids[key] = len(keys)
+                        keys.append(child)
+                    row[c] = ids[key]
+            transitions.append(row)
+
+        n_states = len(keys)
+        o_masks = np.array([k[0] for k in keys], dtype=np.uint16)
+        x_masks = np.array([k[1] for k in keys], dtype=np.uint16)
+        players = np.array([k[2] for k in keys], dtype=np.int8)
+        successors = np.array(transitions, dtype=np.int32).reshape(n_states, BITBOARD_CELLS)
+
+        results = np.full(n_states, ONGOING, dtype=np.int8)
+        legal_masks = np.zeros(n_states, dtype=np.uint16)
+        for i, (o_mask, x_mask, player) in enumerate(keys):
+            state = TicTacToeBitboardState(o_mask, x_mask, player)
+            result = state.game_result
+            if result is None:
+                legal_masks[i] = ~(o_mask | x_mask) & BITBOARD_FULL
+            else:
+                results[i] = result
+
+        index = np.full(1 << (2*BITBOARD_CELLS + 1), NO_STATE, dtype=np.int32)
+        for key, i in ids.items():
+            index[key] = i
+
+        return cls(o_masks, x_masks, players, results, legal_masks, successors, index)
+
+    def save(self, cache_dir=DEFAULT_CACHE_DIR):
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in self.array_names:
+            path = os.path.join(cache_dir, name + '.npy')
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, getattr(self, name))
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, cache_dir=DEFAULT_CACHE_DIR, mmap=True):
+        """
+        Loads the table from `cache_dir`, building and saving it first if the
+        cache does not exist yet. Arrays are memory-mapped read-only unless
+        `mmap` is False.
+        """
+        paths = [os.path.join(cache_dir, name + '.npy') for name in cls.array_names]
+        if not all(os.path.exists(path) for path in paths):
+            table = cls.build()
+            try:
+                table.save(cache_dir)
+            except OSError:
+                return table
+
+        mmap_mode = 'r' if mmap else None
+        # plain ndarray views over the maps avoid np.memmap's per-item overhead
+        return cls(*[np.asarray(np.load(path, mmap_mode=mmap_mode)) for path in paths])
+
+    def state_id(self, o_mask, x_mask, player):
+        state_id = int(self.index[bitboard_key(o_mask, x_mask, player)])
+        if state_id == NO_STATE:
+            raise ValueError("position is not reachable from the empty board")
+        return state_id
+
+    def state(self, state_id):
+        return TicTacToeTableState(self, state_id)
+
+    def from_game_state(self, env_state):
+        bitboard = TicTacToeBitboardState.from_game_state(env_state)
+        return self.state(self.state_id(bitboard.o_mask, bitboard.x_mask, bitboard.player))
+
+
+class TicTacToeTableState(TicTacToeBitboardState):
+    """
+    Game state that is only a (table, state id) pair; every transition and
+    result is a lookup into a TicTacToeTable.
+    """
+
+    def __init__(self, table, state_id):
+        self.table = table
+        self.state_id = state_id
+        self.board_size = 3
+
+        self.first_player_o = 1
+        self.second_player_x = -1
+
+        self._history = []
+
+    @property
+    def o_mask(self):
+        return int(self.table.o_masks[self.state_id])
+
+    @property
+    def x_mask(self):
+        return int(self.table.x_masks[self.state_id])
+
+    @property
+    def player(self):
+        return self.table.players.item(self.state_id)
+
+    @property
+    def game_result(self):
+        result = self.table.results.item(self.state_id)
+        if result == ONGOING:
+            return None
+        return result
+
+    def is_game_over(self):
+        return self.table.results.item(self.state_id) != ONGOING
+
+    def move(self, move):
+        if not self.is_move_legal(move):
+            raise ValueError(
+                "move {0} on board {1} is not legal". format(move, self.board)
+            )
+        next_id = self.table.successors[self.state_id, move.x_coordinate*3 + move.y_coordinate]
+        return TicTacToeTableState(self.table, int(next_id))
+
+    def is_move_legal(self, move):
+        if move.value != self.player:
+            return False
+        if not (0 <= move.x_coordinate < 3 and 0 <= move.y_coordinate < 3):
+            return False
+        return bool(self.table.legal_masks[self.state_id] >> (move.x_coordinate*3 + move.y_coordinate) & 1)
+
+    def get_legal_actions(self):
+        player = self.player
+        return [
+            TicTacToeMove(c // 3, c % 3, player)
+            for c in MASK_CELLS[int(self.table.legal_masks[self.state_id])]
+        ]
+
+    def copy(self):
+        return TicTacToeTableState(self.table, self.state_id)
+
+    def legal_action_indices(self):
+        return MASK_CELLS[self.table.legal_masks.item(self.state_id)]
+
+    def legal_action_mask(self):
+        return int(self.table.legal_masks[self.state_id])
+
+    def push(self, action_index):
+        self._history.append(self.state_id)
+        self.state_id = self.table.successors.item(self.state_id, action_index)
+
+    def pop(self):
+        self.state_id = self._history.pop()
@@ -0,0 +1,90 @@
+"""
+Subtree reuse across moves: advance() re-roots the search at the position
+after a move and its reply, keeping the statistics below it, and starts
+over when that position was never expanded.
+"""
+
+import numpy as np
+import pytest
+
+from tictactoe import TicTacToeBitboardState, TicTacToeMove
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from tree_policy import TreePolicy_UCB, TreePolicy_OCBA
+from transposition import TranspositionTable
+
+
+def move_of(state_action, player):
+    return TicTacToeMove(state_action.move_id//3, state_action.move_id % 3, player)
+
+
+def subtree_nodes(root):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        for action in node.actions:
+            stack.extend(action.next_state_nodes.values())
+
+
+@pytest.mark.parametrize('use_table', [False, True])
+@pytest.mark.parametrize('policy_class', [TreePolicy_UCB, TreePolicy_OCBA])
+def test_advance_keeps_the_subtree(policy_class, use_table):
+    table = TranspositionTable() if use_table else None
+    mcts = MonteCarloTreeSearch(StateNode(TicTacToeBitboardState()), policy_class(), table, seed=1)
+    mcts.search(1000)
+    action = mcts.best_action()
+    # the most visited reply, so that it was expanded
+    reply_action = max(action.next_state_nodes.values(), key=lambda node: node.n)
+    reply_move = next(move for move in action.env_state.get_legal_actions()
+                      if action.env_state.move(move).hash_key() == reply_action.env_state.hash_key())
+    visits = reply_action.n
+    statistics = [(a.move_id, a.n, a.q_value_mean) for a in reply_action.actions]
+
+    root = mcts.advance(move_of(action, 1), reply_move)
+    assert root is reply_action and mcts.root_state is root
+    assert root.prev_node is None and root.n == visits
+    assert [(a.move_id, a.n, a.q_value_mean) for a in root.actions] == statistics
+    if use_table:
+        # the table holds the nodes of the subtree only
+        assert len(table) == len({node.env_state.hash_key() for node in subtree_nodes(root)})
+
+    # the root keeps the visit it had as a leaf, which no action counts
+    df = mcts.search(200)
+    assert root.n == visits + 200
+    assert root.n - df['N'].sum() == visits - sum(n for _, n, _ in statistics)
+
+
+def test_advance_to_an_unexplored_position_starts_over():
+    mcts = MonteCarloTreeSearch(StateNode(TicTacToeBitboardState()), TreePolicy_UCB(), seed=2)
+    mcts.search(20)
+    corner = TicTacToeMove(0, 0, 1)
+    state = TicTacToeBitboardState().move(corner)
+    expanded = {node.env_state.hash_key()
+                for action in mcts.root_state.actions if action.move_id == 0
+                for node in action.next_state_nodes.values()}
+    reply = next(move for move in state.get_legal_actions() if state.move(move).hash_key() not in expanded)
+
+    root = mcts.advance(corner, reply)
+    assert root.n == 0 and not root.actions
+    assert root.env_state.hash_key() == state.move(reply).hash_key()
+    assert mcts.search(50)['N'].sum() == 50
+
+
+@pytest.mark.parametrize('use_symmetry', [False, True])
+def test_play_a_game_with_advance(use_symmetry):
+    rng = np.random.RandomState(0)
+    state = TicTacToeBitboardState()
+    mcts = MonteCarloTreeSearch(StateNode(state, use_symmetry=use_symmetry), TreePolicy_OCBA(), seed=3)
+    while not state.is_game_over():
+        mcts.search(300)
+        move = move_of(mcts.best_action(), state.player)
+        state = state.move(move)
+        if state.is_game_over():
+            break
+        legal = state.get_legal_actions()
+        reply = legal[rng.randint(len(legal))]
+        state = state.move(reply)
+        root = mcts.advance(move, reply)
+        assert root.env_state.hash_key() == state.hash_key()
+        assert sum(action.n for action in root.actions) <= root.n
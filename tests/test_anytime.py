@@ -0,0 +1,66 @@
+"""
+search_anytime stopping rules: the search stops with the first iteration
+ending past its deadline, and a target APCS needs a limit next to it.
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from tictactoe import TicTacToeBitboardState
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from tree_policy import TreePolicy_UCB, TreePolicy_OCBA
+
+
+def new_search(policy):
+    np.random.seed(0)
+    return MonteCarloTreeSearch(StateNode(TicTacToeBitboardState()), policy)
+
+
+def record_iterations(mcts):
+    """ end time of every iteration of mcts """
+    ends = []
+    iterate = mcts.iterate
+
+    def recorded_iterate(*args, **kwargs):
+        result = iterate(*args, **kwargs)
+        ends.append(time.monotonic())
+        return result
+    mcts.iterate = recorded_iterate
+    return ends
+
+
+@pytest.mark.parametrize('policy_class', [TreePolicy_UCB, TreePolicy_OCBA])
+def test_search_stops_after_the_iteration_crossing_the_deadline(policy_class):
+    mcts = new_search(policy_class())
+    ends = record_iterations(mcts)
+    deadline = time.monotonic() + 0.1
+    mcts.search_anytime(deadline=deadline, target_apcs=1.0, check_interval=1000)
+    # the clock is read just after the iteration ends
+    assert mcts.stop_reason == 'deadline'
+    assert len(ends) == mcts.iterations
+    assert max(ends[:-1]) < deadline <= time.monotonic()
+
+
+def test_time_budget_is_met():
+    mcts = new_search(TreePolicy_OCBA())
+    start = time.monotonic()
+    mcts.search_anytime(time_budget=0.1)
+    assert mcts.stop_reason == 'deadline'
+    assert time.monotonic() >= start + 0.1
+
+
+def test_iteration_limit():
+    mcts = new_search(TreePolicy_UCB())
+    mcts.search_anytime(max_iterations=250)
+    assert (mcts.stop_reason, mcts.iterations, mcts.root_state.n) == ('iterations', 250, 250)
+
+
+def test_target_apcs_needs_a_limit():
+    mcts = new_search(TreePolicy_OCBA())
+    with pytest.raises(ValueError):
+        mcts.search_anytime(target_apcs=0.9)
+    mcts.search_anytime(max_iterations=5000, target_apcs=0.5)
+    assert mcts.stop_reason == 'apcs' and mcts.apcs >= 0.5
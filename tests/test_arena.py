@@ -0,0 +1,74 @@
+"""
+Array-backed search tree: visit counts stay consistent between parents and
+children, including when max_nodes stops the tree from growing.
+"""
+
+import numpy as np
+import pytest
+
+from table_engine import TicTacToeTable
+from tree_policy import TreePolicy_UCB, TreePolicy_OCBA
+from arena import ArenaMonteCarloTreeSearch, TreeArena, ACTION_NODE, STATE_NODE, NO_NODE
+
+
+@pytest.fixture(scope='module')
+def table():
+    return TicTacToeTable.build()
+
+
+def check_tree(mcts, N):
+    arena = mcts.arena
+    size = arena.size
+    root_actions = arena.children(mcts.root)
+    assert arena.n[mcts.root] == N
+    assert arena.n[root_actions].sum() == N
+    assert np.all((arena.mean[:size] >= 0) & (arena.mean[:size] <= 1))
+
+    for node in range(size):
+        if arena.child_count[node] == 0:
+            continue
+        children = arena.children(node)
+        assert np.all(arena.parent[children] == node)
+        assert np.all(arena.kind[children] != arena.kind[node])
+        if node == mcts.root:
+            assert arena.n[children].sum() == arena.n[node]
+        else:
+            # less the visits that rolled out from the node as a leaf, or
+            # below an action node whose replies did not fit in the arena
+            assert arena.n[children].sum() <= arena.n[node]
+
+
+@pytest.mark.parametrize('policy_class', [TreePolicy_UCB, TreePolicy_OCBA])
+def test_search_keeps_visit_counts_consistent(table, policy_class):
+    np.random.seed(0)
+    mcts = ArenaMonteCarloTreeSearch(table, table.state_id(0, 0, 1), policy_class(), capacity=16)
+    mcts.search(2000)
+    check_tree(mcts, 2000)
+    assert mcts.arena.capacity >= mcts.arena.size > 16
+    assert sum(action.n for action in mcts.root_actions()) == 2000
+
+
+@pytest.mark.parametrize('max_nodes', [30, 200])
+def test_capped_arena_keeps_searching(table, max_nodes):
+    np.random.seed(0)
+    mcts = ArenaMonteCarloTreeSearch(table, table.state_id(0, 0, 1), TreePolicy_UCB(),
+                                     capacity=16, max_nodes=max_nodes)
+    mcts.search(3000)
+    assert mcts.arena.size <= max_nodes and mcts.arena.capacity <= max_nodes
+    check_tree(mcts, 3000)
+    # the root and its 9 actions are always stored
+    assert len(mcts.root_actions()) == 9
+
+
+def test_arena_growth_keeps_the_nodes():
+    arena = TreeArena(capacity=2)
+    root = arena.add_nodes(STATE_NODE, NO_NODE, [0], [-1])
+    first = arena.add_nodes(ACTION_NODE, root, [1, 2, 3], [0, 1, 2])
+    assert arena.capacity == 4 and arena.size == 4
+    assert list(arena.state_id[arena.children(root)]) == [1, 2, 3]
+    assert list(arena.parent[first:first + 3]) == [root]*3
+
+    capped = TreeArena(capacity=2, max_nodes=3)
+    capped.add_nodes(STATE_NODE, NO_NODE, [0], [-1])
+    assert capped.add_nodes(ACTION_NODE, 0, [1, 2, 3], [0, 1, 2]) == NO_NODE
+    assert capped.size == 1 and capped.child_count[0] == 0
@@ -0,0 +1,113 @@
+"""
+asyncio search front end: it runs the same iterations as search(), yields
+to the event loop between slices, and stops on its limits, on cancel() and
+at a deadline that set_deadline() can move and that is not carried over to
+the next search.
+"""
+
+import time
+import asyncio
+
+import pytest
+
+from tictactoe import TicTacToeBitboardState, TicTacToeMove
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from tree_policy import TreePolicy_UCB, TreePolicy_OCBA
+from async_search import AsyncSearch
+
+
+def new_search(policy_class=TreePolicy_OCBA):
+    root_env_state = TicTacToeBitboardState().move(TicTacToeMove(0, 0, 1))
+    return MonteCarloTreeSearch(StateNode(root_env_state), policy_class(), seed=5)
+
+
+@pytest.mark.parametrize('policy_class', [TreePolicy_UCB, TreePolicy_OCBA])
+def test_same_search_as_the_blocking_one(policy_class):
+    search = AsyncSearch(new_search(policy_class), slice_iterations=32)
+    df = asyncio.run(search.run(max_iterations=1000))
+    assert search.stop_reason == 'iterations' and search.iterations == 1000
+    assert df.equals(new_search(policy_class).search(1000))
+
+
+def test_statistics_after_every_slice():
+    async def collect():
+        search = AsyncSearch(new_search(), slice_iterations=30)
+        return [df['N'].sum() async for df in search.statistics(max_iterations=100)]
+    assert asyncio.run(collect()) == [30, 60, 90, 100]
+
+
+def test_other_coroutines_run_during_the_search():
+    async def main():
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(search.iterations)
+                await asyncio.sleep(0)
+        search = AsyncSearch(new_search(), slice_iterations=10)
+        task = asyncio.ensure_future(ticker())
+        await search.run(max_iterations=200)
+        task.cancel()
+        return ticks
+    ticks = asyncio.run(main())
+    assert len(set(ticks)) >= 10
+
+
+def test_cancel_stops_at_the_end_of_the_slice():
+    async def main():
+        search = AsyncSearch(new_search(), slice_iterations=16)
+        slices = 0
+        async for df in search.statistics():
+            slices += 1
+            if slices == 5:
+                search.cancel()
+        return search, slices, df
+    search, slices, df = asyncio.run(main())
+    assert search.stop_reason == 'cancelled' and slices == 6
+    assert search.iterations == df['N'].sum() == 96
+
+
+def test_task_cancellation_leaves_a_consistent_tree():
+    async def main():
+        search = AsyncSearch(new_search(), slice_iterations=16)
+        task = asyncio.ensure_future(search.run(time_budget=10))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return search
+    search = asyncio.run(main())
+    root = search.mcts.root_state
+    assert 0 < search.iterations < 10**6 and search.iterations % 16 == 0
+    assert root.n == sum(action.n for action in root.actions) == search.iterations
+
+
+def test_set_deadline_moves_the_running_search():
+    async def main():
+        search = AsyncSearch(new_search(), slice_iterations=8)
+
+        async def extend():
+            await asyncio.sleep(0.05)
+            search.set_deadline(time_budget=0.3)
+        asyncio.ensure_future(extend())
+        start = time.monotonic()
+        await search.run(time_budget=0.1)
+        return search, time.monotonic() - start
+    search, elapsed = asyncio.run(main())
+    assert search.stop_reason == 'deadline' and elapsed >= 0.3
+
+
+def test_deadline_is_reset_for_the_next_search():
+    search = AsyncSearch(new_search(), slice_iterations=8)
+    asyncio.run(search.run(time_budget=0.01))
+    assert search.stop_reason == 'deadline'
+    # the past deadline of the first search does not stop the second one
+    asyncio.run(search.run(max_iterations=64))
+    assert search.deadline is None
+    assert search.stop_reason == 'iterations' and search.iterations == 64
+
+
+def test_run_needs_a_limit():
+    with pytest.raises(ValueError):
+        asyncio.run(AsyncSearch(new_search()).run(target_apcs=0.9))
@@ -0,0 +1,82 @@
+"""
+Vectorized random playouts against the exact outcome probabilities of
+uniformly random play, computed by enumerating the game tree.
+"""
+
+import functools
+
+import numpy as np
+import pytest
+
+from tictactoe import TicTacToeBitboardState, WINNING_MASK, BITBOARD_CELLS
+from node import StateNode
+from batch_rollout import batch_rollout, batch_rollout_states
+
+
+@functools.lru_cache(maxsize=None)
+def outcome_probabilities(o_mask, x_mask, player):
+    """ (P(O wins), P(draw), P(X wins)) under uniformly random play """
+    if WINNING_MASK[o_mask]:
+        return (1.0, 0.0, 0.0)
+    if WINNING_MASK[x_mask]:
+        return (0.0, 0.0, 1.0)
+    empty = [c for c in range(BITBOARD_CELLS) if not (o_mask | x_mask) >> c & 1]
+    if not empty:
+        return (0.0, 1.0, 0.0)
+    total = np.zeros(3)
+    for c in empty:
+        if player == 1:
+            total += outcome_probabilities(o_mask | 1 << c, x_mask, -player)
+        else:
+            total += outcome_probabilities(o_mask, x_mask | 1 << c, -player)
+    return tuple(total / len(empty))
+
+
+POSITIONS = [
+    (0, 0, 1),
+    (0, 0, -1),
+    (0b000000001, 0b000010000, 1),
+    (0b000010001, 0b100000010, 1),
+    (0b000000011, 0b000011000, -1),
+    (0b000000111, 0b000011000, -1),    # O already won
+    (0b010001101, 0b001110010, 1),     # one empty cell left
+]
+
+
+def frequencies(results):
+    return np.array([(results == 1).mean(), (results == 0).mean(), (results == -1).mean()])
+
+
+@pytest.mark.parametrize('o_mask, x_mask, player', POSITIONS)
+def test_outcomes_follow_random_play(o_mask, x_mask, player):
+    np.random.seed(0)
+    n = 20000
+    results = batch_rollout([o_mask], [x_mask], [player], n)
+    assert results.shape == (1, n) and results.dtype == np.int8
+    expected = np.array(outcome_probabilities(o_mask, x_mask, player))
+    # within 5 standard deviations of the binomial frequencies
+    assert np.all(np.abs(frequencies(results[0]) - expected) <= 5*np.sqrt(expected*(1 - expected)/n) + 1e-12)
+
+
+def test_positions_are_played_independently():
+    np.random.seed(0)
+    o_masks, x_masks, players = zip(*POSITIONS)
+    results = batch_rollout(o_masks, x_masks, players, 4000)
+    assert results.shape == (len(POSITIONS), 4000)
+    for row, position in zip(results, POSITIONS):
+        expected = np.array(outcome_probabilities(*position))
+        assert np.all(np.abs(frequencies(row) - expected) <= 5*np.sqrt(expected*(1 - expected)/4000) + 1e-12)
+
+
+def test_states_and_node_rollouts():
+    np.random.seed(0)
+    state = TicTacToeBitboardState(0b000000001, 0b000010000, 1)
+    results = batch_rollout_states([state, state], 3000)
+    assert results.shape == (2, 3000)
+
+    p_o, p_draw, p_x = outcome_probabilities(0b000000001, 0b000010000, 1)
+    node = StateNode(state)
+    rewards = node.rollouts(20000)
+    # the reward is seen from the side to move at the root, O here
+    assert abs(rewards.mean() - (p_o + p_draw/2)) < 0.02
+    assert set(np.unique(rewards)) <= {0.0, 0.5, 1.0}
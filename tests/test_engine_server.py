@@ -0,0 +1,109 @@
+"""
+Engine server: request validation, the tree cache of the worker processes
+and cancellation of pending requests.
+"""
+
+import io
+import json
+
+import pytest
+
+from engine_server import Engine, serve_stdio
+
+EMPTY = [[0, 0, 0], [0, 0, 0], [0, 0, 0]]
+
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = Engine(n_workers=2, default_budget=50)
+    yield engine
+    engine.shutdown()
+
+
+@pytest.mark.parametrize('request_, message', [
+    ({}, "missing field 'board'"),
+    ({'board': [[0, 0], [0, 0]]}, "board must have 9 cells"),
+    ({'board': [0, 0, 0, 0, 2, 0, 0, 0, 0]}, "board must have 9 cells"),
+    ({'board': "x"}, "board must have 9 cells"),
+    ({'board': EMPTY, 'player': 0}, "player must be 1 (O) or -1 (X)"),
+    ({'board': EMPTY, 'player': True}, "player must be 1 (O) or -1 (X)"),
+    ({'board': [[1, 1, 1], [-1, -1, 0], [0, 0, 0]], 'player': -1}, "game is over"),
+    ({'board': EMPTY, 'policy': 'minimax'}, "unknown policy"),
+    ({'board': EMPTY, 'budget': 0}, "budget must be at least 1"),
+    ({'board': EMPTY, 'budget': 1.5}, "budget must be an integer"),
+    ({'board': EMPTY, 'time': "1"}, "time must be a number"),
+    ({'board': EMPTY, 'target_apcs': 2}, "target_apcs must be at most 1"),
+    ({'board': EMPTY, 'seed': -1}, "seed must be at least 0"),
+])
+def test_invalid_requests_are_answered_with_their_error(engine, request_, message):
+    replies = []
+    response = engine.submit(dict(request_, id=7), replies.append).result()
+    assert response['id'] == 7 and response['error'].startswith(message)
+    assert replies == [response]
+
+
+def test_search_and_tree_cache(engine):
+    request = {'id': 1, 'board': EMPTY, 'player': 1, 'budget': 100, 'policy': 'ucb', 'seed': 3}
+    response = engine.handle(request)
+    assert response['cache'] == 'miss' and response['iterations'] == 100
+    assert sum(row['N'] for row in response['root']) == 100
+    assert response['best_move'] == 3*response['row'] + response['col']
+
+    assert engine.handle(request)['cache'] == 'hit'
+    # another seed does not share that tree
+    assert engine.handle(dict(request, seed=4))['cache'] == 'miss'
+
+    # two plies further into the game
+    board = [[1, 0, 0], [0, -1, 0], [0, 0, 0]]
+    response = engine.handle(dict(request, board=board))
+    assert response['cache'] == 'advanced' and response['best_move'] not in (0, 4)
+
+
+def test_seeded_requests_are_reproducible():
+    request = {'board': EMPTY, 'budget': 200, 'policy': 'ocba', 'seed': 11}
+    responses = []
+    for _ in range(2):
+        engine = Engine(n_workers=1)
+        responses.append(engine.handle(request))
+        engine.shutdown()
+    assert responses[0]['root'] == responses[1]['root']
+
+
+def test_pending_requests_can_be_cancelled():
+    engine = Engine(n_workers=1)
+    replies = []
+    running = engine.submit({'id': 0, 'board': EMPTY, 'time': 0.3}, replies.append)
+    # a few requests are handed to the worker process ahead of time
+    queued = [engine.submit({'id': i, 'board': EMPTY, 'budget': 10}, replies.append) for i in range(1, 6)]
+    assert queued[-1].cancel()
+    assert queued[-1].result() == {'id': 5, 'error': "cancelled"}
+    engine.shutdown()
+
+    assert running.result()['iterations'] > 0
+    assert all(future.result()['iterations'] == 10 for future in queued[:-1])
+    assert {'id': 5, 'error': "cancelled"} in replies
+    assert sorted(reply['id'] for reply in replies) == [0, 1, 2, 3, 4, 5]
+
+
+def test_shutdown_cancels_pending_requests():
+    engine = Engine(n_workers=1)
+    replies = []
+    engine.submit({'id': 0, 'board': EMPTY, 'time': 0.3}, replies.append)
+    for i in range(1, 6):
+        engine.submit({'id': i, 'board': EMPTY, 'budget': 10}, replies.append)
+    engine.shutdown(cancel_pending=True)
+
+    cancelled = [reply['id'] for reply in replies if reply.get('error') == "cancelled"]
+    assert cancelled and cancelled == list(range(6 - len(cancelled), 6))
+    assert sorted(reply['id'] for reply in replies) == [0, 1, 2, 3, 4, 5]
+
+
+def test_stdio_protocol():
+    lines = ['{"id": 1, "board": [0, 0, 0, 0, 0, 0, 0, 0, 0], "budget": 20}', '', 'not json', '[1]']
+    stdout = io.StringIO()
+    serve_stdio(Engine(n_workers=1), io.StringIO('\n'.join(lines) + '\n'), stdout)
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    errors = sorted(response['error'] for response in responses if 'error' in response)
+    assert len(responses) == 3 and len(errors) == 2
+    assert errors[0].startswith("invalid JSON") and errors[1] == "request must be a JSON object"
+    assert [response['iterations'] for response in responses if response['id'] == 1] == [20]
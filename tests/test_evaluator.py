@@ -0,0 +1,121 @@
+"""
+Batch evaluators and the leaf-batched search loop: the value table holds the
+exact expected result of random play, rewards are scored for the player of
+each leaf, and search_batched counts every evaluated leaf once.
+"""
+
+import functools
+
+import numpy as np
+import pytest
+
+from tictactoe import TicTacToeGameState, TicTacToeBitboardState, TicTacToeMove, WINNING_MASK
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from tree_policy import TreePolicy_UCB, TreePolicy_OCBA
+from table_engine import TicTacToeTable, ONGOING
+from evaluator import (result_to_reward, RandomRolloutEvaluator, ValueTableEvaluator,
+                       MLPEvaluator)
+
+
+@pytest.fixture(scope='module')
+def table():
+    return TicTacToeTable.build()
+
+
+@functools.lru_cache(maxsize=None)
+def expected_result(o_mask, x_mask, player):
+    """ expected game result of uniformly random play, 1 when O wins """
+    if WINNING_MASK[o_mask]:
+        return 1.0
+    if WINNING_MASK[x_mask]:
+        return -1.0
+    empty = [c for c in range(9) if not (o_mask | x_mask) >> c & 1]
+    if not empty:
+        return 0.0
+    if player == 1:
+        return np.mean([expected_result(o_mask | 1 << c, x_mask, -1) for c in empty])
+    return np.mean([expected_result(o_mask, x_mask | 1 << c, 1) for c in empty])
+
+
+def leaf(o_mask, x_mask, player, root_player=None):
+    node = StateNode(TicTacToeBitboardState(o_mask, x_mask, player))
+    node.player = player if root_player is None else root_player
+    return node
+
+
+def test_result_to_reward():
+    assert list(result_to_reward([1, 0, -1, 1], [1, 1, 1, -1])) == [1.0, 0.5, 0.0, 0.0]
+    assert result_to_reward(0.5, -1) == 0.25
+
+
+def test_value_table_holds_the_random_play_values(table):
+    values = ValueTableEvaluator.random_play_values(table)
+    for state_id in range(0, table.n_states, 7):
+        expected = expected_result(int(table.o_masks[state_id]), int(table.x_masks[state_id]),
+                                   int(table.players[state_id]))
+        assert np.isclose(values[state_id], expected)
+    finished = table.results != ONGOING
+    assert np.array_equal(values[finished], table.results[finished])
+
+
+def test_value_table_rewards_are_for_the_player_of_the_leaf(table):
+    evaluator = ValueTableEvaluator.random_play(table)
+    o_mask, x_mask = 0b000000001, 0b000010000
+    value = expected_result(o_mask, x_mask, 1)
+    rewards = evaluator.evaluate([leaf(o_mask, x_mask, 1), leaf(o_mask, x_mask, 1, root_player=-1)])
+    assert np.allclose(rewards, [(1 + value)/2, (1 - value)/2])
+
+    with pytest.raises(ValueError):
+        evaluator.evaluate([leaf(0, 0b11, 1)])
+
+
+def test_random_rollouts_estimate_the_values():
+    np.random.seed(0)
+    evaluator = RandomRolloutEvaluator()
+    o_mask, x_mask = 0b000000001, 0b000010000
+    rewards = evaluator.evaluate([leaf(o_mask, x_mask, 1)] * 20000)
+    assert set(np.unique(rewards)) <= {0.0, 0.5, 1.0}
+    assert abs(rewards.mean() - (1 + expected_result(o_mask, x_mask, 1))/2) < 0.02
+
+    # boards the batch engine cannot play are rolled out one by one
+    big = StateNode(TicTacToeGameState(np.zeros((4, 4)), 1))
+    assert set(evaluator.evaluate([big] * 20)) <= {0.0, 0.5, 1.0}
+
+
+def test_mlp_evaluator():
+    evaluator = MLPEvaluator(hidden_units=8, seed=0)
+    leaves = [leaf(0b000000001, 0b000010000, 1), leaf(0b000000001, 0b000010000, 1, root_player=-1),
+              leaf(0, 0, 1)]
+    features = evaluator.features(leaves)
+    assert features.shape == (3, 19)
+    assert list(features[0, :9]) == [1] + [0]*8 and features[0, 9 + 4] == 1
+    rewards = evaluator.evaluate(leaves)
+    assert np.all((rewards >= 0) & (rewards <= 1))
+    assert np.isclose(rewards[0] + rewards[1], 1)
+    assert np.array_equal(rewards, MLPEvaluator(hidden_units=8, seed=0).evaluate(leaves))
+
+
+def tree_actions(root):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for action in node.actions:
+            yield action
+            stack.extend(action.next_state_nodes.values())
+
+
+@pytest.mark.parametrize('policy_class', [TreePolicy_UCB, TreePolicy_OCBA])
+@pytest.mark.parametrize('evaluator_name', ['rollout', 'table', 'mlp'])
+def test_search_batched_counts_every_leaf_once(table, policy_class, evaluator_name):
+    np.random.seed(0)
+    evaluator = {'rollout': None, 'table': ValueTableEvaluator.random_play(table),
+                 'mlp': MLPEvaluator(seed=0)}[evaluator_name]
+    root_env_state = TicTacToeBitboardState().move(TicTacToeMove(0, 0, 1))
+    mcts = MonteCarloTreeSearch(StateNode(root_env_state), policy_class())
+    df = mcts.search_batched(500, batch_size=16, evaluator=evaluator)
+
+    assert mcts.root_state.n == df['N'].sum() == 500
+    for action in tree_actions(mcts.root_state):
+        assert action.virtual_visits == 0
+        assert 0 <= action.q_value_mean <= 1
@@ -0,0 +1,100 @@
+"""
+Instrumented searches sharing one tree policy: the policy and its OCBA
+solver are left untouched, and every search only reports its own solver
+calls; the tracer sees the same per-search solver. Batched searches report
+their iterations and depths like the others.
+"""
+
+import inspect
+import pytest
+
+from tictactoe import TicTacToeBitboardState
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from tree_policy import TreePolicy, TreePolicy_UCB, TreePolicy_OCBA, TreePolicy_OCBA_Batch
+from instrumentation import SearchTracer
+
+
+def new_search(policy, seed=0):
+    return MonteCarloTreeSearch(StateNode(TicTacToeBitboardState()), policy, seed=seed)
+
+
+@pytest.mark.parametrize('policy_class', [TreePolicy_OCBA, TreePolicy_OCBA_Batch])
+def test_shared_policy_is_not_modified(policy_class):
+    policy = policy_class()
+    solver_attributes = dict(vars(policy.ocba))
+    for seed in range(50):
+        mcts = new_search(policy, seed)
+        stats = mcts.enable_stats()
+        calls = policy.n_solver_calls
+        mcts.search(30)
+        assert stats.calls['ocba'] == policy.n_solver_calls - calls
+        mcts.disable_stats()
+        assert mcts.observed_policy is None
+    assert vars(policy.ocba) == solver_attributes
+
+
+@pytest.mark.parametrize('policy_class', [TreePolicy_OCBA, TreePolicy_OCBA_Batch])
+def test_searches_only_report_their_own_solver_calls(policy_class):
+    policy = policy_class()
+    first, second, plain = new_search(policy, 0), new_search(policy, 1), new_search(policy, 2)
+    first_stats, second_stats = first.enable_stats(), second.enable_stats()
+
+    first.search(100)
+    first_calls = first_stats.calls['ocba']
+    assert first_calls > 0
+
+    calls = policy.n_solver_calls
+    second.search(100)
+    plain.search(100)
+    assert first_stats.calls['ocba'] == first_calls
+    assert second_stats.calls['ocba'] > 0
+    assert second_stats.calls['ocba'] < policy.n_solver_calls - calls
+
+
+def test_tracer_records_only_its_own_solver_calls():
+    policy = TreePolicy_OCBA()
+    traced, plain = new_search(policy, 0), new_search(policy, 1)
+    tracer = SearchTracer(sample_rate=1.0, seed=0)
+    traced.add_observer(tracer)
+
+    traced.search(100)
+    spans = [event for event in tracer.events if event['name'] == 'ocba']
+    assert spans and all(event['args']['k'] > 0 for event in spans)
+
+    plain.search(100)
+    assert len([event for event in tracer.events if event['name'] == 'ocba']) == len(spans)
+
+    traced.remove_observer(tracer)
+    assert traced.observed_policy is None and 'OCBA_Starving' not in vars(policy.ocba)
+
+
+def test_policies_keep_their_select_signature():
+    for policy_class in (TreePolicy, TreePolicy_UCB, TreePolicy_OCBA, TreePolicy_OCBA_Batch):
+        assert list(inspect.signature(policy_class.select).parameters) == ['self', 'current_state', 'rng']
+
+
+def test_rollouts_report_their_length():
+    mcts = new_search(TreePolicy_UCB())
+    stats = mcts.enable_stats()
+    mcts.search(200)
+    assert stats.measured_rollouts == stats.calls['rollout'] == 200
+    assert 0 < stats.average_rollout_length <= 9
+
+
+@pytest.mark.parametrize('policy_class', [TreePolicy_UCB, TreePolicy_OCBA])
+def test_batched_search_reports_iterations_and_depth(policy_class):
+    mcts = new_search(policy_class())
+    stats = mcts.enable_stats()
+    mcts.search_batched(200, batch_size=8)
+    assert stats.rollouts == 200
+    assert stats.iterations == stats.calls['iteration'] == stats.calls['rollout']
+    assert 200 // 8 <= stats.iterations < 200
+    assert stats.walks >= 200 and stats.average_depth > 0
+
+    tracer = SearchTracer(sample_rate=1.0, seed=0)
+    mcts.add_observer(tracer)
+    mcts.search_batched(40, batch_size=8)
+    iterations = [event for event in tracer.events if event['name'] == 'iteration']
+    assert len(iterations) == stats.iterations
+    assert all(event['args']['leaves'] > 0 and event['args']['depth'] > 0 for event in iterations)
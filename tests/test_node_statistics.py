@@ -0,0 +1,58 @@
+"""
+The running (Welford / Chan) statistics of StateActionNode against the
+sample mean and standard deviation the original code recomputed with the
+statistics module on every visit.
+"""
+
+import statistics
+
+import numpy as np
+import pytest
+
+from tictactoe import TicTacToeGameState
+from node import StateNode
+
+
+def new_action():
+    root = StateNode(TicTacToeGameState(np.zeros((3, 3)), 1))
+    return root.expand(np.random.RandomState(0))
+
+
+def reference(samples):
+    if len(samples) > 1:
+        return statistics.mean(samples), statistics.stdev(samples)
+    return samples[0], 0
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_update_matches_naive_statistics(seed):
+    rng = np.random.RandomState(seed)
+    action = new_action()
+    samples = []
+    for value in rng.choice([0.0, 0.5, 1.0], size=200) * rng.uniform(0.5, 1.0, size=200):
+        action.update(float(value))
+        samples.append(float(value))
+        mean, stddev = reference(samples)
+        assert action.q_value_mean == pytest.approx(mean, abs=1e-12)
+        assert action.q_value_stddev == pytest.approx(stddev, abs=1e-12)
+
+    ns, means, stddevs = action.state_node.child_statistics()
+    assert ns[action.index] == len(samples)
+    assert means[action.index] == pytest.approx(mean, abs=1e-12)
+    assert stddevs[action.index] == pytest.approx(stddev, abs=1e-12)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_update_batch_matches_naive_statistics(seed):
+    rng = np.random.RandomState(seed)
+    action = new_action()
+    samples = []
+    for k in rng.randint(1, 20, size=30):
+        values = rng.uniform(size=k)
+        returned = action.update_batch(values)
+        for value, running_mean in zip(values, returned):
+            samples.append(float(value))
+            assert running_mean == pytest.approx(statistics.mean(samples), abs=1e-12)
+        mean, stddev = reference(samples)
+        assert action.q_value_mean == pytest.approx(mean, abs=1e-12)
+        assert action.q_value_stddev == pytest.approx(stddev, abs=1e-12)
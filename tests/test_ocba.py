@@ -0,0 +1,138 @@
+"""
+The vectorized OCBA allocation against the loops of the original
+implementation: random designs, tied means, all-zero and negative means
+(where the second best is the best design itself) and zero standard
+deviations (where the original gives NaN / inf ratios).
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from ocba import OCBA
+
+
+def reference_ratio(k, mean, std_dev):
+    """ calculate_ratio as originally written, one design at a time """
+    best = int(np.argmax(mean))
+    without_best = np.copy(mean)
+    without_best[best] = 0
+    second_best = int(np.argmax(without_best))
+
+    ratio = np.zeros(k)
+    ratio[second_best] = 1.0
+    for j in range(k):
+        if j != best and j != second_best:
+            if mean[best] == mean[j]:
+                ratio[j] = 1.0
+            else:
+                temp = std_dev[j]*(mean[best] - mean[second_best])/(std_dev[second_best]*(mean[best] - mean[j]))
+                ratio[j] = temp*temp
+
+    temp = 0
+    for j in range(k):
+        if j != best:
+            temp += (ratio[j]/std_dev[j])**2
+    ratio[best] = math.sqrt(temp)*std_dev[best]
+
+    new_ratio = np.zeros(k)
+    for i in range(k):
+        new_ratio[i] = ratio[i]/ratio.sum() if ratio.sum() > 0 else ratio[i]
+    return new_ratio
+
+
+def reference_starving(k, no_sims, mean, std_dev):
+    """ OCBA_Starving as originally written """
+    total_n = 0
+    for i in range(k):
+        total_n += no_sims[i]
+    previous_n_ratio = no_sims/total_n
+
+    new_n_ratio = reference_ratio(k, mean, std_dev)
+    difference_n_ratio = np.zeros(k)
+    for i in range(k):
+        difference_n_ratio[i] = new_n_ratio[i] - previous_n_ratio[i]
+    return np.where(difference_n_ratio == difference_n_ratio.max())[0][0]
+
+
+def random_designs(rng):
+    k = rng.randint(2, 10)
+    no_sims = rng.randint(1, 50, size=k)
+    mean = rng.choice(np.linspace(0.05, 1.0, 96), size=k, replace=False)
+    std_dev = rng.uniform(0.01, 0.5, size=k)
+    return k, no_sims, mean, std_dev
+
+
+def degenerate_designs(rng):
+    """ means on a coarse grid around 0 (ties, zeros, negatives), some zero spreads """
+    k = rng.randint(2, 10)
+    no_sims = rng.randint(1, 50, size=k)
+    mean = rng.choice([-0.5, 0.0, 0.0, 0.5, 1.0], size=k)
+    if rng.rand() < 0.3:
+        mean = np.zeros(k)
+    std_dev = rng.uniform(0.01, 0.5, size=k)
+    std_dev[rng.rand(k) < 0.2] = 0.0
+    return k, no_sims, mean, std_dev
+
+
+def reference_or_error(function, *args):
+    with np.errstate(all='ignore'):
+        try:
+            return function(*args)
+        except IndexError:
+            # the original argmax over NaN differences finds no index
+            return None
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_calculate_ratio_matches_loops(seed):
+    k, no_sims, mean, std_dev = random_designs(np.random.RandomState(seed))
+    ratio = OCBA().calculate_ratio(k, mean, std_dev)
+    np.testing.assert_allclose(ratio, reference_ratio(k, mean, std_dev), rtol=1e-12, atol=1e-15)
+    assert ratio.sum() == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_starving_matches_loops(seed):
+    k, no_sims, mean, std_dev = random_designs(np.random.RandomState(seed))
+    ocba = OCBA()
+    np.testing.assert_allclose(ocba.previous_ratio(no_sims), no_sims/no_sims.sum())
+    assert ocba.OCBA_Starving(k, no_sims, mean, std_dev) == reference_starving(k, no_sims, mean, std_dev)
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_degenerate_ratio_matches_loops(seed):
+    k, no_sims, mean, std_dev = degenerate_designs(np.random.RandomState(seed))
+    with np.errstate(all='raise'):
+        ratio = OCBA().calculate_ratio(k, mean, std_dev)
+    np.testing.assert_allclose(ratio, reference_or_error(reference_ratio, k, mean, std_dev),
+                               rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_degenerate_starving_matches_loops(seed):
+    k, no_sims, mean, std_dev = degenerate_designs(np.random.RandomState(seed))
+    expected = reference_or_error(reference_starving, k, no_sims, mean, std_dev)
+    if expected is not None:
+        assert OCBA().OCBA_Starving(k, no_sims, mean, std_dev) == expected
+
+
+@pytest.mark.parametrize('mean', [[0.0, 0.0, 0.0], [0.0, -0.2, -0.1], [0.3, 0.3, 0.1, 0.3]])
+def test_ties_keep_the_original_second_best(mean):
+    mean = np.array(mean)
+    k = len(mean)
+    std_dev = np.full(k, 0.2)
+    no_sims = np.arange(1, k + 1)
+    np.testing.assert_allclose(OCBA().calculate_ratio(k, mean, std_dev),
+                               reference_ratio(k, mean, std_dev), rtol=1e-12)
+    assert OCBA().OCBA_Starving(k, no_sims, mean, std_dev) == reference_starving(k, no_sims, mean, std_dev)
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_resolve_degenerate_never_gives_nans(seed):
+    k, no_sims, mean, std_dev = degenerate_designs(np.random.RandomState(seed))
+    with np.errstate(all='raise'):
+        ratio = OCBA(resolve_degenerate=True).calculate_ratio(k, mean, std_dev)
+    assert not np.isnan(ratio).any()
+    assert ratio.sum() == pytest.approx(1.0) or ratio.sum() == 0
@@ -0,0 +1,108 @@
+"""
+Root-parallel search: the merged root statistics are those of the pooled
+roll-outs of the workers. Tree-parallel search over one shared tree: every
+roll-out is backpropagated once along its own path, and no virtual loss is
+left once search() returns.
+"""
+
+import numpy as np
+import pytest
+
+from tictactoe import TicTacToeGameState, TicTacToeBitboardState, TicTacToeMove
+from node import StateNode
+from tree_policy import TreePolicy_UCB, TreePolicy_OCBA
+from parallel import RootParallelSearch, TreeParallelSearch, merge_action_statistics
+
+
+def test_merged_statistics_are_those_of_the_pooled_samples():
+    rng = np.random.RandomState(0)
+    samples = {move_id: rng.random_sample(rng.randint(1, 40)) for move_id in range(5)}
+    workers = [{}, {}, {}]
+    for move_id, values in samples.items():
+        for worker, part in zip(workers, np.array_split(values, 3)):
+            if len(part):
+                worker[move_id] = (len(part), part.mean(), ((part - part.mean())**2).sum())
+    workers[0][7] = (0, 0.0, 0.0)
+
+    merged = merge_action_statistics(workers)
+    assert sorted(merged) == sorted(samples)
+    for move_id, values in samples.items():
+        n, mean, m2 = merged[move_id]
+        assert n == len(values)
+        assert np.isclose(mean, values.mean()) and np.isclose(m2, values.var()*len(values))
+
+
+def test_root_parallel_search():
+    root_env_state = TicTacToeBitboardState().move(TicTacToeMove(0, 0, 1))
+    with RootParallelSearch(root_env_state, TreePolicy_UCB(), n_workers=3) as search:
+        df = search.search(401, seed=5)
+        assert df['N'].sum() == 401
+        assert list(df.index) == [1, 2, 3, 4, 5, 6, 7, 8]
+        assert search.best_action() == df['Q'].idxmax()
+        assert df.equals(search.search(401, seed=5))
+
+        # after X replied in the centre and O played a corner
+        next_state = root_env_state.move(TicTacToeMove(1, 1, -1)).move(TicTacToeMove(2, 2, 1))
+        df = search.search(200, seed=5, root_env_state=next_state)
+        assert df['N'].sum() == 200 and list(df.index) == [1, 2, 3, 5, 6, 7]
+
+
+def test_root_parallel_search_with_symmetry():
+    with RootParallelSearch(TicTacToeBitboardState(), TreePolicy_UCB(), n_workers=2,
+                            use_symmetry=True) as search:
+        df = search.search(300, seed=0)
+    assert list(df.index) == list(range(9))
+    # corners, edges and the centre each share their statistics
+    assert df.loc[[0, 2, 6, 8], 'N'].nunique() == df.loc[[1, 3, 5, 7], 'N'].nunique() == 1
+    assert df.loc[[0, 1, 4], 'N'].sum() == 300
+
+
+def tree_nodes(root):
+    stack, seen = [root], set()
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        yield node
+        for action in node.actions:
+            yield action
+            stack.extend(action.next_state_nodes.values())
+
+
+def check_statistics(root):
+    for node in tree_nodes(root):
+        if hasattr(node, 'virtual_visits'):
+            assert node.virtual_visits == 0
+        elif node.actions:
+            ns, means, stddevs = node.child_statistics()
+            assert list(ns) == [action.n for action in node.actions]
+            assert np.allclose(means, [action.q_value_mean for action in node.actions])
+            assert np.all((means >= 0) & (means <= 1))
+
+
+@pytest.mark.parametrize('policy_class', [TreePolicy_UCB, TreePolicy_OCBA])
+@pytest.mark.parametrize('state_class', [TicTacToeGameState, TicTacToeBitboardState])
+def test_root_visits_are_counted_once(policy_class, state_class):
+    np.random.seed(0)
+    root_env_state = state_class(np.zeros((3, 3)), 1) if state_class is TicTacToeGameState else state_class()
+    with TreeParallelSearch(StateNode(root_env_state), policy_class(), n_workers=2,
+                            leaves_per_worker=4) as search:
+        search.search(300)
+        root = search.root_state
+        assert root.n == 300
+        assert sum(action.n for action in root.actions) == 300
+        check_statistics(root)
+
+        search.search(100)
+        assert root.n == 400
+        check_statistics(root)
+
+
+def test_batched_rollouts_per_leaf():
+    np.random.seed(0)
+    root_env_state = TicTacToeBitboardState().move(TicTacToeMove(0, 0, 1))
+    with TreeParallelSearch(StateNode(root_env_state), TreePolicy_UCB(), n_workers=2) as search:
+        search.search(400, rollouts_per_leaf=4)
+        assert search.root_state.n == search.rollouts == 400
+        check_statistics(search.root_state)
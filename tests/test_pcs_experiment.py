@@ -0,0 +1,138 @@
+"""
+PCS experiment runner: an interrupted run leaves a partial last line in the
+result store, which is dropped so that a resumed run appends clean lines.
+The sequential-stopping mode stops every (policy, N) cell once its
+confidence interval is narrow enough, and shares the store of fixed runs.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from pcs_experiment import (ResultStore, AdaptiveScheduler, run_experiment, run_adaptive_experiment,
+                            wilson_interval)
+
+CONFIG = {'opening': [0], 'seed': 0}
+
+
+def rows(repetitions):
+    return [{'policy': 'ucb', 'repetition': r, 'n': 300, 'best_action': 4} for r in repetitions]
+
+
+def test_partial_last_line_is_dropped(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    ResultStore(str(path), CONFIG).append(rows([0, 1]))
+    with open(path, 'a') as f:
+        f.write(json.dumps(rows([2])[0])[:20])
+
+    store = ResultStore(str(path), CONFIG)
+    assert store.rows == rows([0, 1])
+    store.append(rows([2]))
+    assert ResultStore(str(path), CONFIG).rows == rows([0, 1, 2])
+    assert all(json.loads(line) for line in path.read_text().splitlines())
+
+
+def test_partial_config_line_starts_over(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    path.write_text(json.dumps({'config': CONFIG})[:10])
+    store = ResultStore(str(path), CONFIG)
+    assert store.rows == []
+    assert json.loads(path.read_text()) == {'config': CONFIG}
+
+
+def test_other_config_is_refused(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    ResultStore(str(path), CONFIG)
+    with pytest.raises(ValueError):
+        ResultStore(str(path), {'opening': [0], 'seed': 1})
+
+
+def test_resume_after_truncated_write(tmp_path):
+    budgets = [20, 40]
+    path = tmp_path / 'results.jsonl'
+    expected = run_experiment(str(tmp_path / 'reference.jsonl'), budgets=budgets, repetitions=4,
+                              n_workers=1, verbose=False)
+
+    run_experiment(str(path), budgets=budgets, repetitions=4, n_workers=1, verbose=False)
+    lines = path.read_text().splitlines(keepends=True)
+    # the run stopped while writing the last line, the unit is redone
+    path.write_text(''.join(lines[:-1]) + lines[-1][:15])
+    resumed = run_experiment(str(path), budgets=budgets, repetitions=4, n_workers=1, verbose=False)
+
+    assert resumed.equals(expected)
+    stored = [json.loads(line) for line in path.read_text().splitlines()[1:]]
+    units = [(row['policy'], row['repetition'], row['n']) for row in stored]
+    assert len(units) == len(set(units)) == 2 * 4 * len(budgets)
+
+
+def test_wilson_interval():
+    lower, upper = wilson_interval(8, 10)
+    assert np.isclose(lower, 0.4902, atol=1e-4) and np.isclose(upper, 0.9433, atol=1e-4)
+    lower, upper = wilson_interval(0, 50)
+    assert lower == 0 and 0 < upper < 0.08
+
+
+def scheduler_rows(scheduler, task, correct):
+    policy, repetition, budgets = task
+    return [{'policy': policy, 'repetition': repetition, 'n': n, 'best_action': 4 if correct else 0}
+            for n in budgets]
+
+
+def test_scheduler_stops_cells_at_the_target_width():
+    scheduler = AdaptiveScheduler(['ucb'], [300, 400], best_move=4, target_half_width=0.1,
+                                  min_repetitions=10, max_repetitions=1000, confidence=0.95)
+    # every search finds the best move, the interval narrows quickly
+    while True:
+        task = scheduler.next_task()
+        if task is None:
+            break
+        for row in scheduler_rows(scheduler, task, True):
+            scheduler.record(row)
+    for cell in scheduler.cells:
+        trials = len(scheduler.correct[cell])
+        assert trials >= 10 and scheduler.half_width(cell, pending=False) <= 0.1
+        # one repetition less would still have been too wide
+        lower, upper = wilson_interval(trials - 1, trials - 1)
+        assert (upper - lower)/2 > 0.1 or trials == 10
+
+
+def test_scheduler_caps_the_repetitions_and_counts_pending_searches():
+    scheduler = AdaptiveScheduler(['ucb', 'ocba'], [300], best_move=4, target_half_width=0.01,
+                                  min_repetitions=2, max_repetitions=6, confidence=0.95)
+    tasks = []
+    while True:
+        task = scheduler.next_task()
+        if task is None:
+            break
+        tasks.append(task)
+    # nothing recorded yet, the pending searches fill both cells to the cap
+    assert sorted((policy, repetition) for policy, repetition, _ in tasks) == \
+        sorted((policy, r) for policy in ('ucb', 'ocba') for r in range(6))
+    for i, task in enumerate(tasks):
+        for row in scheduler_rows(scheduler, task, i % 2):
+            scheduler.record(row)
+    assert scheduler.next_task() is None
+    assert all(len(scheduler.correct[cell]) == 6 for cell in scheduler.cells)
+
+
+def test_adaptive_run_resumes_and_shares_the_fixed_seeds(tmp_path):
+    budgets = [20, 40]
+    path = str(tmp_path / 'results.jsonl')
+    pcs = run_adaptive_experiment(path, budgets=budgets, target_half_width=0.25, min_repetitions=4,
+                                  max_repetitions=12, n_workers=1, verbose=False)
+    for (policy, n), row in pcs.iterrows():
+        assert 4 <= row['repetitions'] <= 12
+        assert (row['upper'] - row['lower'])/2 <= 0.25 or row['repetitions'] == 12
+
+    lines = open(path).read()
+    assert run_adaptive_experiment(path, budgets=budgets, target_half_width=0.25, min_repetitions=4,
+                                   max_repetitions=12, n_workers=1, verbose=False).equals(pcs)
+    assert open(path).read() == lines
+
+    # the fixed mode finds the same results for the same repetitions
+    adaptive = ResultStore(path, CONFIG).dataframe().set_index(['policy', 'repetition', 'n'])
+    fixed_path = str(tmp_path / 'fixed.jsonl')
+    run_experiment(fixed_path, budgets=budgets, repetitions=4, n_workers=1, verbose=False)
+    fixed = ResultStore(fixed_path, CONFIG).dataframe().set_index(['policy', 'repetition', 'n'])
+    assert fixed['best_action'].equals(adaptive.loc[fixed.index, 'best_action'])
@@ -0,0 +1,80 @@
+"""
+Pondering: the background search only walks through the chosen move, stops
+consistently, and its work is kept by advance() to the opponent's reply.
+"""
+
+import time
+
+import pytest
+
+from tictactoe import TicTacToeBitboardState, TicTacToeMove
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from tree_policy import TreePolicy_UCB, TreePolicy_OCBA
+from transposition import TranspositionTable
+
+
+def new_search(policy_class, table=None):
+    mcts = MonteCarloTreeSearch(StateNode(TicTacToeBitboardState()), policy_class(), table, seed=3)
+    mcts.search(200)
+    action = mcts.best_action()
+    return mcts, action, TicTacToeMove(action.move_id//3, action.move_id % 3, 1)
+
+
+def wait_for_iterations(mcts, n, timeout=10):
+    end = time.monotonic() + timeout
+    while mcts.ponder_iterations < n and time.monotonic() < end:
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize('policy_class', [TreePolicy_UCB, TreePolicy_OCBA])
+def test_pondering_walks_through_the_chosen_move(policy_class):
+    mcts, action, move = new_search(policy_class)
+    others = {a.move_id: a.n for a in mcts.root_state.actions if a is not action}
+    root_visits, action_visits = mcts.root_state.n, action.n
+
+    assert mcts.start_pondering(move) and mcts.pondering
+    with pytest.raises(RuntimeError):
+        mcts.start_pondering(move)
+    wait_for_iterations(mcts, 50)
+    iterations = mcts.stop_pondering()
+    assert not mcts.pondering and iterations >= 50
+    assert mcts.stop_pondering() == 0
+
+    assert action.n == action_visits + iterations
+    assert mcts.root_state.n == root_visits + iterations
+    assert {a.move_id: a.n for a in mcts.root_state.actions if a is not action} == others
+    assert all(a.virtual_visits == 0 for a in mcts.root_state.actions)
+
+
+@pytest.mark.parametrize('use_table', [False, True])
+def test_advance_stops_pondering_and_keeps_its_work(use_table):
+    mcts, action, move = new_search(TreePolicy_OCBA, TranspositionTable() if use_table else None)
+    state = TicTacToeBitboardState().move(move)
+    assert mcts.start_pondering(move)
+    wait_for_iterations(mcts, 200)
+
+    # the reply the pondering searched most
+    reply_node = max(action.next_state_nodes.values(), key=lambda node: node.n)
+    reply = next(m for m in state.get_legal_actions()
+                 if state.move(m).hash_key() == reply_node.env_state.hash_key())
+    root = mcts.advance(move, reply)
+    assert not mcts.pondering
+    assert root is reply_node and root.n > 0
+    visits = root.n
+    mcts.search(100)
+    assert root.n == visits + 100
+
+
+def test_nothing_to_ponder():
+    mcts = MonteCarloTreeSearch(StateNode(TicTacToeBitboardState()), TreePolicy_UCB(), seed=0)
+    # no action was expanded yet
+    assert not mcts.start_pondering(TicTacToeMove(1, 1, 1))
+    assert not mcts.pondering
+
+    # a winning move ends the game
+    state = TicTacToeBitboardState(0b000000011, 0b000011000, 1)
+    mcts = MonteCarloTreeSearch(StateNode(state), TreePolicy_UCB(), seed=0)
+    mcts.search(100)
+    assert not mcts.start_pondering(TicTacToeMove(0, 2, 1))
+    assert mcts.stop_pondering() == 0
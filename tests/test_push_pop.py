@@ -0,0 +1,42 @@
+"""
+The in-place push/pop path of the concrete game states against move().
+"""
+
+import numpy as np
+import pytest
+
+from tictactoe import TicTacToeGameState, TicTacToeBitboardState, TicTacToeMove
+
+
+def new_state(kind):
+    if kind == 'array':
+        return TicTacToeGameState(np.zeros((3, 3)), 1)
+    return TicTacToeBitboardState()
+
+
+def same_position(state, other):
+    return np.array_equal(state.board, other.board) and state.player == other.player
+
+
+@pytest.mark.parametrize('kind', ['array', 'bitboard'])
+@pytest.mark.parametrize('seed', range(10))
+def test_push_follows_move_and_pop_undoes_it(kind, seed):
+    rng = np.random.RandomState(seed)
+    state = new_state(kind)
+    scratch = state.copy()
+    history = [state]
+    while not state.is_game_over():
+        legal = list(scratch.legal_action_indices())
+        assert legal == [a.x_coordinate*3 + a.y_coordinate for a in state.get_legal_actions()]
+        action_index = legal[rng.randint(len(legal))]
+        state = state.move(TicTacToeMove(action_index // 3, action_index % 3, state.player))
+        scratch.push(action_index)
+        history.append(state)
+        assert same_position(scratch, state)
+        assert scratch.game_result == state.game_result
+
+    for previous in reversed(history[:-1]):
+        scratch.pop()
+        assert same_position(scratch, previous)
+    # the scratch copy never touched the original state
+    assert same_position(history[0], new_state(kind))
@@ -0,0 +1,76 @@
+"""
+Per-search random generators: a seed fixes the draws and the search, and
+searches do not disturb each other's streams.
+"""
+
+import numpy as np
+
+from tictactoe import TicTacToeBitboardState, TicTacToeMove
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from tree_policy import TreePolicy_UCB, TreePolicy_OCBA
+from rng import BufferedRandom, search_rng
+
+
+def draws(rng, n=100):
+    return [rng.randint(9) for _ in range(n)] + list(rng.random(5)) + [rng.random() for _ in range(n)]
+
+
+def test_same_seed_same_draws():
+    assert draws(BufferedRandom(3)) == draws(BufferedRandom(3))
+    assert draws(BufferedRandom(3)) != draws(BufferedRandom(4))
+    assert draws(BufferedRandom(np.random.SeedSequence(3))) == draws(BufferedRandom(3))
+
+
+def test_scalar_draws_do_not_depend_on_the_buffer_size():
+    expected = np.random.default_rng(7).random(1000)
+    for buffer_size in (1, 3, 4096):
+        rng = BufferedRandom(7, buffer_size)
+        assert np.array_equal([rng.random() for _ in range(1000)], expected)
+
+
+def test_randint_is_uniform():
+    rng = BufferedRandom(0)
+    counts = np.bincount([rng.randint(7) for _ in range(70000)], minlength=7)
+    assert len(counts) == 7
+    assert np.all(np.abs(counts - 10000) < 500)
+
+
+def test_spawned_streams_are_reproducible_and_distinct():
+    children = BufferedRandom(5).spawn(3)
+    again = BufferedRandom(5).spawn(3)
+    sequences = [draws(child) for child in children]
+    assert sequences == [draws(child) for child in again]
+    assert len({tuple(sequence) for sequence in sequences}) == 3
+
+
+def test_search_rng_follows_np_random_without_a_seed():
+    np.random.seed(1)
+    first = draws(search_rng())
+    np.random.seed(1)
+    assert draws(search_rng()) == first
+    assert draws(search_rng(11)) == draws(BufferedRandom(11))
+
+
+def new_search(policy_class, seed):
+    root_env_state = TicTacToeBitboardState().move(TicTacToeMove(0, 0, 1))
+    return MonteCarloTreeSearch(StateNode(root_env_state), policy_class(), seed=seed)
+
+
+def test_seeded_searches_are_reproducible():
+    for policy_class in (TreePolicy_UCB, TreePolicy_OCBA):
+        expected = new_search(policy_class, 3).search(400)
+        assert expected.equals(new_search(policy_class, 3).search(400))
+        assert not expected.equals(new_search(policy_class, 4).search(400))
+
+
+def test_interleaved_searches_keep_their_own_streams():
+    alone = new_search(TreePolicy_UCB, 3)
+    alone.search(300)
+
+    first, second = new_search(TreePolicy_UCB, 3), new_search(TreePolicy_UCB, 8)
+    for _ in range(3):
+        first.search(100)
+        np.random.random(10)
+        second.search(100)
+    assert first.root_statistics().equals(alone.root_statistics())
@@ -0,0 +1,87 @@
+"""
+D4 canonicalization: the key of a position is the same for its 8 rotations
+and reflections, and only for them; a search with use_symmetry merges the
+symmetric root moves.
+"""
+
+import numpy as np
+import pytest
+
+from tictactoe import TicTacToeGameState, TicTacToeBitboardState, WINNING_MASK, BITBOARD_FULL
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from tree_policy import TreePolicy_UCB
+from symmetry import D4_PERMUTATIONS, canonical_key, canonical_state_key
+
+
+def board_images(board):
+    """ the 8 rotations and reflections of a board, computed with NumPy """
+    images = []
+    for k in range(4):
+        rotated = np.rot90(board, k)
+        images += [rotated, np.fliplr(rotated)]
+    return images
+
+
+def reachable_boards(player):
+    """ (board, side to move) of every position reachable when `player` starts """
+    start = TicTacToeGameState(np.zeros((3, 3)), player)
+    states, seen = [start], {(start.board.tobytes(), player)}
+    for state in states:
+        if state.is_game_over():
+            continue
+        for move in state.get_legal_actions():
+            next_state = state.move(move)
+            key = (next_state.board.tobytes(), next_state.player)
+            if key not in seen:
+                seen.add(key)
+                states.append(next_state)
+    return [(state.board, state.player) for state in states]
+
+
+def test_permutations_are_the_symmetries_of_the_board():
+    assert len(set(D4_PERMUTATIONS)) == 8
+    for perm in D4_PERMUTATIONS:
+        assert sorted(perm) == list(range(9))
+        for q in D4_PERMUTATIONS:
+            assert tuple(perm[q[c]] for c in range(9)) in D4_PERMUTATIONS
+    # every symmetry maps winning lines to winning lines
+    for m in range(BITBOARD_FULL + 1):
+        for perm in D4_PERMUTATIONS:
+            image = sum(1 << perm[c] for c in range(9) if m >> c & 1)
+            assert WINNING_MASK[image] == WINNING_MASK[m]
+
+
+@pytest.mark.parametrize('player', [1, -1])
+def test_keys_are_invariant_under_the_8_transforms(player):
+    keys = set()
+    boards = reachable_boards(player)
+    for board, to_move in boards:
+        key = canonical_state_key(TicTacToeGameState(board, to_move))
+        for image in board_images(board):
+            assert canonical_state_key(TicTacToeGameState(image.copy(), to_move)) == key
+            assert canonical_state_key(TicTacToeBitboardState.from_board(image, to_move)) == key
+        keys.add(key)
+    # the 5478 positions of a game fall into 765 classes up to symmetry
+    assert len(boards) == 5478 and len(keys) == 765
+
+
+def test_side_to_move_is_part_of_the_key():
+    board = np.zeros((3, 3))
+    board[0, 0] = 1
+    o_mask = 1
+    assert canonical_key(o_mask, 0, 1) != canonical_key(o_mask, 0, -1)
+    assert canonical_state_key(TicTacToeGameState(board, -1)) == canonical_key(o_mask, 0, -1)
+
+
+def test_search_merges_symmetric_root_moves():
+    np.random.seed(0)
+    root = StateNode(TicTacToeBitboardState(), use_symmetry=True)
+    mcts = MonteCarloTreeSearch(root, TreePolicy_UCB())
+    df = mcts.search(300)
+
+    assert sorted(sorted(action.move_ids) for action in root.actions) == [[0, 2, 6, 8], [1, 3, 5, 7], [4]]
+    assert root.n == sum(action.n for action in root.actions) == 300
+    assert sorted(df.index) == list(range(9))
+    for action in root.actions:
+        assert all(df.loc[move_id, 'N'] == action.n for move_id in action.move_ids)
@@ -0,0 +1,97 @@
+"""
+The transition table against the array game state: every reachable position
+has the same side to move, result, legal moves and successors.
+"""
+
+import numpy as np
+import pytest
+
+from tictactoe import TicTacToeGameState, TicTacToeMove
+from table_engine import TicTacToeTable, NO_STATE
+
+
+@pytest.fixture(scope='module')
+def table():
+    return TicTacToeTable.build()
+
+
+def reachable_states():
+    """ every position reachable from the empty board, with either player first """
+    states = [TicTacToeGameState(np.zeros((3, 3)), player) for player in (1, -1)]
+    seen = {(state.board.tobytes(), state.player) for state in states}
+    head = 0
+    while head < len(states):
+        state = states[head]
+        head += 1
+        if state.is_game_over():
+            continue
+        for move in state.get_legal_actions():
+            next_state = state.move(move)
+            key = (next_state.board.tobytes(), next_state.player)
+            if key not in seen:
+                seen.add(key)
+                states.append(next_state)
+    return states
+
+
+def cells(moves):
+    return sorted(move.x_coordinate*3 + move.y_coordinate for move in moves)
+
+
+def test_table_matches_the_game_state(table):
+    states = reachable_states()
+    assert table.n_states == len(states)
+
+    ids = set()
+    for state in states:
+        table_state = table.from_game_state(state)
+        ids.add(table_state.state_id)
+        assert table_state.player == state.player
+        assert table_state.game_result == state.game_result
+        assert table_state.is_game_over() == state.is_game_over()
+        assert np.array_equal(table_state.board, state.board)
+
+        legal = [] if state.is_game_over() else cells(state.get_legal_actions())
+        assert cells(table_state.get_legal_actions()) == legal
+        assert list(table_state.legal_action_indices()) == legal
+        for c in range(9):
+            successor = table.successors[table_state.state_id, c]
+            if c in legal:
+                move = TicTacToeMove(c // 3, c % 3, state.player)
+                assert successor == table.from_game_state(state.move(move)).state_id
+                assert table_state.move(move).state_id == successor
+            else:
+                assert successor == NO_STATE
+    assert ids == set(range(table.n_states))
+
+
+def test_push_and_pop_follow_the_successors(table):
+    rng = np.random.RandomState(0)
+    for _ in range(50):
+        state = table.from_game_state(TicTacToeGameState(np.zeros((3, 3)), 1))
+        visited = [state.state_id]
+        while not state.is_game_over():
+            c = rng.choice(state.legal_action_indices())
+            next_id = table.successors[state.state_id, c]
+            state.push(c)
+            assert state.state_id == next_id
+            visited.append(next_id)
+        while len(visited) > 1:
+            state.pop()
+            visited.pop()
+            assert state.state_id == visited[-1]
+
+
+def test_unreachable_positions_are_refused(table):
+    with pytest.raises(ValueError):
+        # X moved twice while O has not moved
+        table.state_id(0, 0b11, 1)
+
+
+def test_saved_table_loads_memory_mapped(table, tmp_path):
+    cache_dir = str(tmp_path / 'table')
+    table.save(cache_dir)
+    loaded = TicTacToeTable.load(cache_dir)
+    for name in TicTacToeTable.array_names:
+        assert np.array_equal(getattr(loaded, name), getattr(table, name))
+    assert not loaded.successors.flags.writeable
@@ -0,0 +1,83 @@
+"""
+TranspositionTable lookups and eviction, and the path backpropagation that
+keeps the statistics of a node shared by several parents right.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from tictactoe import TicTacToeBitboardState
+from node import StateNode
+from mcts import MonteCarloTreeSearch
+from tree_policy import TreePolicy_UCB
+from transposition import TranspositionTable
+
+
+def visited(n):
+    return SimpleNamespace(n=n)
+
+
+def test_hits_and_misses():
+    table = TranspositionTable()
+    node = visited(1)
+    assert table.get('a') is None
+    table.put('a', node)
+    assert table.get('a') is node
+    assert table.get('b') is None
+    assert (table.hits, table.misses) == (1, 2)
+    assert table.hit_rate == 1/3
+    assert 'a' in table and len(table) == 1
+
+
+def test_lru_eviction_keeps_recently_used_nodes():
+    table = TranspositionTable(max_shared=2)
+    table.put('a', visited(1))
+    table.put('b', visited(1))
+    table.get('a')
+    table.put('c', visited(1))
+    assert 'a' in table and 'c' in table and 'b' not in table
+    assert table.evictions == 1
+
+
+def test_low_visit_eviction_among_least_recently_used():
+    table = TranspositionTable(max_shared=3, eviction='low_visit', eviction_sample=2)
+    table.put('a', visited(5))
+    table.put('b', visited(9))
+    table.put('c', visited(1))
+    table.put('d', visited(7))
+    # 'c' has the fewest visits but is not among the 2 least recently used
+    assert 'a' not in table
+    assert list(table.nodes) == ['b', 'c', 'd']
+
+
+def test_evicted_nodes_stay_in_the_tree():
+    np.random.seed(0)
+    table = TranspositionTable(max_shared=4)
+    mcts = MonteCarloTreeSearch(StateNode(TicTacToeBitboardState()), TreePolicy_UCB(), table)
+    mcts.search(300)
+    assert len(table) == 4 and table.evictions > 0
+    assert mcts.root_state.n == 300
+    assert sum(action.n for action in mcts.root_state.actions) == 300
+
+
+def test_backpropagation_follows_the_path_through_shared_nodes():
+    np.random.seed(0)
+    table = TranspositionTable()
+    mcts = MonteCarloTreeSearch(StateNode(TicTacToeBitboardState()), TreePolicy_UCB(), table)
+    for _ in range(5000):
+        leaf = mcts.tree_walk()
+        path = list(mcts.path)
+        shared = [i for i in range(2, len(path), 2) if path[i].prev_node is not path[i - 1]]
+        if shared:
+            break
+        mcts.backpropagate(leaf.rollout())
+    assert shared and table.hits > 0
+
+    # the parent that created the shared node is not on this path
+    creator = path[shared[0]].prev_node
+    creator_visits = creator.n
+    visits = [node.n for node in path]
+    mcts.backpropagate(leaf.rollout())
+    assert [node.n for node in path] == [n + 1 for n in visits]
+    assert creator.n == creator_visits
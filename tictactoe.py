@@ -75,6 +75,47 @@ class TwoPlayersAbstractGameState(ABC):
         """
         pass
 
+    # Optional mutable rollout path. Games that set `supports_push_pop` let
+    # rollouts play on a single scratch copy with push/pop instead of
+    # allocating one state object per ply through `move`; they implement
+    # copy, legal_action_indices, push and pop.
+    supports_push_pop = False
+
+    def copy(self):
+        """
+        returns an independent scratch copy of the state that can be
+        modified in place with `push` and `pop`
+        """
+        raise NotImplementedError
+
+    def legal_action_indices(self):
+        """
+        returns a sequence of integer action indices legal at the current
+        game state, suitable for `push`
+        """
+        raise NotImplementedError
+
+    def legal_action_mask(self):
+        """
+        returns an integer bitmask with bit i set if action index i is legal
+        """
+        mask = 0
+        for action_index in self.legal_action_indices():
+            mask |= 1 << int(action_index)
+        return mask
+
+    def push(self, action_index):
+        """
+        applies the action with the given index in place
+        """
+        raise NotImplementedError
+
+    def pop(self):
+        """
+        undoes the last action applied with `push`
+        """
+        raise NotImplementedError
+
 
 class TicTacToeGameState(TwoPlayersAbstractGameState):
 
@@ -88,6 +129,8 @@ class TicTacToeGameState(TwoPlayersAbstractGameState):
         self.first_player_o = 1
         self.second_player_x = -1
 
+        self._history = []
+
 
     def __repr__(self):
         ret_string = self.draw_board()
@@ -172,6 +215,34 @@ class TicTacToeGameState(TwoPlayersAbstractGameState):
             for coords in list(zip(indices[0], indices[1]))
         ]
 
+    def hash_key(self):
+        """
+        exact integer key of the position and the side to move, whatever the
+        dtype of the board; on the 3x3 board it is the bitboard_key of the 
+        position, as for TicTacToeBitboardState
+        """
+        cells = self.board.size
+        o_mask, x_mask = state_bitboards(self)
+        return o_mask | (x_mask << cells) | ((self.player == 1) << (2*cells))
+
+    supports_push_pop = True
+
+    def copy(self):
+        return TicTacToeGameState(np.copy(self.board), self.player)
+
+    def legal_action_indices(self):
+        return np.flatnonzero(self.board == 0)
+
+    def push(self, action_index):
+        self.board[action_index // self.board_size, action_index % self.board_size] = self.player
+        self._history.append(action_index)
+        self.player = -self.player
+
+    def pop(self):
+        action_index = self._history.pop()
+        self.board[action_index // self.board_size, action_index % self.board_size] = 0
+        self.player = -self.player
+
     def draw_board(self):
         board_string = ''
         for i in range(self.board.shape[0]):
@@ -227,3 +298,161 @@ class TicTacToeGameState(TwoPlayersAbstractGameState):
 
         print()
         print()
+
+
+# Bitboard helpers for the 3x3 board. Cell ``c`` is bit ``c`` of a mask and
+# corresponds to board coordinates ``(c // 3, c % 3)``, i.e. to ``move_id``.
+BITBOARD_SIZE = 3
+BITBOARD_CELLS = BITBOARD_SIZE * BITBOARD_SIZE
+BITBOARD_FULL = (1 << BITBOARD_CELLS) - 1
+
+LINE_MASKS = tuple(
+    [sum(1 << (r * 3 + c) for c in range(3)) for r in range(3)] +
+    [sum(1 << (r * 3 + c) for r in range(3)) for c in range(3)] +
+    [sum(1 << (i * 3 + i) for i in range(3)),
+     sum(1 << (i * 3 + 2 - i) for i in range(3))]
+)
+
+# WINNING_MASK[m] is True when mask ``m`` contains a complete line
+WINNING_MASK = tuple(
+    any(m & line == line for line in LINE_MASKS) for m in range(BITBOARD_FULL + 1)
+)
+
+# MASK_CELLS[m] lists the cell indices set in mask ``m``, in increasing order
+MASK_CELLS = tuple(
+    tuple(c for c in range(BITBOARD_CELLS) if m >> c & 1) for m in range(BITBOARD_FULL + 1)
+)
+
+
+def bitboard_key(o_mask, x_mask, player):
+    """
+    packs a bitboard position and the side to move into a single integer
+    smaller than 2**19
+    """
+    return o_mask | (x_mask << BITBOARD_CELLS) | ((player == 1) << (2*BITBOARD_CELLS))
+
+
+def state_bitboards(env_state):
+    """ Returns (o_mask, x_mask) for any 3x3 TicTacToeGameState. """
+    if hasattr(env_state, 'o_mask'):
+        return env_state.o_mask, env_state.x_mask
+
+    o_mask = 0
+    x_mask = 0
+    for c, value in enumerate(np.asarray(env_state.board).flatten()):
+        if value == env_state.first_player_o:
+            o_mask |= 1 << c
+        elif value == env_state.second_player_x:
+            x_mask |= 1 << c
+    return o_mask, x_mask
+
+
+class TicTacToeBitboardState(TicTacToeGameState):
+    """
+    Drop-in replacement for TicTacToeGameState on the 3x3 board that keeps
+    one integer bitmask per player instead of a NumPy array. ``game_result``
+    is resolved with table lookups against precomputed line masks.
+    """
+
+    def __init__(self, o_mask=0, x_mask=0, player=1):
+        self.o_mask = o_mask
+        self.x_mask = x_mask
+        self.board_size = BITBOARD_SIZE
+        self.player = player
+
+        self.first_player_o = 1
+        self.second_player_x = -1
+
+        self._history = []
+
+    @classmethod
+    def from_board(cls, board, player=1):
+        o_mask = 0
+        x_mask = 0
+        for c, value in enumerate(np.asarray(board).flatten()):
+            if value == 1:
+                o_mask |= 1 << c
+            elif value == -1:
+                x_mask |= 1 << c
+        return cls(o_mask, x_mask, player)
+
+    @classmethod
+    def from_game_state(cls, state):
+        return cls.from_board(state.board, state.player)
+
+    @property
+    def board(self):
+        board = np.zeros((BITBOARD_SIZE, BITBOARD_SIZE))
+        for c in MASK_CELLS[self.o_mask]:
+            board[c // 3, c % 3] = self.first_player_o
+        for c in MASK_CELLS[self.x_mask]:
+            board[c // 3, c % 3] = self.second_player_x
+        return board
+
+    @property
+    def game_result(self):
+        if WINNING_MASK[self.o_mask]:
+            return self.first_player_o
+        if WINNING_MASK[self.x_mask]:
+            return self.second_player_x
+        if (self.o_mask | self.x_mask) == BITBOARD_FULL:
+            return 0
+        return None
+
+    def is_game_over(self):
+        return self.game_result is not None
+
+    def is_move_legal(self, move):
+        if move.value != self.player:
+            return False
+        if not (0 <= move.x_coordinate < 3 and 0 <= move.y_coordinate < 3):
+            return False
+        return not (self.o_mask | self.x_mask) >> (move.x_coordinate*3 + move.y_coordinate) & 1
+
+    def move(self, move):
+        if not self.is_move_legal(move):
+            raise ValueError(
+                "move {0} on board {1} is not legal". format(move, self.board)
+            )
+        bit = 1 << (move.x_coordinate*3 + move.y_coordinate)
+        if self.player == self.first_player_o:
+            return TicTacToeBitboardState(self.o_mask | bit, self.x_mask, self.second_player_x)
+        return TicTacToeBitboardState(self.o_mask, self.x_mask | bit, self.first_player_o)
+
+    def get_legal_actions(self):
+        empty = ~(self.o_mask | self.x_mask) & BITBOARD_FULL
+        return [
+            TicTacToeMove(c // 3, c % 3, self.player)
+            for c in MASK_CELLS[empty]
+        ]
+
+    def hash_key(self):
+        return bitboard_key(self.o_mask, self.x_mask, self.player)
+
+    def copy(self):
+        return TicTacToeBitboardState(self.o_mask, self.x_mask, self.player)
+
+    def legal_action_indices(self):
+        return MASK_CELLS[~(self.o_mask | self.x_mask) & BITBOARD_FULL]
+
+    def legal_action_mask(self):
+        return ~(self.o_mask | self.x_mask) & BITBOARD_FULL
+
+    def push(self, action_index):
+        bit = 1 << action_index
+        if self.player == self.first_player_o:
+            self.o_mask |= bit
+            self.player = self.second_player_x
+        else:
+            self.x_mask |= bit
+            self.player = self.first_player_o
+        self._history.append(bit)
+
+    def pop(self):
+        bit = self._history.pop()
+        if self.player == self.first_player_o:
+            self.x_mask &= ~bit
+            self.player = self.second_player_x
+        else:
+            self.o_mask &= ~bit
+            self.player = self.first_player_o
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Transposition table for sharing StateNodes between tree paths that reach the
+same position through different move orders.
+
+The table only decides which nodes can be shared. The tree keeps every node
+it created under its parents, so evicting a node stops later paths from 
+finding it but does not free it: max_shared bounds sharing, not memory.
+"""
+
+from collections import OrderedDict
+
+
+class TranspositionTable():
+
+    def __init__(self, max_shared=None, eviction='lru', eviction_sample=16):
+        """
+        Parameters
+        ----------
+        max_shared      : maximum number of nodes the table offers for 
+                          sharing, None for no limit
+        eviction        : 'lru' evicts the least recently used node,
+                          'low_visit' evicts the least visited node among the 
+                          `eviction_sample` least recently used ones
+        eviction_sample : number of candidates considered by 'low_visit'
+        """
+        if eviction not in ('lru', 'low_visit'):
+            raise ValueError("unknown eviction policy {0}".format(eviction))
+        self.max_shared = max_shared
+        self.eviction = eviction
+        self.eviction_sample = eviction_sample
+
+        self.nodes = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, key):
+        return key in self.nodes
+
+    def get(self, key):
+        node = self.nodes.get(key)
+        if node is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.nodes.move_to_end(key)
+        return node
+
+    def put(self, key, node):
+        self.nodes[key] = node
+        self.nodes.move_to_end(key)
+        if self.max_shared is not None:
+            while len(self.nodes) > self.max_shared:
+                self.evict()
+
+    def evict(self):
+        """ Forgets one node, which stays in the tree but is no longer shared """
+        if self.eviction == 'lru':
+            self.nodes.popitem(last=False)
+        else:
+            candidates = []
+            for key, node in self.nodes.items():
+                candidates.append((node.n, key))
+                if len(candidates) == self.eviction_sample:
+                    break
+            del self.nodes[min(candidates, key=lambda c: c[0])[1]]
+        self.evictions += 1
+
+    def clear(self):
+        self.nodes.clear()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def stats(self):
+        return {'size': len(self.nodes), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hit_rate}
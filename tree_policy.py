@@ -7,8 +7,9 @@ Created on Tue Feb 23 09:58:23 2021
 """
 
 import numpy as np
-import random
-import math
+import weakref
+
+from collections import deque
 
 from abc import ABC, abstractmethod
 
@@ -33,7 +34,19 @@ class TreePolicy(ABC):
         self.name = "none"
 
     @abstractmethod
-    def select(self, current_state):
+    def select(self, current_state, rng=np.random):
+        """
+        Selects a child state-action node of an expanded state node, `rng` 
+        is the random generator of the search
+        """
+        pass
+
+    @abstractmethod
+    def select_from_stats(self, n_parent, ns, q_value_means, q_value_stddevs, rng=np.random):
+        """
+        Selects a child from arrays with the visit count, mean and standard
+        deviation of every child, returns its position in those arrays
+        """
         pass
         
     def set_pcs(self, pcs):
@@ -53,8 +66,14 @@ class TreePolicy_Random(TreePolicy):
         self.name = "random"
         self.color = 'yellow'
 
-    def select_sample(self, bayesbelief):
-        sample_index = random.randrange(0, bayesbelief.n_designs, 1)
+    def select(self, current_state, rng=np.random):
+        return current_state.actions[rng.randint(len(current_state.actions))]
+
+    def select_from_stats(self, n_parent, ns, q_value_means, q_value_stddevs, rng=np.random):
+        return rng.randint(len(ns))
+
+    def select_sample(self, bayesbelief, rng=np.random):
+        sample_index = rng.randint(bayesbelief.n_designs)
 
         return sample_index
   
@@ -70,19 +89,76 @@ class TreePolicy_OCBA(TreePolicy):
         
         self.ocba = OCBA()
         self.color = 'red'
+        
+        self.n_solver_calls = 0
+
+    def action_statistics(self, current_state):
+        ns, q_value_means, q_value_stddevs = current_state.child_statistics()
+        q_value_stddevs = np.sqrt(q_value_stddevs**2 + 10/ns)
+        
+        return ns, q_value_means, q_value_stddevs
 
-    def select(self, current_state): 
-        q_value_means = np.array([ actions.q_value_mean  for actions in current_state.actions ])
-        q_value_stddevs = np.array([ math.sqrt(actions.q_value_stddev**2 + 10/actions.n)  for actions in current_state.actions ])
-        ns = np.array([ actions.n  for actions in current_state.actions ])
+    def select(self, current_state, rng=np.random): 
+        ns, q_value_means, q_value_stddevs = self.action_statistics(current_state)
 
         n_actions = len(ns)
         
         # Identify most starving item
+        self.n_solver_calls += 1
         starving_index = self.ocba.OCBA_Starving(n_actions, ns, q_value_means, q_value_stddevs)
                 
         return current_state.actions[starving_index]
 
+    def select_from_stats(self, n_parent, ns, q_value_means, q_value_stddevs, rng=np.random):
+        q_value_stddevs = np.sqrt(q_value_stddevs**2 + 10/ns)
+        return self.ocba.OCBA_Starving(len(ns), ns, q_value_means, q_value_stddevs)
+
+# ############################################################################################
+#   BATCH OCBA
+# ############################################################################################
+class TreePolicy_OCBA_Batch(TreePolicy_OCBA):
+
+    def __init__(self, delta=10, mean_threshold=0.05):
+        """
+        OCBA tree policy that solves the allocation for a budget increment of
+        `delta` visits at once and hands out the next `delta` selections at a
+        node from that cached plan. The plan is recomputed when it is spent,
+        when the node gained actions, or when a child mean moved by more than
+        `mean_threshold` since the plan was made.
+        """
+        super().__init__()
+        self.name = "ocba_batch"
+        self.color = 'green'
+        
+        self.delta = delta
+        self.mean_threshold = mean_threshold
+        
+        # node -> (remaining selections, child means when planned)
+        self.plans = weakref.WeakKeyDictionary()
+
+    def __getstate__(self):
+        # cached plans refer to nodes of a particular tree, do not ship them
+        state = self.__dict__.copy()
+        del state['plans']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.plans = weakref.WeakKeyDictionary()
+
+    def select(self, current_state, rng=np.random):
+        ns, q_value_means, q_value_stddevs = self.action_statistics(current_state)
+        
+        plan = self.plans.get(current_state)
+        if (plan is None or not plan[0] or len(plan[1]) != len(ns) 
+                or np.abs(q_value_means - plan[1]).max() > self.mean_threshold):
+            self.n_solver_calls += 1
+            selections = self.ocba.OCBA_Plan(len(ns), ns, q_value_means, q_value_stddevs, self.delta)
+            plan = (deque(selections), q_value_means.copy())
+            self.plans[current_state] = plan
+                
+        return current_state.actions[plan[0].popleft()]
+
 # ############################################################################################
 #   UCB
 # ############################################################################################
@@ -94,9 +170,22 @@ class TreePolicy_UCB(TreePolicy):
         self.color = 'blue'
         self.exp_weight = exp_weight
 
-    def select(self, current_state):
-        choices_weights = [
-            possible_action.q_value_mean  + self.exp_weight * np.sqrt((2 * np.log(current_state.n) / possible_action.n))
-            for possible_action in current_state.actions
-        ]
-        return current_state.actions[np.argmax(choices_weights)]
+    def select(self, current_state, rng=np.random):
+        ns, q_value_means, q_value_stddevs = current_state.child_statistics()
+        index = self.select_from_stats(current_state.n, ns, q_value_means, q_value_stddevs)
+        return current_state.actions[index]
+
+    def select_from_stats(self, n_parent, ns, q_value_means, q_value_stddevs, rng=np.random):
+        # ns include the pending (virtual) visits of the children, the parent
+        # count has to include them too or log(n_parent) may be -inf
+        n_parent = max(n_parent, ns.sum())
+        choices_weights = q_value_means + self.exp_weight * np.sqrt(2 * np.log(n_parent) / ns)
+        return int(np.argmax(choices_weights))
+
+
+# tree policies by name, e.g. for the experiment runner and the engine server
+POLICIES = {
+    'ucb': TreePolicy_UCB,
+    'ocba': TreePolicy_OCBA,
+    'ocba_batch': TreePolicy_OCBA_Batch,
+}